@@ -0,0 +1,1087 @@
+#!/usr/bin/env python3
+# Batch console shared by every tmux pane started from launch.sh. Which
+# scanners a console drives comes from topology.json ("console" field), so the
+# fleet can grow past 8 scanners / 2 consoles without copying this file.
+#
+# Usage:
+#   python3 batchconsole.py CONSOLE_NUM [--profile NAME] [--line] ["COLOR '{QR}'COLOR '{QR}'..."]
+#
+# A single job can pick its own scan profile with COLOR:profile '{QR}' (see profiles.py).
+# At a terminal each scanner starts as soon as its COLOR 'QR' pair has been
+# scanned, and a blank line ends the batch; --line (or piped input) reads
+# whole lines and starts the batch on Enter as before.
+
+import hashlib
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+import time
+import os
+import re
+import fcntl
+import termios
+import threading
+
+import catalog
+import durations
+import journal
+import profiles
+import receive
+import recovery
+import sanebackend
+import storage
+import topology
+import tune
+import vms
+import watchdog
+
+try:
+    import preview  # needs numpy + Pillow; previews are skipped without them
+except ImportError:
+    preview = None
+
+try:
+    import scanqc  # needs numpy; QC is skipped without it
+except ImportError:
+    scanqc = None
+
+LOCK_FILE = "/tmp/seedscan_batch.lock"
+CLEANER = Path(__file__).resolve().with_name("cleaner.sh")
+SCAN_TIMEOUT_EXIT = 124       # scan.py gave up on a hung scanimage itself
+DISCOVERY_TIMEOUT_EXIT = 125  # scan.py gave up before the scan (scanimage -L hung, pre-arm stuck)
+
+# -------- Fleet (from topology.json) --------
+TOPO = topology.load()
+SCANNERS = topology.by_num(TOPO)
+VM_IPS = topology.vm_ips(TOPO)
+VM_Colors = topology.vm_colors(TOPO)
+
+# -------- Scan profiles (from profiles.json) --------
+PROFILES = profiles.load()
+MANIFEST = profiles.Manifest()   # qr -> profile, re-read when manifest.csv changes
+
+# -------- Output directory (staging tier, see storage.py) --------
+DEST_DIR = storage.day_dir(datetime.now().strftime("%Y-%m-%d"))
+DEST_DIR.mkdir(parents=True, exist_ok=True)
+
+# -------- Disk space on the staging filesystem --------
+STORAGE = storage.load()
+SPACE = storage.SpaceReservations(DEST_DIR, int(STORAGE["min_free_gb"] * 1e9))
+SPACE_WAIT = 600   # seconds a job waits for the archive mover to free space
+SPACE_POLL = 10
+RECEIVE = receive.settings(STORAGE)
+
+# -------- Scanner VMs, booted on first use (see vms.py) --------
+VMS = vms.VmKeeper(TOPO)
+
+# -------- Helpers --------
+def validate_qr_string(qr: str) -> bool:
+    """QR must be one or more well-formed {...} chunks, no stray braces."""
+    return bool(re.fullmatch(r"(\{[^{}]+\})+", qr))
+
+def sanitize_filename(qr: str) -> str:
+    """Make remote-safe filename (avoid braces, spaces)."""
+    return qr.replace("{", "AAA").replace("}", "BBB").replace(" ", "_")
+
+def local_filename(qr: str) -> str:
+    """Keep the original content, just replace spaces."""
+    return qr.replace(" ", "_")
+
+def parse_scanned_input(raw: str, colors, allow_legacy: bool):
+    """
+    Accept either:
+      A) COLOR 'QR' COLOR 'QR' ...   (optionally COLOR:profile 'QR')
+         e.g., BLUE '{...}'ORANGE:gray600 '{...}'
+      B) Legacy ''-separated QR-only (only if the console allows it)
+         e.g., '{...}''{...}'
+    `colors` are the canonical color names this console drives.
+    Returns (qr_codes: list[str], scanned_colors: list[str], scanned_profiles: list[str | None])
+    """
+    canon = {c.upper(): c for c in colors}
+    pattern = "(" + "|".join(re.escape(c) for c in canon) + r")(?::([\w-]+))?\s*'([^']+)'"
+    triples = re.findall(pattern, raw, flags=re.IGNORECASE)
+    if triples:
+        scanned_colors = [canon[c.upper()] for c, _, _ in triples]
+        scanned_profiles = [p or None for _, p, _ in triples]
+        qr_codes = [q for _, _, q in triples]
+        return qr_codes, scanned_colors, scanned_profiles
+
+    if not allow_legacy:
+        raise ValueError(f"Input must use this console's colors ({', '.join(canon)}) in the form: COLOR '{{QR}}'. Legacy mode is disabled.")
+
+    # Fallback: legacy QR-only input split by ''
+    qr_codes = [qr.strip("\"'") for qr in raw.split("''") if qr.strip()]
+    return qr_codes, [], [None] * len(qr_codes)
+
+class PairTokenizer:
+    """
+    Incremental reader for [!]COLOR[:profile] 'QR' pairs as they are typed or
+    scanned, one character at a time. feed() returns the events the new text
+    completed: ("pair", color, profile, qr, forced), ("error", message),
+    ("color", color) as soon as a known color has been read (ahead of its QR,
+    for pre-arming) or ("blank",) for an empty line. Enter between a color and its QR is fine
+    (barcode guns often send one after every code); color is None for a bare
+    'QR' when the console allows legacy input.
+    """
+
+    def __init__(self, colors, allow_legacy: bool = False):
+        self.canon = {c.upper(): c for c in colors}
+        self.allow_legacy = allow_legacy
+        self.head = ""          # text before the opening quote
+        self.qr = None          # QR text while inside the quotes
+        self.line_empty = True
+        self.announced = False  # ("color", ...) already sent for this head
+
+    def feed(self, text: str):
+        events = []
+        for ch in text:
+            if ch in ("\x7f", "\b"):
+                if self.qr:
+                    self.qr = self.qr[:-1]
+                elif self.qr is not None:
+                    self.qr = None
+                else:
+                    self.head = self.head[:-1]
+            elif ch == "\r":
+                continue
+            elif self.qr is not None:
+                if ch == "'":
+                    events.append(self._pair())
+                elif ch == "\n":
+                    events.append(("error", f"QR '{self.qr}' has no closing quote, scan it again."))
+                    self.head, self.qr, self.line_empty, self.announced = "", None, True, False
+                else:
+                    self.qr += ch
+            elif ch == "'":
+                events += self._announce()
+                self.qr = ""
+            elif ch == "\n":
+                if self.line_empty and not self.head.strip():
+                    events.append(("blank",))
+                events += self._announce()
+                self.line_empty = True
+            else:
+                if ch.isspace():
+                    events += self._announce()
+                self.head += ch
+                self.line_empty = self.line_empty and ch.isspace()
+        return events
+
+    def _announce(self):
+        m = re.fullmatch(r"\s*!?\s*([A-Za-z]+)(?::[\w-]*)?\s*", self.head)
+        if self.announced or not m or m.group(1).upper() not in self.canon:
+            return []
+        self.announced = True
+        return [("color", self.canon[m.group(1).upper()])]
+
+    def _pair(self):
+        head, qr = self.head, self.qr
+        self.head, self.qr, self.line_empty, self.announced = "", None, False, False
+        m = re.fullmatch(r"\s*(!)?\s*(?:([A-Za-z]+)(?::([\w-]+))?)?\s*", head)
+        if not m:
+            return ("error", f"Could not read '{head.strip()}' in front of '{qr}'.")
+        forced, color, profile = bool(m.group(1)), m.group(2), m.group(3)
+        if color is None:
+            if not self.allow_legacy:
+                return ("error", f"Input must use this console's colors ({', '.join(self.canon)}) in the form: COLOR '{{QR}}'. Legacy mode is disabled.")
+            return ("pair", None, None, qr, forced)
+        if color.upper() not in self.canon:
+            return ("error", f"Unknown color '{color}'.")
+        return ("pair", self.canon[color.upper()], profile, qr, forced)
+
+
+# -------- Core scanning --------
+def run_scan(scanner_num: int, qr_string: str, profile_name: str = None, progress=None):
+    """
+    Scan one sample and bring the file home. `progress`, if given, is called
+    as progress(phase, **info) when the job changes phase (see tui.py).
+    """
+    with VMS.in_use(SCANNERS[scanner_num]):   # no idle shutdown of its VM meanwhile
+        return _run_scan(scanner_num, qr_string, profile_name, progress)
+
+def _run_scan(scanner_num, qr_string, profile_name, progress):
+    report = progress or (lambda phase, **info: None)
+    scanner = SCANNERS[scanner_num]
+    profile = profiles.get(PROFILES, profile_name)
+    region = profiles.resolve_region(profile, SCANNERS[scanner_num]["color"])
+    if profile.get("region") == "tray" and region is None:
+        print(f"[Scanner {SCANNERS[scanner_num]['color']}] Warning: no tray region calibrated (calibrate_tray.py), scanning the full bed.")
+    ip = scanner["ip"]
+    ssh_base = topology.ssh_cmd(TOPO, scanner)
+
+    local_safe = local_filename(qr_string)
+    remote_safe = sanitize_filename(qr_string)
+
+    scanner_color = scanner["color"]
+    scanner_folder = DEST_DIR / scanner_color
+    scanner_folder.mkdir(parents=True, exist_ok=True)
+
+    local_path = scanner_folder / f"{local_safe}.tiff"
+    remote_path = f"/output/{remote_safe}.tiff"
+
+    print(f"[Scanner {scanner_color}] - Starting")
+    job = {
+        "qr": qr_string,
+        "scanner_color": scanner_color,
+        "vm_ip": ip,
+        "path": str(local_path),
+        "started_at": time.time(),
+        "profile": profile["name"],
+    }
+
+    # Journal the job before anything remote happens (crash recovery, see journal.py)
+    expected = profiles.expected_size(profile, region)
+    job["journal_id"] = journal_write(journal.begin, job, remote_path, expected)
+    report("starting", job=job)
+
+    # Reserve room for the finished file before the scanner starts
+    report("space", total=expected)
+    if not wait_for_space(scanner_num, expected, scanner_color):
+        print(f"[Scanner {scanner_color}] Not enough disk space in {DEST_DIR} — job skipped, rescan this sample.")
+        record_job(job, "refused_disk_space")
+        report("failed", outcome="refused_disk_space")
+        return
+
+    # SSH to start scan; scan.py enforces its own discovery and scan deadlines (see watchdog.py)
+    limits = job_deadlines(profile, region, scanner_color)
+    scan_cmd = ssh_base + [
+        f"OUTPUT_FILE='{remote_path}' SCAN_BACKEND={scanner['scan_backend']} {tune.scan_env(scanner['color'], scanner['scan_backend'])} "
+        f"SCAN_DISCOVERY_TIMEOUT={limits['discovery']:.0f} SCAN_TIMEOUT={limits['scan']:.0f} "
+        f"{profiles.scan_env(profile, region)} python3 ~/scan.py"
+    ]
+
+    # ...once its VM is up: booted here if this is its first job (see vms.py)
+    if not VMS.ensure(scanner, report):
+        print(f"[Scanner {scanner_color}] Its VM {scanner['vm']} did not come up — job skipped, rescan this sample.")
+        record_job(job, "vm_start_failed")
+        report("failed", outcome="vm_start_failed")
+        return
+
+    # ...once a recovery of this scanner after an earlier failure is done (see recovery.py)
+    RECOVERY.wait(scanner_num, report)
+
+    # ...once this scanner's USB bus allows it: stagger and per-bus limit (see topology.py)
+    report("usb")
+    USB_GATES.acquire(scanner)
+    scan_start = time.time()
+    progress_reader = None
+    try:
+        journal_write(journal.mark, job["journal_id"], "scanning")
+        PREARM.scan_started(scanner_num)
+        scan_proc = subprocess.Popen(scan_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        report("scanning", total=expected, ssh_base=ssh_base, remote_path=remote_path)
+        progress_reader = threading.Thread(target=read_scan_progress, args=(scan_proc, report, expected), daemon=True)
+        progress_reader.start()
+
+        # Backstop in case scan.py could not time itself out (hung VM, stuck USB): kill the remote tree
+        backstop = limits["discovery"] + limits["scan"] + watchdog.BACKSTOP
+        with watchdog.Deadline(backstop, lambda: watchdog.kill_remote(ssh_base, scan_proc, remote_path)) as scan_deadline:
+            # Watch the first strips as they land; a dark/garbage scan is killed early
+            if scanqc is not None:
+                stream = scanqc.monitor_remote_scan(ssh_base, remote_path, scan_proc)
+                if stream.verdict in ("dark", "garbage"):
+                    scan_proc.wait()
+                    print(f"[Scanner {scanner_color}] Scan aborted early, rescan this sample: {stream.reason}")
+                    record_job(job, f"aborted_{stream.verdict}")
+                    report("failed", outcome=f"aborted_{stream.verdict}")
+                    return
+
+            returncode = scan_proc.wait()
+    finally:
+        USB_GATES.release(scanner)
+        PREARM.scan_ended(scanner_num)
+        if progress_reader is not None:
+            progress_reader.join(watchdog.KILL_TIMEOUT)   # no "scanning" report after the job moved on
+    if returncode == DISCOVERY_TIMEOUT_EXIT and not scan_deadline.expired:
+        print(f"[Scanner {scanner_color}] Scanner not found within {limits['discovery']:.0f}s (discovery hung) — rescan this sample.")
+        record_job(job, "discovery_timeout")
+        report("failed", outcome="discovery_timeout")
+        RECOVERY.request(scanner_num, "discovery_timeout")
+        return
+    if scan_deadline.expired or returncode == SCAN_TIMEOUT_EXIT:
+        print(f"[Scanner {scanner_color}] Scan did not finish within {limits['scan']:.0f}s — remote scan killed, rescan this sample.")
+        record_job(job, "scan_timeout")
+        report("failed", outcome="scan_timeout")
+        RECOVERY.request(scanner_num, "scan_timeout")
+        return
+    if returncode != 0:
+        print(f"[scanner-{scanner_num}] ERROR during scan: {subprocess.CalledProcessError(returncode, scan_cmd)}")
+        record_job(job, "scan_failed")
+        report("failed", outcome="scan_failed")
+        RECOVERY.request(scanner_num, "scan_failed")
+        return
+    job["scan_seconds"] = time.time() - scan_start
+    check_duration(job, "scan")
+
+    # Copy back using the remote-safe name (preallocated, verified, renamed into place; see receive.py)
+    journal_write(journal.mark, job["journal_id"], "transferring")
+    transfer_start = time.time()
+    report("transferring", total=expected)
+    PREARM.arm(scanner_num)   # the scanner is free: get it ready for the next sample
+    digest = hashlib.sha256()   # for the catalog, computed as the file arrives
+    try:
+        receive.fetch(
+            ssh_base + [f"cat '{remote_path}'"], local_path, expected, RECEIVE,
+            on_progress=lambda nbytes: report("transferring", bytes=nbytes, total=expected),
+            timeout=limits["transfer"],
+            on_allocated=lambda nbytes: SPACE.allocated(scanner_num, nbytes),
+            digest=digest,
+        )
+        job["sha256"] = digest.hexdigest()
+        job["transfer_seconds"] = time.time() - transfer_start
+        check_duration(job, "transfer")
+
+        # Size sanity check against what the profile should produce (~429.6 MB for color1200)
+        actual_size = os.path.getsize(local_path)
+        if not profiles.size_ok(profile, actual_size, region):
+            print(f"[Scanner {scanner_color}] Warning: file size off ({actual_size} B, expected ~{profiles.expected_size(profile, region)} B for {profile['name']}) — possible corruption.")
+
+        if scanqc is not None:
+            report("qc")
+            try:
+                qc = scanqc.check_scan(local_path)
+                job["qc_status"] = qc["status"]
+                if qc["status"] != "ok":
+                    print(f"[Scanner {scanner_color}] QC: {scanqc.describe(qc)}")
+            except Exception as e:
+                print(f"[Scanner {scanner_color}] QC could not read the scan: {e}")
+
+        print(f"[Scanner {scanner_color}] - Complete")
+        record_job(job, "ok")
+        report("done", outcome="ok", qc_status=job.get("qc_status"), path=local_path)
+        return local_path
+
+    except receive.ReceiveTimeout as e:
+        print(f"[Scanner {scanner_color}] ERROR copying file: {e}")
+        record_job(job, "transfer_timeout")
+        report("failed", outcome="transfer_timeout")
+
+    except (subprocess.CalledProcessError, receive.ReceiveError, OSError) as e:
+        print(f"[Scanner {scanner_color}] ERROR copying file: {e}")
+        record_job(job, "transfer_failed")
+        report("failed", outcome="transfer_failed")
+
+def read_scan_progress(scan_proc, report, total):
+    """Drain scan.py's stdout; the in-process backend's PROGRESS lines become "scanning" reports."""
+    for line in scan_proc.stdout:
+        progress = sanebackend.parse_progress(line)
+        if progress:
+            report("scanning", bytes=progress[0], total=progress[1] or total)
+
+# -------- USB bus gates --------
+class UsbGates:
+    """
+    Per-bus start stagger and concurrency limit. A scanner holds its bus slot
+    from the start of its scan until scan.py exits; scanners on different
+    buses never wait for each other.
+    """
+
+    def __init__(self, topo):
+        self.topo = topo
+        self.lock = threading.Lock()
+        self.buses = {}   # bus -> {"sem": Semaphore or None, "stagger": s, "last_start": t, "lock": Lock}
+
+    def _bus(self, scanner):
+        bus = topology.usb_bus(self.topo, scanner)
+        with self.lock:
+            if bus not in self.buses:
+                lim = topology.usb_limits(self.topo, bus)
+                self.buses[bus] = {
+                    "sem": threading.Semaphore(lim["max_scanning"]) if lim["max_scanning"] else None,
+                    "stagger": lim["stagger"],
+                    "last_start": 0.0,
+                    "lock": threading.Lock(),
+                }
+            return self.buses[bus]
+
+    def acquire(self, scanner):
+        gate = self._bus(scanner)
+        if gate["sem"]:
+            gate["sem"].acquire()
+        with gate["lock"]:
+            wait = gate["last_start"] + gate["stagger"] - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            gate["last_start"] = time.time()
+
+    def release(self, scanner):
+        gate = self._bus(scanner)
+        if gate["sem"]:
+            gate["sem"].release()
+
+USB_GATES = UsbGates(TOPO)
+
+# -------- Pre-arm (scan.py arm) --------
+ARM_FRESH = 240   # seconds, a little under scan.py's ARM_TTL
+
+class Prearm:
+    """
+    Runs `scan.py arm` (pkill, discovery, usbreset, readiness check) on a
+    scanner's VM in the background while the operator is still loading its
+    sample, so the scan itself goes straight to scanimage. At most one arm
+    per scanner at a time, never while it is scanning (scan.py's lock refuses
+    that too), and not again while the last arm is still fresh.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arming = set()
+        self.scanning = set()
+        self.armed_at = {}   # scanner_num -> time of the last successful arm
+
+    def arm(self, scanner_num):
+        with self.lock:
+            if (scanner_num in self.arming or scanner_num in self.scanning or RECOVERY.busy(scanner_num)
+                    or time.time() - self.armed_at.get(scanner_num, 0) < ARM_FRESH):
+                return
+            self.arming.add(scanner_num)
+        threading.Thread(target=self._arm, args=(scanner_num,), daemon=True).start()
+
+    def _arm(self, scanner_num):
+        scanner = SCANNERS[scanner_num]
+        cmd = topology.ssh_cmd(
+            TOPO, scanner,
+            f"SCAN_BACKEND={scanner['scan_backend']} SCAN_DISCOVERY_TIMEOUT={watchdog.DISCOVERY_TIMEOUT} python3 ~/scan.py arm",
+        )
+        with VMS.in_use(scanner):
+            # the first color scanned for a scanner boots its VM while the sample is loaded
+            if not VMS.ensure(scanner, trigger="prearm"):
+                armed, problem = False, [f"its VM {scanner['vm']} did not come up"]
+            else:
+                try:
+                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=watchdog.DISCOVERY_TIMEOUT + watchdog.BACKSTOP)
+                    armed = result.returncode == 0 and "Armed" in result.stdout
+                    problem = (result.stdout + result.stderr).strip().splitlines()[-1:] or [f"exit {result.returncode}"]
+                except subprocess.TimeoutExpired:
+                    armed, problem = False, ["timed out"]
+        with self.lock:
+            self.arming.discard(scanner_num)
+            if armed and scanner_num not in self.scanning:
+                self.armed_at[scanner_num] = time.time()
+        if not armed and "Busy" not in problem[0]:
+            print(f"[Scanner {scanner['color']}] Pre-arm failed, the scan will do a full start: {problem[0]}")
+
+    def scan_started(self, scanner_num):
+        """The scan uses up the arm."""
+        with self.lock:
+            self.scanning.add(scanner_num)
+            self.armed_at.pop(scanner_num, None)
+
+    def scan_ended(self, scanner_num):
+        with self.lock:
+            self.scanning.discard(scanner_num)
+
+PREARM = Prearm()
+
+# -------- USB recovery after a failed scan (see recovery.py) --------
+class Recovery:
+    """
+    Re-attaches a scanner's USB (restarting only its VM if that is not
+    enough) in the background after a failure that points at the scanner,
+    instead of restarting the host. The scanner's next job waits for it. One
+    recovery per scanner at a time, and not again within the cooldown.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}      # scanner_num -> Event set when its recovery is over
+        self.last = {}         # scanner_num -> start of its last recovery
+
+    def busy(self, scanner_num):
+        with self.lock:
+            return scanner_num in self.running
+
+    def request(self, scanner_num, outcome):
+        if not recovery.triggers(TOPO, outcome):
+            return
+        with self.lock:
+            if (scanner_num in self.running
+                    or time.time() - self.last.get(scanner_num, 0) < TOPO["recovery"]["cooldown"]):
+                return
+            self.running[scanner_num] = threading.Event()
+            self.last[scanner_num] = time.time()
+        threading.Thread(target=self._recover, args=(scanner_num, outcome), daemon=True).start()
+
+    def _recover(self, scanner_num, outcome):
+        scanner = SCANNERS[scanner_num]
+        print(f"[Scanner {scanner['color']}] {outcome}: re-attaching its USB in the background...")
+        try:
+            with VMS.in_use(scanner):
+                ok, steps = recovery.recover(TOPO, scanner, trigger=outcome)
+            took = sum(st["seconds"] for st in steps)
+        except Exception as e:
+            ok, took = False, time.time() - self.last[scanner_num]
+            print(f"[Scanner {scanner['color']}] Recovery error: {e}")
+        with self.lock:
+            self.running.pop(scanner_num).set()
+        if ok:
+            print(f"[Scanner {scanner['color']}] Recovered in {took:.0f}s, ready for the next sample.")
+        else:
+            VMS.forget(scanner)
+            print(f"[Scanner {scanner['color']}] Recovery failed after {took:.0f}s — power-cycle the scanner (off, then on).")
+
+    def wait(self, scanner_num, report=None):
+        with self.lock:
+            done = self.running.get(scanner_num)
+        if done is not None:
+            if report:
+                report("recovering")
+            print(f"[Scanner {SCANNERS[scanner_num]['color']}] Waiting for its recovery to finish...")
+            done.wait()
+
+RECOVERY = Recovery()
+
+# -------- Disk space admission --------
+def wait_for_space(scanner_num, nbytes, scanner_color):
+    """Reserve nbytes for this scanner's job; waits for the archive mover if there is one."""
+    if SPACE.reserve(scanner_num, nbytes):
+        return True
+    if STORAGE["archive"] is None:
+        return False
+    print(f"[Scanner {scanner_color}] Waiting for the archive mover to free disk space...")
+    deadline = time.time() + SPACE_WAIT
+    while time.time() < deadline:
+        time.sleep(SPACE_POLL)
+        if SPACE.reserve(scanner_num, nbytes):
+            return True
+    return False
+
+def check_batch_space(jobs):
+    """Refuse a batch up front when the staging disk cannot hold all of it."""
+    needed = 0
+    for scanner_num, _, profile_name in jobs:
+        profile = profiles.get(PROFILES, profile_name)
+        needed += profiles.expected_size(profile, profiles.resolve_region(profile, SCANNERS[scanner_num]["color"]))
+    available = SPACE.available()
+    if needed <= available:
+        return True
+    print(f"Not enough disk space for this batch: needs {needed / 1e9:.1f} GB, "
+          f"{max(available, 0) / 1e9:.1f} GB free in {DEST_DIR} (keeping {STORAGE['min_free_gb']} GB spare).")
+    if STORAGE["archive"] is not None:
+        print("Jobs will wait for the archive mover to free space.")
+        return True
+    print("Free up space (or set an archive in storage.json) and scan again.")
+    return False
+
+# -------- Catalog --------
+RECORD_LOCK = threading.Lock()
+
+def record_job(job, outcome):
+    """Write the finished job to the scan catalog; never let that fail the scan."""
+    with RECORD_LOCK:
+        if "outcome" in job:
+            return   # already recorded as interrupted (tui.py), its thread finished late
+        job["outcome"] = outcome
+    job["finished_at"] = time.time()
+    try:
+        catalog.record_scan(job)
+    except Exception as e:
+        print(f"[Scanner {job['scanner_color']}] Warning: could not record scan in catalog: {e}")
+    journal_write(journal.close, job.get("journal_id"), outcome)
+
+# -------- Job journal (crash recovery, see journal.py) --------
+def journal_write(write, *args):
+    """Journal updates, like catalog writes, never fail the scan."""
+    try:
+        return write(*args)
+    except Exception as e:
+        print(f"Warning: could not update the job journal: {e}")
+
+def resume_interrupted(colors=None):
+    """Finish the jobs a crashed console left on these scanners; list the ones that need a rescan."""
+    try:
+        boot_for_journal(colors)
+        result = journal.reconcile(TOPO, colors, RECEIVE)
+    except Exception as e:
+        print(f"Warning: could not check the job journal: {e}")
+        return
+    if result["rescan"]:
+        print(f"Interrupted before their scan finished, rescan: {journal.rescan_input(result['rescan'])}")
+    if result["recovered"]:
+        start_previews([Path(row["local_path"]) for row in result["recovered"]])
+
+def boot_for_journal(colors):
+    """With lazy VMs, boot the ones that may still hold a finished scan of an interrupted job."""
+    if not TOPO["vms"]["lazy"]:
+        return
+    conn = catalog.connect()
+    try:
+        rows = journal.interrupted(conn, colors)
+    finally:
+        conn.close()
+    for color in sorted({r["scanner_color"] for r in rows if r["state"] != "queued"}):
+        scanner = next((s for s in SCANNERS.values() if s["color"] == color), None)
+        if scanner is not None:
+            with VMS.in_use(scanner):
+                VMS.ensure(scanner, trigger="resume")
+
+# -------- Duration history (slow scanner alerts) --------
+DURATIONS = durations.DurationModel()
+ALERTS = []   # repeated after the screen is cleared at the end of a batch
+
+def check_duration(job, phase):
+    """Warn when this job's phase ran long for its scanner (see durations.py)."""
+    try:
+        DURATIONS.refresh()
+    except Exception:
+        return
+    alert = DURATIONS.check(job["scanner_color"], job["profile"], phase, job[f"{phase}_seconds"])
+    if alert:
+        ALERTS.append(f"[Scanner {job['scanner_color']}] SLOW: {alert} — check its USB link.")
+        print(ALERTS[-1])
+
+def job_deadlines(profile, region, color):
+    """Per-phase deadlines for one job (see watchdog.py), from this scanner's history when it has some."""
+    try:
+        DURATIONS.refresh()
+    except Exception:
+        pass
+    return watchdog.deadlines(profile, region, color, DURATIONS)
+
+def report_drift(colors=None):
+    """Warn about scanners that have become slower than the rest of the fleet."""
+    try:
+        DURATIONS.refresh()
+    except Exception:
+        return
+    for color, profile, phase, recent, fleet in DURATIONS.drift():
+        if colors is None or color in colors:
+            print(f"[Scanner {color}] Warning: {phase} is drifting slow on {profile}: "
+                  f"{recent:.0f}s lately vs {fleet:.0f}s on the other scanners ({recent / fleet - 1:+.0%}).")
+
+# -------- Duplicate QR check (across sessions and consoles) --------
+SCANNED = catalog.ScannedIndex()
+
+def confirm_rescans(jobs):
+    """Warn about QRs the catalog already knows; True if the batch should go ahead."""
+    try:
+        SCANNED.refresh()
+    except Exception as e:
+        print(f"Warning: could not check the scan catalog for repeats: {e}")
+        return True
+
+    repeats = []
+    for _, qr, _ in jobs:
+        reason = SCANNED.check(qr)
+        if reason:
+            repeats.append((qr, reason))
+    if not repeats:
+        return True
+
+    for qr, reason in repeats:
+        print(f"Warning: {qr} {reason}.")
+    answer = input("Rescan anyway? [y/N] ").strip().lower()
+    return answer in ("y", "yes")
+
+def claim_jobs(jobs):
+    try:
+        catalog.claim([(VM_Colors[num], qr) for num, qr, _ in jobs])
+    except Exception as e:
+        print(f"Warning: could not mark QRs as in progress: {e}")
+
+def release_jobs(jobs):
+    try:
+        catalog.release([qr for _, qr, _ in jobs])
+    except Exception as e:
+        print(f"Warning: could not clear in-progress QRs: {e}")
+
+# -------- Batch locking --------
+def acquire_batch_lock(blocking_msg: str = None):
+    lf = open(LOCK_FILE, "w")
+    if blocking_msg:
+        print(blocking_msg, flush=True)
+    fcntl.flock(lf, fcntl.LOCK_EX)  # blocks until available
+    return lf
+
+def try_batch_lock():
+    """The batch lock if it is free right now, otherwise None."""
+    lf = open(LOCK_FILE, "w")
+    try:
+        fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lf.close()
+        return None
+    return lf
+
+def release_batch_lock(lock_fh):
+    try:
+        fcntl.flock(lock_fh, fcntl.LOCK_UN)
+        lock_fh.close()
+    except Exception:
+        pass
+
+# -------- Batch runner --------
+def run_batch(jobs):
+    """
+    jobs: list[tuple[int, str, str]] like [(scanner_num, qr_string, profile_name), ...]
+    Returns the local paths of scans that completed.
+    """
+    with ThreadPoolExecutor() as executor:
+        futures = {}
+        for scanner_num, qr, profile_name in jobs:
+            # Starts are staggered per USB bus inside run_scan (USB_GATES)
+            future = executor.submit(run_scan, scanner_num, qr, profile_name)
+            futures[future] = (scanner_num, qr)
+        return wait_batch(futures)
+
+def wait_batch(futures):
+    """Wait for run_scan futures ({future: (scanner_num, qr)}); returns the completed local paths."""
+    completed = []
+    for future in as_completed(futures):
+        scanner_num, scanner_qr = futures[future]
+        try:
+            local_path = future.result()
+            if local_path:
+                completed.append(local_path)
+        except Exception as e:
+            print(f"[scanner-{scanner_num}] Error during scan for {scanner_qr}: {e}")
+        finally:
+            SPACE.release(scanner_num)
+    return completed
+
+def run_cleaner():
+    time.sleep(3)
+    try:
+        # every ssh in cleaner.sh has its own deadline; this bounds the whole run
+        subprocess.run(["/bin/bash", str(CLEANER)], check=True,
+                       timeout=2 * watchdog.CLEANUP_TIMEOUT * len(SCANNERS) + 30)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        print("Cleaner.sh failed — please run './cleaner.sh' manually.")
+        time.sleep(5)
+
+def after_batch(jobs, completed):
+    """Previews, then the alerts the screen clear wiped, then drift warnings for these scanners."""
+    start_previews(completed)
+    while ALERTS:
+        print(ALERTS.pop(0))
+    report_drift({VM_Colors[num] for num, _, _ in jobs})
+
+def start_previews(paths):
+    """Build previews for a finished batch in the background so the console stays free."""
+    if preview is None or not paths:
+        return
+    threading.Thread(
+        target=preview.make_previews,
+        args=(paths, DEST_DIR / "previews"),
+        daemon=True,
+    ).start()
+
+# -------- Streaming input (each scanner starts as soon as its pair is read) --------
+class StreamingBatch:
+    """
+    A batch whose jobs start one by one as their pairs arrive: the first job
+    takes the batch lock, finish() waits for every job, runs cleaner.sh and
+    releases the lock and the claims exactly like a typed batch. If another
+    batch holds the lock, a thread waits for it and the jobs queue behind it
+    while the console keeps reading pairs.
+    """
+
+    def __init__(self, console):
+        self.console = console
+        self.jobs = []
+        self.futures = {}
+        self.executor = None
+        self.lock_fh = None
+        self.locked = threading.Event()
+        self.cancelled = False
+
+    def has(self, scanner_num=None, qr=None):
+        return any(n == scanner_num or q == qr for n, q, _ in self.jobs)
+
+    def start(self, scanner_num, qr, profile_name):
+        if self.executor is None:
+            self.lock_fh = try_batch_lock()
+            if self.lock_fh is None:
+                print("\nAnother batch may be running. Jobs wait for an available slot; keep scanning pairs.")
+                threading.Thread(target=self.wait_for_lock, daemon=True).start()
+            else:
+                self.locked.set()
+                print(f"\nBatch {self.console} starting...\n")
+            self.executor = ThreadPoolExecutor()
+        job = (scanner_num, qr, profile_name)
+        claim_jobs([job])
+        self.jobs.append(job)
+        # Starts are still staggered per USB bus inside run_scan (USB_GATES)
+        self.futures[self.executor.submit(self.run_scan, scanner_num, qr, profile_name)] = (scanner_num, qr)
+
+    def wait_for_lock(self):
+        self.lock_fh = acquire_batch_lock()
+        print(f"\nBatch {self.console} starting...\n", flush=True)
+        self.locked.set()
+
+    def run_scan(self, scanner_num, qr, profile_name):
+        self.locked.wait()
+        if self.cancelled:
+            return None
+        return run_scan(scanner_num, qr, profile_name)
+
+    def finish(self):
+        if self.executor is None:
+            return
+        completed = []
+        try:
+            print(f"\nBatch {self.console}: all {len(self.jobs)} job(s) started, waiting for the scans...")
+            completed = wait_batch(self.futures)
+            self.executor.shutdown()
+            run_cleaner()
+        finally:
+            if not self.locked.is_set():
+                # Interrupted while another batch held the lock: drop the queued jobs
+                self.cancelled = True
+                self.locked.set()
+            release_batch_lock(self.lock_fh)
+            release_jobs(self.jobs)
+            os.system('cls' if os.name == 'nt' else 'clear')
+        after_batch(self.jobs, completed)
+
+def check_pair(batch, color, qr, profile_name, forced, color_to_num, console_nums):
+    """Per-pair version of the batch checks; returns the scanner number to start, or None."""
+    if color is None:
+        # Legacy: next scanner of this console without a job
+        scanner_num = next((n for n in console_nums if not batch.has(scanner_num=n)), None)
+        if scanner_num is None:
+            print(f"Error: no free scanner left on this console for {qr}; end the batch with a blank line first.")
+            return None
+    else:
+        scanner_num = color_to_num[color]
+    if batch.has(scanner_num=scanner_num):
+        print(f"Error: Color '{color or VM_Colors[scanner_num]}' (scanner {scanner_num}) used twice in one batch.")
+        return None
+    if batch.has(qr=qr):
+        print(f"Error: Duplicate QR {qr} in this batch.")
+        return None
+    if not validate_qr_string(qr):
+        print(f"Error: QR {qr} has bad format (unclosed braces). Please rescan carefully.")
+        return None
+    try:
+        profiles.get(PROFILES, profile_name)
+    except profiles.ProfileError as e:
+        print(f"Error: {e}")
+        return None
+    try:
+        SCANNED.refresh()
+        reason = SCANNED.check(qr)
+    except Exception as e:
+        print(f"Warning: could not check the scan catalog for repeats: {e}")
+        reason = None
+    if reason and not forced:
+        print(f"Warning: {qr} {reason}. Scan it again starting with ! to rescan anyway.")
+        return None
+    if not check_batch_space([(scanner_num, qr, profile_name)]):
+        return None
+    return scanner_num
+
+def stream_console(console, colors, color_to_num, console_nums, allow_legacy, default_profile):
+    """
+    Interactive console: stdin is read a character at a time and each
+    scanner starts the moment its COLOR 'QR' pair is complete. A blank line,
+    or a job on every scanner of this console, ends the batch.
+    """
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    raw = termios.tcgetattr(fd)
+    raw[3] &= ~(termios.ICANON | termios.ECHO)   # no line buffering, we echo ourselves
+    raw[6][termios.VMIN], raw[6][termios.VTIME] = 1, 0
+    tokenizer = PairTokenizer(colors, allow_legacy)
+    example = "".join(f"{c.upper()} '{{QR{i}}}'" for i, c in enumerate(colors[:2], start=1))
+
+    def new_batch():
+        print(f"BATCH {console}: ONLY FOR SCANNERS {', '.join(c.upper() for c in colors)}")
+        print(f"Scan color-QR pairs (e.g., {example}); each scanner starts as soon as its pair is read.")
+        print("COLOR:profile '{QR}' picks a scan profile, !COLOR '{QR}' rescans a known QR, a blank line ends the batch.")
+        print("> ", end="", flush=True)
+        return StreamingBatch(console)
+
+    batch = new_batch()
+    try:
+        termios.tcsetattr(fd, termios.TCSADRAIN, raw)
+        while True:
+            data = os.read(fd, 1024).decode(errors="replace")
+            if not data or "\x04" in data:
+                raise EOFError
+            for ch in data:
+                sys.stdout.write("\b \b" if ch in ("\x7f", "\b") else ch)
+            sys.stdout.flush()
+
+            events = tokenizer.feed(data)
+            if any(e[0] in ("pair", "error") for e in events) and not data.endswith("\n"):
+                print()   # end the echoed line before any messages
+            for event in events:
+                if event[0] == "color":
+                    # Warm the scanner up while its QR is still being read
+                    PREARM.arm(color_to_num[event[1]])
+                elif event[0] == "error":
+                    print(f"Error: {event[1]}")
+                elif event[0] == "pair":
+                    _, color, typed, qr, forced = event
+                    profile_name = typed or MANIFEST.get().get(qr) or default_profile
+                    scanner_num = check_pair(batch, color, qr, profile_name, forced, color_to_num, console_nums)
+                    if scanner_num is not None:
+                        print(f"[Scanner {VM_Colors[scanner_num]}] {qr} queued" + (f" ({profile_name})" if profile_name else ""))
+                        batch.start(scanner_num, qr, profile_name)
+                if batch.jobs and (event[0] == "blank" or len(batch.jobs) == len(console_nums)):
+                    # Keys pressed while waiting stay buffered for the next batch, as with input()
+                    termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+                    batch.finish()
+                    termios.tcsetattr(fd, termios.TCSADRAIN, raw)
+                    batch = new_batch()
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+        batch.finish()
+
+# -------- Main loop --------
+def main(console: int, argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    default_profile = None
+    line_mode = "--line" in argv
+    if line_mode:
+        argv.remove("--line")
+    if "--profile" in argv:
+        i = argv.index("--profile")
+        default_profile = argv[i + 1] if i + 1 < len(argv) else ""
+        del argv[i:i + 2]
+        try:
+            profiles.get(PROFILES, default_profile)
+        except profiles.ProfileError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    color_to_num = topology.color_to_num(TOPO, console)
+    if not color_to_num:
+        print(f"Error: no scanners are assigned to console {console} in {topology.TOPOLOGY_PATH}")
+        sys.exit(1)
+    console_nums = sorted(color_to_num.values())
+    colors = [VM_Colors[n] for n in console_nums]
+    allow_legacy = topology.console_options(TOPO, console).get("allow_legacy_input", False)
+    max_jobs = len(console_nums)
+    example = "".join(f"{c.upper()} '{{QR{i}}}'" for i, c in enumerate(colors[:2], start=1))
+
+    # Jobs interrupted by a crash of this console's last session
+    resume_interrupted(set(colors))
+
+    # At a terminal, each scanner starts as soon as its pair is scanned (--line: wait for Enter as before)
+    if not argv and not line_mode and sys.stdin.isatty():
+        try:
+            stream_console(console, colors, color_to_num, console_nums, allow_legacy, default_profile)
+        except (EOFError, KeyboardInterrupt):
+            print("\nExiting batch console.")
+        return
+
+    while True:
+        error_flag = False
+        try:
+            if len(argv) == 0:
+                print(f"BATCH {console}: ONLY FOR SCANNERS {', '.join(c.upper() for c in colors)}")
+                print(f"Please enter color-QR entries (e.g., {example}), COLOR:profile '{{QR}}' picks a scan profile:")
+                raw_qr = input("> ").strip()
+            elif len(argv) == 1:
+                raw_qr = argv[0]
+            else:
+                print(f"Usage: python3 batchconsole.py {console} \"{example}\"")
+                error_flag = True
+                continue
+
+            try:
+                qr_codes, scanned_colors, scanned_profiles = parse_scanned_input(raw_qr, colors, allow_legacy)
+            except ValueError as e:
+                print(f"Error: {e}")
+                error_flag = True
+                continue
+
+            if scanned_colors and len(scanned_colors) != len(qr_codes):
+                print("Error: Number of colors does not match number of QR codes.")
+                error_flag = True
+                continue
+
+            # Profile per job: typed on the input > manifest > console default > profiles.json default
+            manifest = MANIFEST.get()
+            job_profiles = [p or manifest.get(qr) or default_profile for p, qr in zip(scanned_profiles, qr_codes)]
+            for name in set(job_profiles) - {None}:
+                try:
+                    profiles.get(PROFILES, name)
+                except profiles.ProfileError as e:
+                    print(f"Error: {e}")
+                    error_flag = True
+            if error_flag:
+                continue
+
+            jobs = []
+            used_scanners = set()
+            if scanned_colors:
+                # Color-tagged mode — map each color to its scanner
+                for color, qr, profile_name in zip(scanned_colors, qr_codes, job_profiles):
+                    scanner_num = color_to_num.get(color)
+                    if scanner_num is None:
+                        print(f"Error: Unknown color '{color}'.")
+                        error_flag = True
+                        break
+                    if scanner_num in used_scanners:
+                        print(f"Error: Color '{color}' (scanner {scanner_num}) used twice in one batch.")
+                        error_flag = True
+                        break
+                    jobs.append((scanner_num, qr, profile_name))
+                    used_scanners.add(scanner_num)
+            else:
+                # Legacy mode: map sequentially onto this console's scanners
+                jobs = list(zip(console_nums, qr_codes, job_profiles))
+
+            if not qr_codes:
+                print("Error: No valid QR codes found.")
+                error_flag = True
+                continue
+
+            # Limits: one job per scanner on this console
+            if len(qr_codes) > max_jobs:
+                print(f"Error: You can only scan up to {max_jobs} QR codes per batch.")
+                error_flag = True
+                continue
+
+            # Validate duplicates and formatting (show index on error)
+            dupe_check = set()
+            for idx, qr in enumerate(qr_codes, start=1):
+                if qr in dupe_check:
+                    print(f"Error: Duplicate QR detected at position {idx}.")
+                    error_flag = True
+                    continue
+                if not validate_qr_string(qr):
+                    print(f"Error: QR number {idx} has bad format (unclosed braces). Please rescan carefully.")
+                    error_flag = True
+                    continue
+                dupe_check.add(qr)
+
+            # Repeats from earlier sessions or the other console need confirmation
+            if not error_flag and not confirm_rescans(jobs):
+                continue
+
+            # The finished files must fit on the staging disk
+            if not error_flag and not check_batch_space(jobs):
+                continue
+
+            # Execute batch
+            if not error_flag:
+                os.system('cls' if os.name == 'nt' else 'clear')
+                print(f"Starting scanning jobs for {len(jobs)} scanners...")
+
+                claim_jobs(jobs)
+                lock_fh = acquire_batch_lock("Another batch may be running. Waiting for available slot...")
+                try:
+                    print(f"\nBatch {console} starting...\n")
+                    completed = run_batch(jobs)
+                    run_cleaner()
+                finally:
+                    release_batch_lock(lock_fh)
+                    release_jobs(jobs)
+                    os.system('cls' if os.name == 'nt' else 'clear')
+
+                after_batch(jobs, completed)
+
+        except (EOFError, KeyboardInterrupt):
+            print("\nExiting batch console.")
+            break
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not sys.argv[1].isdigit():
+        print("Usage: python3 batchconsole.py CONSOLE_NUM [--profile NAME] [--line] [\"COLOR '{QR}'...\"]")
+        sys.exit(1)
+    main(int(sys.argv[1]), sys.argv[2:])
@@ -0,0 +1,115 @@
+# Records where the sample tray sits on each scanner so "tray" profiles
+# (see profiles.py) only scan that part of the platen.
+#
+# With an empty tray in place, this runs a quick 75 dpi full-bed scan on the
+# scanner, finds the tray's bounding box (everything that differs from the
+# white lid) and saves it, plus a margin, to regions.json.
+#
+# Usage:
+#   python3 calibrate_tray.py COLOR [--margin MM]          # detect from a scan
+#   python3 calibrate_tray.py COLOR --region L,T,W,H       # record by hand (mm)
+
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import profiles
+import topology
+
+CALIBRATION_PROFILE = {"name": "calibration", "resolution": 75, "mode": "Color", "source": "Flatbed"}
+DEFAULT_MARGIN_MM = 3.0
+BACKGROUND_DELTA = 30   # luminance drop from the lid white that counts as "tray"
+MIN_COVERAGE = 0.02     # share of a row/column that must be tray to count
+
+
+def scan_bed(topo, scanner, out_path: Path):
+    """75 dpi full-bed scan on the scanner's VM, copied to out_path."""
+    remote_path = "/output/calibration.tiff"
+    subprocess.run(
+        topology.ssh_cmd(topo, scanner, f"OUTPUT_FILE='{remote_path}' {profiles.scan_env(CALIBRATION_PROFILE)} python3 ~/scan.py"),
+        check=True,
+    )
+    subprocess.run(topology.scp_from_cmd(topo, scanner, remote_path, out_path), check=True)
+
+
+def detect_region(tiff_path: Path, margin_mm: float) -> dict:
+    """Bounding box (mm) of whatever is darker than the lid background."""
+    import numpy as np
+
+    import scanqc
+    import tiffstrips
+
+    f, mm, info = tiffstrips.open_mmap(tiff_path)
+    try:
+        pixels = tiffstrips.sample_rows(mm, info, range(info["height"]))
+    finally:
+        mm.close()
+        f.close()
+
+    lum = scanqc.luminance(pixels)
+    background = np.percentile(lum, 99)
+    tray = lum < background - BACKGROUND_DELTA
+    rows = np.flatnonzero(tray.mean(axis=1) > MIN_COVERAGE)
+    cols = np.flatnonzero(tray.mean(axis=0) > MIN_COVERAGE)
+    if rows.size == 0 or cols.size == 0:
+        raise ValueError("no tray found on the bed (is it in place and the lid closed?)")
+
+    px_to_mm = 25.4 / CALIBRATION_PROFILE["resolution"]
+    left = max(0.0, cols[0] * px_to_mm - margin_mm)
+    top = max(0.0, rows[0] * px_to_mm - margin_mm)
+    return {
+        "left": left,
+        "top": top,
+        "width": (cols[-1] + 1) * px_to_mm + margin_mm - left,
+        "height": (rows[-1] + 1) * px_to_mm + margin_mm - top,
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    margin = DEFAULT_MARGIN_MM
+    manual = None
+    if "--margin" in args:
+        i = args.index("--margin")
+        margin = float(args[i + 1])
+        del args[i:i + 2]
+    if "--region" in args:
+        i = args.index("--region")
+        manual = args[i + 1]
+        del args[i:i + 2]
+    if len(args) != 1:
+        print("Usage: python3 calibrate_tray.py COLOR [--margin MM] [--region L,T,W,H]")
+        sys.exit(1)
+
+    topo = topology.load()
+    color_to_num = {c.upper(): n for c, n in topology.color_to_num(topo).items()}
+    num = color_to_num.get(args[0].upper())
+    if num is None:
+        print(f"Error: unknown scanner color '{args[0]}'")
+        sys.exit(1)
+    scanner = topology.by_num(topo)[num]
+
+    try:
+        if manual:
+            left, top, width, height = (float(v) for v in manual.split(","))
+            region = {"left": left, "top": top, "width": width, "height": height}
+        else:
+            print(f"[Scanner {scanner['color']}] Scanning the empty tray at 75 dpi...")
+            with tempfile.TemporaryDirectory() as tmp:
+                bed = Path(tmp) / "calibration.tiff"
+                scan_bed(topo, scanner, bed)
+                region = detect_region(bed, margin)
+        profiles.save_region(scanner["color"], region)
+    except (ValueError, profiles.ProfileError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    saved = profiles.load_regions()[scanner["color"]]
+    print(f"[Scanner {scanner['color']}] Tray at {saved['left']:.1f},{saved['top']:.1f} mm, "
+          f"{saved['width']:.1f} x {saved['height']:.1f} mm "
+          f"({profiles.area_fraction(saved):.0%} of the bed) -> {profiles.REGIONS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
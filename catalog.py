@@ -0,0 +1,355 @@
+# SQLite catalog of every scan ever taken: one row per scan with the QR, its
+# parsed fields, scanner, timings and outcome. The batch consoles write a row
+# when each job finishes; `import` back-fills rows from the existing
+# ~/SeedScans/<date>/<Color>/*.tiff tree. ScannedIndex keeps an in-memory set
+# of every QR already scanned (plus QRs claimed by a running batch in either
+# console) so rescans are caught before a scanner is started.
+#
+# Usage:
+#   python3 catalog.py import [ROOT]     # index an existing SeedScans tree
+#   python3 catalog.py find TEXT         # scans whose QR contains TEXT
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+SCAN_ROOT = Path.home() / "SeedScans"
+CATALOG_PATH = Path(os.environ.get("SEEDSCAN_CATALOG", SCAN_ROOT / "catalog.sqlite3"))
+HASH_CHUNK = 8 * 1024 * 1024
+DONE_OUTCOMES = ("ok", "imported")  # outcomes that mean "this QR has a good scan"
+# ...unless QC flagged it (dark, saturated, empty): the operator is told to rescan those
+DONE_QC = "(qc_status IS NULL OR qc_status = 'ok')"
+CLAIM_TTL = 2 * 60 * 60  # seconds before a claim from a crashed console is ignored
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id               INTEGER PRIMARY KEY,
+    qr               TEXT NOT NULL,
+    qr_fields        TEXT,              -- JSON list of the {...} chunks
+    scanner_color    TEXT,
+    vm_ip            TEXT,
+    scan_date        TEXT,              -- YYYY-MM-DD folder the scan landed in
+    started_at       REAL,              -- unix time
+    finished_at      REAL,
+    path             TEXT,
+    size_bytes       INTEGER,
+    sha256           TEXT,
+    scan_seconds     REAL,
+    transfer_seconds REAL,
+    outcome          TEXT,              -- ok, scan_failed, discovery_timeout, scan_timeout, transfer_failed, aborted_dark, ...
+    qc_status        TEXT,
+    profile          TEXT,              -- scan profile name (profiles.json)
+    archived_at      REAL               -- when storage.py moved it to the archive
+);
+CREATE INDEX IF NOT EXISTS scans_qr ON scans (qr);
+CREATE INDEX IF NOT EXISTS scans_date ON scans (scan_date);
+CREATE INDEX IF NOT EXISTS scans_path ON scans (path);
+CREATE TABLE IF NOT EXISTS in_flight (
+    qr_key        TEXT PRIMARY KEY,
+    scanner_color TEXT,
+    claimed_at    REAL
+);
+CREATE TABLE IF NOT EXISTS journal (   -- job states written ahead of each phase, see journal.py
+    id            INTEGER PRIMARY KEY,
+    qr            TEXT NOT NULL,
+    scanner_color TEXT,
+    vm_ip         TEXT,
+    profile       TEXT,
+    remote_path   TEXT,
+    local_path    TEXT,
+    expected_size INTEGER,
+    state         TEXT,               -- queued, scanning, transferring, closed
+    outcome       TEXT,
+    owner_host    TEXT,               -- console process that runs the job
+    owner_pid     INTEGER,
+    started_at    REAL,
+    updated_at    REAL
+);
+CREATE INDEX IF NOT EXISTS journal_open ON journal (state);
+CREATE TABLE IF NOT EXISTS recoveries (   -- one row per step of a scanner recovery, see recovery.py
+    id            INTEGER PRIMARY KEY,
+    scanner_color TEXT,
+    started_at    REAL,               -- start of the whole recovery, shared by its steps
+    trigger       TEXT,               -- job outcome that started it, or manual
+    step          TEXT,               -- stop, reattach, verify, power, restart
+    ok            INTEGER,
+    seconds       REAL,
+    detail        TEXT
+);
+CREATE TABLE IF NOT EXISTS reservations (   -- staging space promised to running jobs, see storage.py
+    owner_host    TEXT,               -- console process holding it
+    owner_pid     INTEGER,
+    job           TEXT,               -- the console's key for the job (scanner number)
+    root          TEXT,               -- staging directory it is for
+    nbytes        INTEGER,            -- not yet allocated on disk
+    reserved_at   REAL,
+    PRIMARY KEY (owner_host, owner_pid, job)
+);
+CREATE TABLE IF NOT EXISTS vm_starts (   -- lazy VM boots and how long until ssh answered, see vms.py
+    id            INTEGER PRIMARY KEY,
+    vm            TEXT,
+    scanner_color TEXT,
+    trigger       TEXT,               -- job, prearm, resume
+    started_at    REAL,
+    ready_seconds REAL,               -- virsh start -> ssh answers (or gave up)
+    ok            INTEGER
+);
+"""
+
+COLUMNS = (
+    "qr", "qr_fields", "scanner_color", "vm_ip", "scan_date", "started_at",
+    "finished_at", "path", "size_bytes", "sha256", "scan_seconds",
+    "transfer_seconds", "outcome", "qc_status", "profile",
+)
+
+# Columns added after the first release: name -> type, added to older catalogs on connect()
+ADDED_COLUMNS = {
+    "profile": "TEXT",
+    "archived_at": "REAL",
+}
+
+
+def connect(path: Path = None):
+    """Open the catalog, creating it if needed. WAL lets both consoles write."""
+    path = Path(path or CATALOG_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(scans)")}
+    for name, sql_type in ADDED_COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE scans ADD COLUMN {name} {sql_type}")
+    return conn
+
+
+def parse_qr_fields(qr: str):
+    """'{a}{b c}' -> ['a', 'b c']"""
+    return re.findall(r"\{([^{}]*)\}", qr)
+
+
+def qr_key(qr: str) -> str:
+    """Normalize a QR the way local filenames do, so imported rows match live ones."""
+    return qr.replace(" ", "_")
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def record_scan(job: dict, conn=None):
+    """
+    Insert one finished job (every attempt gets its own row, so rescans keep
+    their history). `job` uses the COLUMNS names; qr_fields, size_bytes and
+    scan_date are filled in if missing. sha256 is never computed here (a
+    430 MB read): receive.py hashes the file as it arrives, and the archive
+    mover fills in any that are still missing.
+    """
+    row = dict(job)
+    row.setdefault("qr_fields", json.dumps(parse_qr_fields(row["qr"])))
+    path = row.get("path")
+    if path:
+        row.setdefault("scan_date", Path(path).parent.parent.name)
+    if path and os.path.exists(path):
+        row.setdefault("size_bytes", os.path.getsize(path))
+
+    values = [row.get(c) for c in COLUMNS]
+    own = conn is None
+    conn = conn or connect()
+    try:
+        with conn:
+            conn.execute(f"INSERT INTO scans ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", values)
+    finally:
+        if own:
+            conn.close()
+
+
+def record_recovery(color: str, started_at: float, trigger: str, steps, conn=None):
+    """Insert the steps ({"step", "ok", "seconds", "detail"}) of one scanner recovery."""
+    own = conn is None
+    conn = conn or connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO recoveries (scanner_color, started_at, trigger, step, ok, seconds, detail) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(color, started_at, trigger, st["step"], int(st["ok"]), st["seconds"], st["detail"]) for st in steps],
+            )
+    finally:
+        if own:
+            conn.close()
+
+
+def record_vm_start(scanner: dict, trigger: str, started_at: float, ready_seconds: float, ok: bool, conn=None):
+    own = conn is None
+    conn = conn or connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO vm_starts (vm, scanner_color, trigger, started_at, ready_seconds, ok) VALUES (?, ?, ?, ?, ?, ?)",
+                (scanner["vm"], scanner["color"], trigger, started_at, ready_seconds, int(ok)),
+            )
+    finally:
+        if own:
+            conn.close()
+
+
+def find(text: str, conn=None):
+    """Rows whose QR contains `text`, newest first."""
+    own = conn is None
+    conn = conn or connect()
+    try:
+        return conn.execute(
+            "SELECT * FROM scans WHERE qr LIKE ? ORDER BY finished_at DESC",
+            (f"%{text}%",),
+        ).fetchall()
+    finally:
+        if own:
+            conn.close()
+
+
+# -------- Duplicate detection --------
+def claim(qrs_by_color, conn=None):
+    """Mark QRs as being scanned right now so the other console sees them."""
+    own = conn is None
+    conn = conn or connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO in_flight (qr_key, scanner_color, claimed_at) VALUES (?, ?, ?)",
+                [(qr_key(qr), color, time.time()) for color, qr in qrs_by_color],
+            )
+    finally:
+        if own:
+            conn.close()
+
+
+def release(qrs, conn=None):
+    own = conn is None
+    conn = conn or connect()
+    try:
+        with conn:
+            conn.executemany("DELETE FROM in_flight WHERE qr_key = ?", [(qr_key(qr),) for qr in qrs])
+    finally:
+        if own:
+            conn.close()
+
+
+class ScannedIndex:
+    """
+    In-memory membership index over the catalog. The set of finished QRs is
+    loaded once and then topped up from rows with a higher id on refresh();
+    the (small) in_flight table is re-read every time.
+    """
+
+    def __init__(self):
+        self.done = {}        # qr_key -> (scan_date, scanner_color) of the latest good scan
+        self.in_flight = {}   # qr_key -> scanner_color
+        self.last_id = 0
+
+    def refresh(self, conn=None):
+        own = conn is None
+        conn = conn or connect()
+        try:
+            rows = conn.execute(
+                f"SELECT id, qr, scan_date, scanner_color FROM scans "
+                f"WHERE id > ? AND outcome IN ({', '.join('?' * len(DONE_OUTCOMES))}) AND {DONE_QC} ORDER BY id",
+                (self.last_id, *DONE_OUTCOMES),
+            ).fetchall()
+            for row in rows:
+                self.done[qr_key(row["qr"])] = (row["scan_date"], row["scanner_color"])
+            if rows:
+                self.last_id = rows[-1]["id"]
+            self.in_flight = dict(conn.execute(
+                "SELECT qr_key, scanner_color FROM in_flight WHERE claimed_at > ?",
+                (time.time() - CLAIM_TTL,),
+            ).fetchall())
+        finally:
+            if own:
+                conn.close()
+        return self
+
+    def check(self, qr: str):
+        """None if the QR is new, otherwise a short reason string."""
+        key = qr_key(qr)
+        if key in self.in_flight:
+            return f"is being scanned right now on {self.in_flight[key]}"
+        if key in self.done:
+            scan_date, color = self.done[key]
+            return f"was already scanned on {scan_date} ({color})"
+        return None
+
+
+# -------- Bulk import of the existing tree --------
+def _describe_existing(path: str) -> dict:
+    """Worker: build a catalog row for a TIFF already on disk (hashing is the slow part)."""
+    p = Path(path)
+    st = p.stat()
+    return {
+        # Local names are the raw QR with spaces turned into '_'
+        "qr": p.stem,
+        "scanner_color": p.parent.name,
+        "scan_date": p.parent.parent.name,
+        "finished_at": st.st_mtime,
+        "path": str(p),
+        "size_bytes": st.st_size,
+        "sha256": file_sha256(p),
+        "outcome": "imported",
+    }
+
+
+def import_tree(root: Path = SCAN_ROOT, workers: int = None) -> int:
+    """Index every <date>/<Color>/*.tiff under root that is not in the catalog yet."""
+    conn = connect()
+    try:
+        known = {r[0] for r in conn.execute("SELECT path FROM scans")}
+        todo = [str(p) for p in sorted(Path(root).glob("*/*/*.tiff")) if str(p) not in known]
+        if not todo:
+            return 0
+
+        added = 0
+        with ProcessPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+            for row in pool.map(_describe_existing, todo, chunksize=4):
+                record_scan(row, conn)
+                added += 1
+        return added
+    finally:
+        conn.close()
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "find"):
+        print("Usage: python3 catalog.py import [ROOT] | find TEXT")
+        sys.exit(1)
+
+    if sys.argv[1] == "import":
+        root = Path(sys.argv[2]) if len(sys.argv) > 2 else SCAN_ROOT
+        start = time.time()
+        added = import_tree(root)
+        print(f"Indexed {added} new scans from {root} in {time.time() - start:.1f}s -> {CATALOG_PATH}")
+        return
+
+    if len(sys.argv) != 3:
+        print("Usage: python3 catalog.py find TEXT")
+        sys.exit(1)
+    for row in find(sys.argv[2]):
+        when = datetime.fromtimestamp(row["finished_at"]).strftime("%Y-%m-%d %H:%M") if row["finished_at"] else "?"
+        print(f"{when}  {row['scanner_color'] or '?':8} {row['outcome'] or '?':16} {row['path']}")
+
+
+if __name__ == "__main__":
+    main()
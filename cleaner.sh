@@ -1,34 +1,51 @@
 #!/bin/bash
 
-# IPs of all VMs to clean
-VM_IPS=(
-  192.168.122.101
-  192.168.122.102
-  192.168.122.103
-  192.168.122.104
-  192.168.122.105
-  192.168.122.106
-  192.168.122.107
-  192.168.122.108
-)
+HERE="$(dirname "$(readlink -f "$0")")"
+
+# IPs of the running VMs to clean (and the host to ssh -J through, empty if local);
+# VMs are started on demand (vms.py), so ones that are off are skipped
+mapfile -t VM_ROWS < <(python3 "$HERE/vms.py" ips)
+if [[ ${#VM_ROWS[@]} -eq 0 ]]; then
+  echo "No VMs running, nothing to clean."
+  exit 0
+fi
 
 # Hardcoded sudo password
 SSHPASS="Seeds!"
 THRESHOLD_GB=1
+# Every ssh gets a deadline so one hung VM cannot stall the batch (see watchdog.py)
+SSH_TIMEOUT=60
+SSH_OPTS=(-o ConnectTimeout=10 -o ServerAliveInterval=15 -o ServerAliveCountMax=4)
 
 echo ""
 echo "Starting cleanup on all VMs..."
 
-for ip in "${VM_IPS[@]}"; do
+for row in "${VM_ROWS[@]}"; do
+  IFS=$'\t' read -r ip jump <<<"$row"
+  jump_opt=()
+  [[ -n "$jump" ]] && jump_opt=(-J "$jump")
   #echo "Cleaning $ip..."
 
-  ssh seedscanner@$ip "echo '$SSHPASS' | sudo -S rm -f /output/*.tiff && \
+  # Scans of interrupted jobs stay until journal.py has fetched them
+  mapfile -t KEEP < <(python3 "$HERE/journal.py" keep "$ip")
+  rm_cmd="rm -f /output/*.tiff"
+  if [[ ${#KEEP[@]} -gt 0 ]]; then
+    rm_cmd="find /output -maxdepth 1 -name '*.tiff'$(printf " ! -name '%s'" "${KEEP[@]}") -delete"
+  fi
+
+  timeout -k 5 "$SSH_TIMEOUT" ssh "${SSH_OPTS[@]}" "${jump_opt[@]}" seedscanner@$ip "echo '$SSHPASS' | sudo -S $rm_cmd && \
                        echo '$SSHPASS' | sudo -S journalctl --vacuum-time=5s && \
                        echo '$SSHPASS' | sudo -S apt clean && \
                        df -h / >/dev/null 2>&1" >/dev/null 2>&1
+  if [[ $? -eq 124 ]]; then
+    echo "WARNING: cleanup on $ip timed out after ${SSH_TIMEOUT}s"
+    continue
+  fi
 
-  avail_gb=$(ssh -q seedscanner@$ip "df -BG / | awk 'NR==2 {print \$4}' | sed 's/G//'")
-  if [[ $avail_gb -lt $THRESHOLD_GB ]]; then
+  avail_gb=$(timeout -k 5 "$SSH_TIMEOUT" ssh -q "${SSH_OPTS[@]}" "${jump_opt[@]}" seedscanner@$ip "df -BG / | awk 'NR==2 {print \$4}' | sed 's/G//'")
+  if [[ -z "$avail_gb" ]]; then
+    echo "WARNING: could not read free space on $ip"
+  elif [[ $avail_gb -lt $THRESHOLD_GB ]]; then
     echo "WARNING: $ip has low free space on / (${avail_gb}G available)"
   fi
 
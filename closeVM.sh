@@ -1,22 +1,20 @@
 #!/bin/bash
 
-# List of VM names to shut down
-VM_NAMES=(
-  scanner-1-BLUE
-  scanner-2-ORANGE
-  scanner-3-GRAY
-  scanner-4-GREEN
-  scanner-5-WHITE
-  scanner-6-BLACK
-  scanner-7-YELLOW
-  scanner-8-CRIMSON
-)
+HERE="$(dirname "$(readlink -f "$0")")"
+
+# VM names to shut down and the libvirt URI of the host each one lives on, from topology.json
+VM_NAMES=()
+declare -A VM_URI
+while IFS=$'\t' read -r vm uri; do
+  VM_NAMES+=("$vm")
+  VM_URI[$vm]="$uri"
+done < <(python3 "$HERE/topology.py" vms)
 
 echo "Shutting down all VMs..."
 
 for vm in "${VM_NAMES[@]}"; do
   echo "Shutting down $vm..."
-  virsh shutdown "$vm" >/dev/null 2>&1
+  virsh -c "${VM_URI[$vm]}" shutdown "$vm" >/dev/null 2>&1
 
   if [[ $? -eq 0 ]]; then
     echo "$vm shutdown command issued."
@@ -27,7 +25,7 @@ done
 
 echo "Waiting for all VMs to power off..."
 for vm in "${VM_NAMES[@]}"; do
-  while virsh list --name | grep -q "^$vm$"; do
+  while virsh -c "${VM_URI[$vm]}" list --name | grep -q "^$vm$"; do
     sleep 2
   done
 done
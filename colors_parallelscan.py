@@ -8,29 +8,13 @@ import time
 import os
 import re
 
+import topology
+
 # Deadhead
-# Map scanner number to VM IPs
-VM_IPS = {
-    1: "192.168.122.101",
-    2: "192.168.122.102",
-    3: "192.168.122.103",
-    4: "192.168.122.104",
-    5: "192.168.122.105",
-    6: "192.168.122.106",
-    7: "192.168.122.107",
-    8: "192.168.122.108",
-}
-
-VM_Colors = {
-    1: "Blue",
-    2: "Orange",
-    3: "Gray",
-    4: "Green",
-    5: "White",
-    6: "Black",
-    7: "Yellow",
-    8: "Crimson"
-}
+# Scanner number -> VM IP / color, from topology.json
+TOPO = topology.load()
+VM_IPS = topology.vm_ips(TOPO)
+VM_Colors = topology.vm_colors(TOPO)
 
 # Invert to COLOR -> scanner_num (uppercased for case-insensitive match)
 COLOR_TO_NUM = {v.upper(): k for k, v in VM_Colors.items()}
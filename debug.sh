@@ -2,6 +2,9 @@
 set -euo pipefail
 IFS=$'\n\t'
 
+# Manual fallback: `python3 usbmap.py identify` followed by `python3 usbmap.py apply`
+# does the same pairing and rewires the VMs without virt-manager (see README).
+
 # --- Config you can tweak ---
 MODE="Color"
 RESOLUTION="75"
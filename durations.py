@@ -0,0 +1,147 @@
+# How long scans and transfers normally take, per scanner and profile, from
+# the timings the consoles record in the catalog. Each (scanner, profile,
+# phase) keeps its last WINDOW good jobs; the median is the expected duration
+# and the MAD (median absolute deviation) its normal spread.
+#
+# Two kinds of alert:
+#   - a job whose scan or transfer took longer than median + MAD_K * MAD
+#     (and at least MIN_EXCESS over the median) against its own history
+#   - drift: a scanner whose last RECENT jobs are, as a median, slower than the
+#     rest of the fleet on the same profile by the same margin (a V39 whose
+#     USB link degraded gets slower gradually, so its own history follows it)
+#
+# Usage:
+#   python3 durations.py          # per-scanner table with drift flags
+
+import statistics
+import sys
+import threading
+from collections import defaultdict, deque
+
+import catalog
+
+WINDOW = 30          # jobs per (scanner, profile, phase) kept in the model
+MIN_SAMPLES = 5      # fewer than this and there is no model yet
+RECENT = 5           # jobs used for the drift check
+MAD_K = 3.5          # robust z-score limit
+MAD_SCALE = 1.4826   # MAD -> standard deviation for normal data
+MIN_EXCESS = 0.15    # ignore anything within 15% of the median, however tight the MAD
+
+PHASES = {"scan": "scan_seconds", "transfer": "transfer_seconds"}
+
+
+def median_mad(values):
+    med = statistics.median(values)
+    return med, statistics.median(abs(v - med) for v in values)
+
+
+def limit(med, mad):
+    """Slowest duration still considered normal."""
+    return max(med + MAD_K * MAD_SCALE * mad, med * (1 + MIN_EXCESS))
+
+
+class DurationModel:
+    """
+    Rolling per-scanner duration history, topped up from the catalog by id
+    (like catalog.ScannedIndex) so jobs from the other console count too.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(lambda: deque(maxlen=WINDOW))   # (color, profile, phase) -> seconds
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, conn=None):
+        own = conn is None
+        conn = conn or catalog.connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, scanner_color, profile, scan_seconds, transfer_seconds FROM scans "
+                "WHERE id > ? AND outcome = 'ok' ORDER BY id",
+                (self.last_id,),
+            ).fetchall()
+        finally:
+            if own:
+                conn.close()
+        with self.lock:
+            for row in rows:
+                for phase, column in PHASES.items():
+                    if row[column]:
+                        self.samples[(row["scanner_color"], row["profile"], phase)].append(row[column])
+            if rows:
+                self.last_id = rows[-1]["id"]
+        return self
+
+    def stats(self, color, profile, phase):
+        """(median, mad) for this scanner/profile/phase, or None without enough history."""
+        with self.lock:
+            values = list(self.samples.get((color, profile, phase), ()))
+        if len(values) < MIN_SAMPLES:
+            return None
+        return median_mad(values)
+
+    def expected(self, color, profile, phase):
+        s = self.stats(color, profile, phase)
+        return s[0] if s else None
+
+    def eta(self, color, profile, phase, elapsed):
+        """Seconds left in a running phase by the model (None without history)."""
+        med = self.expected(color, profile, phase)
+        return None if med is None else max(0.0, med - elapsed)
+
+    def is_slow(self, color, profile, phase, seconds):
+        s = self.stats(color, profile, phase)
+        return s is not None and seconds > limit(*s)
+
+    def check(self, color, profile, phase, seconds):
+        """Alert text if this job's phase took longer than normal for the scanner, else None."""
+        s = self.stats(color, profile, phase)
+        if s is None or seconds <= limit(*s):
+            return None
+        med, mad = s
+        return f"{phase} took {seconds:.0f}s, normally {med:.0f}s ±{MAD_SCALE * mad:.0f}s on this scanner ({seconds / med - 1:+.0%})"
+
+    def drift(self):
+        """[(color, profile, phase, recent_median, fleet_median)] for scanners slower than the fleet."""
+        with self.lock:
+            samples = {k: list(v) for k, v in self.samples.items()}
+        flagged = []
+        for (color, profile, phase), values in samples.items():
+            if len(values) < RECENT:
+                continue
+            others = [v for (c, p, ph), vals in samples.items() if c != color and p == profile and ph == phase for v in vals]
+            if len(others) < MIN_SAMPLES:
+                continue
+            recent = statistics.median(values[-RECENT:])
+            fleet_med, fleet_mad = median_mad(others)
+            if recent > limit(fleet_med, fleet_mad):
+                flagged.append((color, profile, phase, recent, fleet_med))
+        return flagged
+
+
+def main():
+    if len(sys.argv) > 1:
+        print("Usage: python3 durations.py")
+        sys.exit(1)
+    model = DurationModel().refresh()
+    drifting = {(c, p, ph): (r, f) for c, p, ph, r, f in model.drift()}
+    keys = sorted({(c, p) for c, p, _ in model.samples}, key=lambda k: (k[1] or "", k[0] or ""))
+    if not keys:
+        print(f"No timed scans in {catalog.CATALOG_PATH} yet.")
+        return
+    print(f"{'Scanner':<10} {'Profile':<12} {'n':>3}  {'scan':>14}  {'transfer':>14}")
+    for color, profile in keys:
+        cells = []
+        for phase in PHASES:
+            s = model.stats(color, profile, phase)
+            cells.append(f"{s[0]:.0f}s ±{MAD_SCALE * s[1]:.0f}s" if s else "-")
+        n = len(model.samples.get((color, profile, "scan"), ()))
+        print(f"{color or '?':<10} {profile or '?':<12} {n:>3}  {cells[0]:>14}  {cells[1]:>14}")
+        for phase in PHASES:
+            if (color, profile, phase) in drifting:
+                recent, fleet = drifting[(color, profile, phase)]
+                print(f"    DRIFT: recent {phase} median {recent:.0f}s vs {fleet:.0f}s on the rest of the fleet ({recent / fleet - 1:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# Write-ahead journal of running jobs, so a console that crashes (or whose
+# terminal is closed, which makes launch.sh shut the VMs down) loses no scan
+# that actually finished. run_scan writes each job's state to the catalog's
+# journal table before every remote phase and closes the entry with the job's
+# outcome; an entry still open after its console process is gone was
+# interrupted.
+#
+# When a console starts it reconciles the interrupted entries for its scanners:
+#   - the TIFF is already in DEST_DIR and complete   -> recorded as ok
+#   - scan.py is still running on the VM or the VM
+#     does not answer                               -> left open for next time
+#   - the VM has a complete TIFF in /output         -> fetched, recorded as ok
+#   - nothing usable                                -> recorded as interrupted, rescan
+# cleaner.sh leaves the /output files of open entries alone.
+#
+# Usage:
+#   python3 journal.py status                 # open and interrupted jobs
+#   python3 journal.py resume [--console N]   # reconcile interrupted jobs now
+#   python3 journal.py keep IP                # /output files cleaner.sh must keep on that VM
+
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import catalog
+import receive
+import topology
+import watchdog
+
+OWNER_HOST = socket.gethostname()
+SSH_FAILED = 255   # ssh's own exit code (connection refused, timeout, ...)
+
+
+# -------- Writing (run_scan) --------
+def _execute(sql, params, conn=None):
+    own = conn is None
+    conn = conn or catalog.connect()
+    try:
+        with conn:
+            return conn.execute(sql, params).lastrowid
+    finally:
+        if own:
+            conn.close()
+
+
+def begin(job: dict, remote_path: str, expected_size: int, conn=None) -> int:
+    """Journal a job before anything remote happens; returns the entry id."""
+    now = time.time()
+    return _execute(
+        "INSERT INTO journal (qr, scanner_color, vm_ip, profile, remote_path, local_path, expected_size, "
+        "state, owner_host, owner_pid, started_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+        (job["qr"], job["scanner_color"], job["vm_ip"], job["profile"], remote_path, job["path"],
+         expected_size, OWNER_HOST, os.getpid(), job["started_at"], now),
+        conn,
+    )
+
+
+def mark(entry_id: int, state: str, conn=None):
+    """The job is about to enter `state` (scanning, transferring)."""
+    if entry_id:
+        _execute("UPDATE journal SET state = ?, updated_at = ? WHERE id = ?", (state, time.time(), entry_id), conn)
+
+
+def close(entry_id: int, outcome: str, conn=None):
+    if entry_id:
+        _execute(
+            "UPDATE journal SET state = 'closed', outcome = ?, updated_at = ? WHERE id = ?",
+            (outcome, time.time(), entry_id), conn,
+        )
+
+
+# -------- Reading --------
+def owner_alive(row) -> bool:
+    """Is the console that opened this entry still running?"""
+    if row["owner_host"] != OWNER_HOST:
+        # can't see processes on another PC, trust it for as long as a claim lasts
+        return time.time() - row["updated_at"] < catalog.CLAIM_TTL
+    try:
+        os.kill(row["owner_pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def open_entries(conn, colors=None):
+    rows = conn.execute("SELECT * FROM journal WHERE state != 'closed' ORDER BY id").fetchall()
+    return [r for r in rows if colors is None or r["scanner_color"] in colors]
+
+
+def interrupted(conn, colors=None):
+    return [r for r in open_entries(conn, colors) if not owner_alive(r)]
+
+
+def take_over(conn, row) -> bool:
+    """Make this process the entry's owner; False if another console got there first."""
+    with conn:
+        cur = conn.execute(
+            "UPDATE journal SET owner_host = ?, owner_pid = ?, updated_at = ? "
+            "WHERE id = ? AND state != 'closed' AND owner_host IS ? AND owner_pid IS ?",
+            (OWNER_HOST, os.getpid(), time.time(), row["id"], row["owner_host"], row["owner_pid"]),
+        )
+    return cur.rowcount == 1
+
+
+# -------- Reconciliation --------
+def remote_state(topo, scanner, remote_path):
+    """("unreachable" | "running" | "stopped", size of remote_path or None)."""
+    cmd = topology.ssh_cmd(
+        topo, scanner,
+        f"pgrep -f '[s]can.py' >/dev/null && echo running; stat -c %s '{remote_path}' 2>/dev/null || echo missing",
+    )
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=watchdog.CLEANUP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return "unreachable", None
+    if result.returncode == SSH_FAILED:
+        return "unreachable", None
+    words = result.stdout.split()
+    size = int(words[-1]) if words and words[-1].isdigit() else None
+    return ("running" if "running" in words else "stopped"), size
+
+
+def _finish(conn, row, outcome, **extra):
+    """Record the job in the catalog (unless its console got that far) and close its entry."""
+    recorded = conn.execute(
+        "SELECT outcome FROM scans WHERE path = ? AND started_at = ?", (row["local_path"], row["started_at"])
+    ).fetchone()
+    if recorded:
+        outcome = recorded["outcome"]
+    else:
+        job = {
+            "qr": row["qr"],
+            "scanner_color": row["scanner_color"],
+            "vm_ip": row["vm_ip"],
+            "path": row["local_path"],
+            "started_at": row["started_at"],
+            "profile": row["profile"],
+            "outcome": outcome,
+            "finished_at": time.time(),
+            **extra,
+        }
+        catalog.record_scan(job, conn)
+    close(row["id"], outcome, conn)
+    catalog.release([row["qr"]], conn)   # the crashed console's claim
+    return outcome
+
+
+def recover(conn, topo, row, opts: dict):
+    """Reconcile one interrupted entry; returns "recovered", "rescan" or why it was left open."""
+    color = row["scanner_color"]
+    local = Path(row["local_path"])
+    if local.exists():
+        try:
+            receive.verify_tiff(local, local.stat().st_size)
+            return "recovered" if _finish(conn, row, "ok") in catalog.DONE_OUTCOMES else "rescan"
+        except receive.ReceiveError:
+            pass   # not one of ours (receive.py only renames verified files), fall through
+
+    scanner = next((s for s in topo["scanners"] if s["color"] == color), None)
+    if scanner is None or row["state"] == "queued":
+        # no such scanner any more, or the scan never started
+        _finish(conn, row, "interrupted")
+        return "rescan"
+
+    state, size = remote_state(topo, scanner, row["remote_path"])
+    if state == "unreachable":
+        return "VM not reachable, start it and resume again"
+    if state == "running":
+        return "scan.py is still running on the VM, resume again once it is done"
+    if size is None:
+        _finish(conn, row, "interrupted")
+        return "rescan"
+
+    print(f"[Scanner {color}] Fetching {row['qr']} left on the VM by the last session...")
+    timeout = max(watchdog.MIN_PHASE, (row["expected_size"] or size) / watchdog.MIN_TRANSFER_RATE)
+    catalog.claim([(color, row["qr"])], conn)
+    start = time.time()
+    digest = hashlib.sha256()
+    try:
+        local.parent.mkdir(parents=True, exist_ok=True)
+        receive.fetch(
+            topology.ssh_cmd(topo, scanner, f"cat '{row['remote_path']}'"),
+            local, row["expected_size"] or size, opts, timeout=timeout, digest=digest,
+        )
+    except receive.ReceiveTimeout as e:
+        return f"fetch failed ({e}), resume again"
+    except receive.ReceiveError as e:
+        # the scan itself was cut short
+        print(f"[Scanner {color}] {row['qr']}: {e}")
+        _finish(conn, row, "interrupted")
+        return "rescan"
+    except (subprocess.CalledProcessError, OSError) as e:
+        return f"fetch failed ({e}), resume again"
+    _finish(conn, row, "ok", transfer_seconds=time.time() - start, sha256=digest.hexdigest())
+    watchdog.cleanup(topology.ssh_cmd(topo, scanner, f"rm -f '{row['remote_path']}'"))
+    return "recovered"
+
+
+def reconcile(topo: dict, colors=None, opts: dict = None) -> dict:
+    """
+    Reconcile every interrupted entry for these scanner colors (all if None).
+    Returns {"recovered": [rows], "rescan": [rows], "open": [(row, reason)]}.
+    """
+    result = {"recovered": [], "rescan": [], "open": []}
+    conn = catalog.connect()
+    try:
+        for row in interrupted(conn, colors):
+            if not take_over(conn, row):
+                continue
+            try:
+                outcome = recover(conn, topo, row, opts or receive.settings())
+            except Exception as e:
+                outcome = f"could not reconcile: {e}"
+            if outcome == "recovered":
+                print(f"[Scanner {row['scanner_color']}] Recovered {row['qr']} from the last session.")
+                result["recovered"].append(row)
+            elif outcome == "rescan":
+                result["rescan"].append(row)
+            else:
+                print(f"[Scanner {row['scanner_color']}] {row['qr']} left open: {outcome}.")
+                result["open"].append((row, outcome))
+    finally:
+        conn.close()
+    return result
+
+
+def rescan_input(rows) -> str:
+    """The rescans as console input: COLOR 'QR'COLOR 'QR'..."""
+    return "".join(f"{r['scanner_color'].upper()} '{r['qr']}'" for r in rows)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ("status", "resume", "keep") or (args[0] == "keep" and len(args) != 2):
+        print("Usage: python3 journal.py status | resume [--console N] | keep IP")
+        sys.exit(1)
+
+    if args[0] == "keep":
+        conn = catalog.connect()
+        try:
+            for row in open_entries(conn):
+                if row["vm_ip"] == args[1] and row["remote_path"]:
+                    print(os.path.basename(row["remote_path"]))
+        finally:
+            conn.close()
+        return
+
+    topo = topology.load()
+    if args[0] == "status":
+        conn = catalog.connect()
+        try:
+            rows = open_entries(conn)
+        finally:
+            conn.close()
+        if not rows:
+            print("No open jobs in the journal.")
+        for row in rows:
+            owner = "running" if owner_alive(row) else "INTERRUPTED"
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(row['started_at']))}  "
+                  f"{row['scanner_color']:<8} {row['state']:<12} {owner:<11} {row['qr']}")
+        return
+
+    colors = None
+    if "--console" in args:
+        i = args.index("--console")
+        colors = {s["color"] for s in topology.scanners(topo, int(args[i + 1]))}
+    result = reconcile(topo, colors)
+    print(f"{len(result['recovered'])} recovered, {len(result['rescan'])} to rescan, {len(result['open'])} still open.")
+    if result["rescan"]:
+        print(f"Rescan: {rescan_input(result['rescan'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+# ./launch.sh          one live console for the whole fleet (tui.py)
+# ./launch.sh --panes  one batchconsole.py pane per console, as before
+MODE="tui"
+[[ "${1:-}" == "--panes" ]] && MODE="panes"
+
 AFTER="$(readlink -f ./closeVM.sh)"   # the script you want to run after closing
 chmod +x "$AFTER" 2>/dev/null || true
 
@@ -8,21 +13,52 @@ chmod +x "$AFTER" 2>/dev/null || true
 ran_tmux=0
 trap '[[ $ran_tmux -eq 1 ]] && "$AFTER"' EXIT HUP INT TERM
 
-./startVM.sh
-
 SESSION="seedscan"
 PY="${PYTHON_BIN:-python3}"
-B1="$(readlink -f ./SAVE_parallelscan_BATCH1.py)"
-B2="$(readlink -f ./SAVE_parallelscan_BATCH2.py)"
 
-CMD_B1="bash -lc '$PY \"$B1\"; echo; echo \"[Batch 1 exited] press Ctrl-D to close\"; exec bash'"
-CMD_B2="bash -lc '$PY \"$B2\"; echo; echo \"[Batch 2 exited] press Ctrl-D to close\"; exec bash'"
+# With "vms": {"lazy": true} in topology.json the consoles boot each VM on its
+# first job and shut it down when idle (vms.py); otherwise (the default) boot
+# them all now
+if ! "$PY" -c 'import topology, sys; sys.exit(not topology.load()["vms"]["lazy"])' 2>/dev/null; then
+  ./startVM.sh
+fi
+CONSOLE="$(readlink -f ./batchconsole.py)"
+
+# One pane per console listed in topology.json (console 1 = Batch 1, ...)
+mapfile -t CONSOLES < <("$PY" ./topology.py consoles)
+if [[ ${#CONSOLES[@]} -eq 0 ]]; then
+  echo "No consoles found in topology.json" >&2
+  exit 1
+fi
+
+console_cmd() {
+  echo "bash -lc '$PY \"$CONSOLE\" $1; echo; echo \"[Batch $1 exited] press Ctrl-D to close\"; exec bash'"
+}
 
 if ! tmux has-session -t "$SESSION" 2>/dev/null; then
-  tmux new-session -d -s "$SESSION" -n "SeedScan" "$CMD_B1"
-  tmux split-window -h -t "$SESSION:0" "$CMD_B2"
-  tmux select-pane -t "$SESSION:0.0" \; select-pane -T "Batch 1 (101–104)"
-  tmux select-pane -t "$SESSION:0.1" \; select-pane -T "Batch 2 (105–108)"
+  if [[ "$MODE" == "panes" ]]; then
+    # Old layout: one batchconsole.py pane per console
+    for i in "${!CONSOLES[@]}"; do
+      c="${CONSOLES[$i]}"
+      if [[ $i -eq 0 ]]; then
+        tmux new-session -d -s "$SESSION" -n "SeedScan" "$(console_cmd "$c")"
+      else
+        tmux split-window -h -t "$SESSION:0" "$(console_cmd "$c")"
+      fi
+      octets="$("$PY" ./topology.py ips --console "$c" | cut -f1 | awk -F. '{print $4}' | paste -sd, -)"
+      tmux select-pane -t "$SESSION:0.$i" \; select-pane -T "Batch $c ($octets)"
+    done
+    tmux select-layout -t "$SESSION:0" even-horizontal
+  else
+    # One live console for every scanner
+    tmux new-session -d -s "$SESSION" -n "SeedScan" \
+      "bash -lc '$PY \"$(readlink -f ./tui.py)\"; echo; echo \"[Console exited] press Ctrl-D to close\"; exec bash'"
+  fi
+
+  # Archive mover (staging -> archive) in its own window when storage.json has an archive
+  if "$PY" -c 'import storage, sys; sys.exit(storage.load()["archive"] is None)' 2>/dev/null; then
+    tmux new-window -d -t "$SESSION" -n "Archive" "bash -lc '$PY \"$(readlink -f ./storage.py)\" mover; exec bash'"
+  fi
   tmux set-option -t "$SESSION" mouse on
 fi
 
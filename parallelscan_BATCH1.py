@@ -10,24 +10,16 @@ import time
 import os
 import re
 import fcntl
+
+import topology
 LOCK_FILE = "/tmp/seedscan_batch.lock"
 
 
 # Deadhead 
-# Map scanner number to VM IPs
-VM_IPS = {
-    1: "192.168.122.101",
-    2: "192.168.122.102",
-    3: "192.168.122.103",
-    4: "192.168.122.104"
-}
-
-VM_Colors = {
-    1: "Blue",
-    2: "Orange",
-    3: "Gray",
-    4: "Green"
-}
+# Scanner number -> VM IP / color, from topology.json
+TOPO = topology.load()
+VM_IPS = topology.vm_ips(TOPO, console=1)
+VM_Colors = topology.vm_colors(TOPO, console=1)
 
 DEST_DIR = Path.home() / "SeedScans" / datetime.now().strftime("%Y-%m-%d")
 DEST_DIR.mkdir(parents=True, exist_ok=True)
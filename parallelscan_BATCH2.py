@@ -11,24 +11,16 @@ import time
 import os
 import re
 import fcntl
+
+import topology
 LOCK_FILE = "/tmp/seedscan_batch.lock"
 
 
 # Deadhead 
-# Map scanner number to VM IPs
-VM_IPS = {
-    5: "192.168.122.105",
-    6: "192.168.122.106",
-    7: "192.168.122.107",
-    8: "192.168.122.108"
-}
-
-VM_Colors = {
-    5: "White",
-    6: "Black",
-    7: "Yellow",
-    8: "Crimson"
-}
+# Scanner number -> VM IP / color, from topology.json
+TOPO = topology.load()
+VM_IPS = topology.vm_ips(TOPO, console=2)
+VM_Colors = topology.vm_colors(TOPO, console=2)
 
 DEST_DIR = Path.home() / "SeedScans" / datetime.now().strftime("%Y-%m-%d")
 DEST_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,167 @@
+# Per-port USB power for scanners that stay wedged through usbreset and a
+# hostdev re-attach, which used to mean walking over and switching the
+# scanner off and on (Journal). With a hub that can switch its ports (most
+# hubs uhubctl supports), recovery.py cuts power to just that scanner's port
+# and switches it back on.
+#
+# Off unless topology.json has a "power" section with a driver:
+#   "power": {"driver": "uhubctl", "command": ["sudo", "uhubctl"], "off_seconds": 5, "settle": 30}
+# Drivers (add more to DRIVERS):
+#   uhubctl  `command` (default ["uhubctl"]) -l HUB -p PORT -a off|on
+#   command  any tool: `command` is an argv template with {hub}, {port} and
+#            {action} (off/on), e.g. ["ykushcmd", "-d", "{port}"] style wrappers
+# The commands run on the scanner's host (ssh for other PCs, see usbmap.py).
+# A scanner's port is its "power_port" if set (a scanner powered from another
+# hub than its data path), else its "usb_port": "1-2.3" is hub 1-2 port 3,
+# "1-4" is the root hub 1 port 4. Set "power_port": false to never cut one.
+#
+# Usage:
+#   python3 power.py                       # which port each scanner would switch
+#   python3 power.py COLOR off|on|cycle
+
+import sys
+import time
+from abc import ABC, abstractmethod
+
+import topology
+import usbmap
+
+LSUSB_POLL = 2   # seconds between looks for the scanner coming back
+
+
+class PowerError(usbmap.MapError):
+    pass
+
+
+# -------- Drivers --------
+class Driver(ABC):
+    """Switches one hub port on one host; subclasses build their tool's command line."""
+
+    default_command = None
+
+    def __init__(self, topo: dict, host: str, command=None):
+        self.topo = topo
+        self.host = host
+        self.command = list(command or self.default_command or [])
+        if not self.command:
+            raise PowerError(f"power driver {type(self).__name__.lower()} needs a \"command\"")
+
+    @abstractmethod
+    def argv(self, hub: str, port: int, action: str):
+        """The command line that switches `port` of `hub` to `action` (on/off)."""
+
+    def set(self, hub: str, port: int, action: str):
+        usbmap.run(usbmap.host_argv(self.topo, self.host, self.argv(hub, port, action)))
+
+
+class Uhubctl(Driver):
+    default_command = ["uhubctl"]
+
+    def argv(self, hub, port, action):
+        return self.command + ["-l", hub, "-p", str(port), "-a", action]
+
+
+class Command(Driver):
+    def argv(self, hub, port, action):
+        return [a.format(hub=hub, port=port, action=action) for a in self.command]
+
+
+DRIVERS = {
+    "uhubctl": Uhubctl,
+    "command": Command,
+}
+
+
+# -------- Ports --------
+def hub_port(port_path: str):
+    """"1-2.3" -> ("1-2", 3); "1-4" -> ("1", 4)."""
+    try:
+        bus, chain = port_path.split("-", 1)
+        *hubs, port = chain.split(".")
+        return (f"{bus}-{'.'.join(hubs)}" if hubs else bus), int(port)
+    except ValueError:
+        raise PowerError(f"can't tell the hub port from USB port '{port_path}' (expected e.g. 1-2.3)")
+
+
+def port_of(scanner: dict):
+    """The (hub, port) to switch for this scanner, None if it has none."""
+    port = scanner.get("power_port")
+    if port is False:
+        return None
+    port = port or scanner.get("usb_port")
+    return hub_port(port) if port else None
+
+
+def enabled(topo: dict, scanner: dict) -> bool:
+    """Is there a driver and a port to switch (a malformed port is reported by cycle())?"""
+    port = scanner.get("power_port")
+    return bool(topo["power"]["driver"]) and port is not False and bool(port or scanner.get("usb_port"))
+
+
+def driver(topo: dict, scanner: dict) -> Driver:
+    name = topo["power"]["driver"]
+    if name not in DRIVERS:
+        raise PowerError(f"unknown power driver '{name}' (known: {', '.join(DRIVERS)})")
+    return DRIVERS[name](topo, scanner["host"], topo["power"]["command"])
+
+
+# -------- Power cycle --------
+def cycle(topo: dict, scanner: dict) -> str:
+    """Switch the scanner's port off and on, and wait for the V39 to show up on the host again."""
+    if not enabled(topo, scanner):
+        raise PowerError(f"no switchable port for {scanner['color']} (power driver / usb_port not set)")
+    hub, port = port_of(scanner)
+    d = driver(topo, scanner)
+    d.set(hub, port, "off")
+    time.sleep(topo["power"]["off_seconds"])
+    d.set(hub, port, "on")
+
+    start = time.time()
+    while time.time() - start < topo["power"]["settle"]:
+        if usbmap.find_device(usbmap.host_devices(topo, scanner["host"]), scanner):
+            return f"hub {hub} port {port}, back on USB after {time.time() - start:.0f}s"
+        time.sleep(LSUSB_POLL)
+    raise PowerError(f"hub {hub} port {port} switched, but the V39 did not come back within {topo['power']['settle']}s")
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        topo = topology.load()
+    except topology.TopologyError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if not args:
+        print(f"Power driver: {topo['power']['driver'] or 'none (add a power section to topology.json)'}")
+        for s in topo["scanners"]:
+            try:
+                where = port_of(s)
+            except PowerError as e:
+                where = str(e)
+            print(f"  {s['color']:<10} {f'hub {where[0]} port {where[1]}' if isinstance(where, tuple) else where or '-'}")
+        return
+
+    if len(args) != 2 or args[1] not in ("off", "on", "cycle"):
+        print("Usage: python3 power.py [COLOR off|on|cycle]")
+        sys.exit(1)
+    scanner = next((s for s in topo["scanners"] if s["color"].upper() == args[0].upper()), None)
+    if scanner is None:
+        print(f"Error: no scanner {args[0]} in {topology.TOPOLOGY_PATH}")
+        sys.exit(1)
+    try:
+        if args[1] == "cycle":
+            print(f"[Scanner {scanner['color']}] {cycle(topo, scanner)}")
+        elif not enabled(topo, scanner):
+            raise PowerError(f"no switchable port for {scanner['color']} (power driver / usb_port not set)")
+        else:
+            hub, port = port_of(scanner)
+            driver(topo, scanner).set(hub, port, args[1])
+            print(f"[Scanner {scanner['color']}] hub {hub} port {port} {args[1]}")
+    except usbmap.MapError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Post-ingest preview stage: downsampled JPEG/WebP previews + a contact sheet
+# for each batch, so operators can eyeball a scan without opening 430 MB TIFFs.
+#
+# Usage:
+#   python3 preview.py                      # preview today's staging folder (storage.py)
+#   python3 preview.py DIR_OR_TIFF [...]    # preview specific folders/files
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import storage
+import tiffstrips
+
+PREVIEW_MAX_PX = 1200  # long edge of each preview
+THUMB_PX = 300         # long edge of each contact sheet tile
+PREVIEW_FORMAT = os.environ.get("SEEDSCAN_PREVIEW_FORMAT", "jpg")  # jpg or webp
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def preview_path(tiff_path: Path, fmt: str = PREVIEW_FORMAT) -> Path:
+    """~/SeedScans/<date>/<Color>/X.tiff -> ~/SeedScans/<date>/<Color>/previews/X.<fmt>"""
+    return tiff_path.parent / "previews" / f"{tiff_path.stem}.{fmt}"
+
+
+def make_preview(tiff_path, max_px: int = PREVIEW_MAX_PX, fmt: str = PREVIEW_FORMAT) -> str:
+    """
+    Build one downsampled preview by reading every Nth row/column through mmap.
+    Runs inside a worker process; returns the preview path as a string.
+    """
+    tiff_path = Path(tiff_path)
+    f, mm, info = tiffstrips.open_mmap(tiff_path)
+    try:
+        step = max(1, -(-max(info["width"], info["height"]) // max_px))  # ceil div
+        pixels = tiffstrips.sample_rows(mm, info, range(0, info["height"], step), col_step=step)
+    finally:
+        mm.close()
+        f.close()
+
+    if info["samples"] >= 3:
+        img = Image.fromarray(np.ascontiguousarray(pixels[:, :, :3]), "RGB")
+    else:
+        gray = pixels[:, :, 0]
+        if info["photometric"] == 0:  # WhiteIsZero
+            gray = 255 - gray
+        img = Image.fromarray(np.ascontiguousarray(gray), "L")
+
+    out = preview_path(tiff_path, fmt)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    img.save(out, "WEBP" if fmt == "webp" else "JPEG", quality=85)
+    return str(out)
+
+
+def make_contact_sheet(previews, out_path: Path, cols: int = 4) -> Path:
+    """Tile previews (list of (label, path)) into one labelled JPEG."""
+    rows = -(-len(previews) // cols)
+    label_h = 20
+    sheet = Image.new("RGB", (cols * THUMB_PX, rows * (THUMB_PX + label_h)), "white")
+    draw = ImageDraw.Draw(sheet)
+
+    for i, (label, path) in enumerate(previews):
+        with Image.open(path) as img:
+            img.thumbnail((THUMB_PX, THUMB_PX))
+            x = (i % cols) * THUMB_PX
+            y = (i // cols) * (THUMB_PX + label_h)
+            sheet.paste(img.convert("RGB"), (x + (THUMB_PX - img.width) // 2, y + label_h))
+        draw.text((x + 4, y + 4), label[:48], fill="black")
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(out_path, "JPEG", quality=85)
+    return out_path
+
+
+def make_previews(tiff_paths, contact_dir: Path = None):
+    """
+    Preview a batch of scans in parallel (one process per scan) and, if
+    contact_dir is given, write a contact sheet of the batch there.
+    Returns the list of preview paths that succeeded.
+    """
+    tiff_paths = [Path(p) for p in tiff_paths]
+    if not tiff_paths:
+        return []
+
+    done = []
+    with ProcessPoolExecutor(max_workers=min(MAX_WORKERS, len(tiff_paths))) as pool:
+        futures = {pool.submit(make_preview, str(p)): p for p in tiff_paths}
+        for future in as_completed(futures):
+            src = futures[future]
+            try:
+                done.append((src, Path(future.result())))
+            except Exception as e:
+                print(f"[preview] Failed for {src.name}: {e}")
+
+    if contact_dir is not None and done:
+        done.sort(key=lambda item: str(item[0]))
+        stamp = datetime.now().strftime("%H%M%S")
+        labels = [(f"{src.parent.name}: {src.stem}", out) for src, out in done]
+        make_contact_sheet(labels, Path(contact_dir) / f"contact_{stamp}.jpg")
+
+    return [out for _, out in done]
+
+
+def main():
+    targets = [Path(a) for a in sys.argv[1:]] or [storage.day_dir(datetime.now().strftime("%Y-%m-%d"))]
+
+    tiffs = []
+    for t in targets:
+        if t.is_dir():
+            tiffs.extend(sorted(t.glob("*/*.tiff")) or sorted(t.glob("*.tiff")))
+        elif t.suffix == ".tiff":
+            tiffs.append(t)
+        else:
+            print(f"Skipping {t} (not a folder or .tiff)")
+
+    if not tiffs:
+        print("No scans found to preview.")
+        return
+
+    print(f"Building previews for {len(tiffs)} scans...")
+    contact_dir = targets[0] / "previews" if targets[0].is_dir() else None
+    made = make_previews(tiffs, contact_dir)
+    print(f"Done: {len(made)}/{len(tiffs)} previews written.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# Named scan profiles (resolution, mode, source) so a job can ask for 600 dpi
+# or grayscale instead of the old fixed 1200 dpi Color. Profiles live in
+# profiles.json next to this script (override with SEEDSCAN_PROFILES).
+#
+# A profile may also limit the scan to a region of the platen (SANE -l/-t/-x/-y,
+# in mm from the top-left corner):
+#   "region": {"left": 10, "top": 20, "width": 150, "height": 200}   fixed area
+#   "region": "tray"    each scanner's calibrated tray area from regions.json
+#                       (written by calibrate_tray.py); full bed if uncalibrated
+#
+# A job's profile comes from, in order:
+#   1. the console input, as COLOR:profile '{QR}'  (e.g. BLUE:gray600 '{...}')
+#   2. the manifest, a CSV of qr,profile rows (SEEDSCAN_MANIFEST,
+#      default ~/SeedScans/manifest.csv)
+#   3. the console default (batchconsole.py --profile NAME)
+#   4. "default" in profiles.json
+#
+# Usage:
+#   python3 profiles.py          # list profiles and their expected file sizes
+
+import csv
+import json
+import os
+from pathlib import Path
+
+PROFILES_PATH = Path(os.environ.get("SEEDSCAN_PROFILES", Path(__file__).resolve().with_name("profiles.json")))
+REGIONS_PATH = Path(os.environ.get("SEEDSCAN_REGIONS", Path(__file__).resolve().with_name("regions.json")))
+MANIFEST_PATH = Path(os.environ.get("SEEDSCAN_MANIFEST", Path.home() / "SeedScans" / "manifest.csv"))
+
+# Perfection V39 flatbed area (the full-bed scan scanimage does by default)
+PLATEN_WIDTH_MM = 215.9
+PLATEN_HEIGHT_MM = 297.18
+
+BITS_PER_PIXEL = {"Color": 24, "Gray": 8, "Lineart": 1}
+TIFF_OVERHEAD = 1024     # header + IFD written by scanimage
+SIZE_TOLERANCE = 0.012   # ~5 MB on the 429.6 MB full-bed 1200 dpi Color scan
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def load(path: Path = None) -> dict:
+    path = Path(path or PROFILES_PATH)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ProfileError(f"could not read profiles {path}: {e}")
+
+    profiles = data.get("profiles") or {}
+    for name, p in profiles.items():
+        p["name"] = name
+        p.setdefault("source", "Flatbed")
+        if p.get("mode") not in BITS_PER_PIXEL:
+            raise ProfileError(f"{path}: profile '{name}' has unknown mode '{p.get('mode')}'")
+        if not isinstance(p.get("resolution"), int) or p["resolution"] <= 0:
+            raise ProfileError(f"{path}: profile '{name}' needs a positive integer resolution")
+        region = p.get("region")
+        if region is not None and region != "tray":
+            p["region"] = check_region(region, f"{path}: profile '{name}'")
+    if data.get("default") not in profiles:
+        raise ProfileError(f"{path}: default profile '{data.get('default')}' is not defined")
+    return data
+
+
+def get(data: dict, name: str = None) -> dict:
+    name = name or data["default"]
+    if name not in data["profiles"]:
+        raise ProfileError(f"unknown scan profile '{name}' (known: {', '.join(sorted(data['profiles']))})")
+    return data["profiles"][name]
+
+
+# -------- Regions --------
+def check_region(region: dict, where: str = "region") -> dict:
+    """Validate a {left, top, width, height} mm region, clamp it to the platen and round to 0.1 mm."""
+    try:
+        left, top = float(region["left"]), float(region["top"])
+        width, height = float(region["width"]), float(region["height"])
+    except (KeyError, TypeError, ValueError):
+        raise ProfileError(f"{where}: region needs numeric left, top, width and height (mm)")
+    if width <= 0 or height <= 0 or left < 0 or top < 0 or left >= PLATEN_WIDTH_MM or top >= PLATEN_HEIGHT_MM:
+        raise ProfileError(f"{where}: region {region} is outside the {PLATEN_WIDTH_MM} x {PLATEN_HEIGHT_MM} mm platen")
+    return {
+        "left": round(left, 1),
+        "top": round(top, 1),
+        "width": round(min(width, PLATEN_WIDTH_MM - left), 1),
+        "height": round(min(height, PLATEN_HEIGHT_MM - top), 1),
+    }
+
+
+def load_regions(path: Path = None) -> dict:
+    """{scanner_color: region} of calibrated tray areas; empty if none yet."""
+    path = Path(path or REGIONS_PATH)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return {color: check_region(r, f"{path}: {color}") for color, r in json.load(f).items()}
+
+
+def save_region(color: str, region: dict, path: Path = None):
+    path = Path(path or REGIONS_PATH)
+    regions = load_regions(path)
+    regions[color] = check_region(region, color)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(regions, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def resolve_region(profile: dict, scanner_color: str, regions: dict = None):
+    """The region a scan with this profile on this scanner should use, or None for the full bed."""
+    region = profile.get("region")
+    if region == "tray":
+        regions = load_regions() if regions is None else regions
+        return regions.get(scanner_color)
+    return region
+
+
+def scan_area_mm(profile: dict, region: dict = None):
+    """(width_mm, height_mm) actually scanned."""
+    if region:
+        return region["width"], region["height"]
+    return PLATEN_WIDTH_MM, PLATEN_HEIGHT_MM
+
+
+def area_fraction(region: dict = None) -> float:
+    width_mm, height_mm = scan_area_mm({}, region)
+    return (width_mm * height_mm) / (PLATEN_WIDTH_MM * PLATEN_HEIGHT_MM)
+
+
+def expected_size(profile: dict, region: dict = None) -> int:
+    """Expected TIFF size in bytes for a scan with this profile (and region)."""
+    width_mm, height_mm = scan_area_mm(profile, region)
+    dpi = profile["resolution"]
+    width_px = round(width_mm / 25.4 * dpi)
+    height_px = round(height_mm / 25.4 * dpi)
+    row_bytes = (width_px * BITS_PER_PIXEL[profile["mode"]] + 7) // 8
+    return row_bytes * height_px + TIFF_OVERHEAD
+
+
+def size_ok(profile: dict, actual: int, region: dict = None) -> bool:
+    expected = expected_size(profile, region)
+    return abs(actual - expected) <= max(expected * SIZE_TOLERANCE, 100_000)
+
+
+def scan_env(profile: dict, region: dict = None) -> str:
+    """Environment assignments scan.py reads, as a shell prefix."""
+    env = (
+        f"SCAN_RESOLUTION={profile['resolution']} "
+        f"SCAN_MODE={profile['mode']} "
+        f"SCAN_SOURCE={profile['source']}"
+    )
+    if region:
+        env += (
+            f" SCAN_LEFT={region['left']:.1f} SCAN_TOP={region['top']:.1f}"
+            f" SCAN_WIDTH={region['width']:.1f} SCAN_HEIGHT={region['height']:.1f}"
+        )
+    return env
+
+
+def load_manifest(path: Path = None) -> dict:
+    """{qr: profile_name} from a qr,profile CSV; empty if there is no manifest."""
+    path = Path(path or MANIFEST_PATH)
+    if not path.exists():
+        return {}
+    with open(path, newline="") as f:
+        return {row["qr"].strip(): row["profile"].strip() for row in csv.DictReader(f) if row.get("qr") and row.get("profile")}
+
+
+class Manifest:
+    """load_manifest() kept in memory; get() re-reads the CSV only when its mtime changes."""
+
+    def __init__(self, path: Path = None):
+        self.path = path
+        self.mtime = None
+        self.data = {}
+
+    def get(self) -> dict:
+        path = Path(self.path or MANIFEST_PATH)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.mtime:
+            self.data = load_manifest(path) if mtime is not None else {}
+            self.mtime = mtime
+        return self.data
+
+
+def main():
+    data = load()
+    for name, p in sorted(data["profiles"].items()):
+        marker = "*" if name == data["default"] else " "
+        region = p.get("region")
+        where = "tray" if region == "tray" else ("region" if region else "full bed")
+        size = "per scanner" if region == "tray" else f"{expected_size(p, region) / 1e6:8.1f} MB"
+        print(f"{marker} {name:<12} {p['resolution']:>5} dpi  {p['mode']:<8} {where:<9} {size}")
+
+    for color, region in sorted(load_regions().items()):
+        print(f"  tray {color:<10} {region['left']:.0f},{region['top']:.0f} {region['width']:.0f}x{region['height']:.0f} mm"
+              f"  ({area_fraction(region):.0%} of the bed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# Receiver for incoming scan files, used instead of scp. The console streams
+# the file off the VM with `ssh cat` and writes it here:
+#   - the expected size (profiles.expected_size) is preallocated with
+#     posix_fallocate, so eight concurrent 430 MB files don't interleave into
+#     fragments on the staging disk
+#   - data is collected in one large page-aligned buffer and written in
+#     write_buffer_mb pieces instead of 64 KB pipe reads
+#   - it lands under a temporary .part name and is renamed into place only
+#     after the TIFF header parses and all of its pixel data arrived
+#   - the sha256 for the catalog is computed from the same buffer as it is
+#     written, instead of reading the whole file back afterwards
+#   - fsync policy (storage.json "fsync"): "close" syncs each file before the
+#     rename (default), "interval" also fdatasyncs every fsync_interval_mb so
+#     dirty pages drain gradually instead of in one storm, "none" leaves it to
+#     the kernel
+#   - an optional deadline (watchdog.deadlines "transfer") kills a stalled ssh
+#     cat, so a hung link fails the job instead of holding the batch
+#
+# Usage:
+#   python3 receive.py bench [--dir DIR] [--size MB] [--streams 1,2,4,8]
+#       # write throughput of this receiver vs plain buffered writes
+
+import mmap
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import storage
+import tiffstrips
+import watchdog
+
+FSYNC_POLICIES = ("close", "interval", "none")
+DEFAULT_BUFFER_MB = 4
+DEFAULT_FSYNC_INTERVAL_MB = 64
+HEADER_PEEK = 64 * 1024
+
+
+class ReceiveError(RuntimeError):
+    pass
+
+
+class ReceiveTimeout(ReceiveError):
+    pass
+
+
+def settings(config: dict = None) -> dict:
+    """Receiver settings from storage.json (write_buffer_mb, fsync, fsync_interval_mb)."""
+    config = config or storage.load()
+    policy = config.get("fsync", "close")
+    if policy not in FSYNC_POLICIES:
+        raise storage.StorageError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}, not '{policy}'")
+    return {
+        "buffer_bytes": int(config.get("write_buffer_mb", DEFAULT_BUFFER_MB) * 1024 * 1024),
+        "fsync": policy,
+        "fsync_interval": int(config.get("fsync_interval_mb", DEFAULT_FSYNC_INTERVAL_MB) * 1024 * 1024),
+    }
+
+
+def _write_all(fd, view):
+    while view:
+        n = os.write(fd, view)
+        view = view[n:]
+
+
+def write_stream(src, dst: Path, expected_size: int, opts: dict, on_progress=None, on_allocated=None,
+                 digest=None) -> int:
+    """
+    Copy everything readable from `src` (anything with readinto) into
+    dst's .part file, calling on_progress(bytes_written) after every write
+    and on_allocated(nbytes) whenever nbytes more of the file take up disk
+    space (the preallocation, then anything written past it). `digest`
+    (a hashlib object) is updated with every byte written. Returns the
+    bytes written; the .part file is left for the caller to verify and
+    rename.
+    """
+    fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    buf = mmap.mmap(-1, opts["buffer_bytes"])   # anonymous mapping = page aligned
+    view = memoryview(buf)
+    written = 0
+    allocated = 0
+    since_sync = 0
+    try:
+        if expected_size:
+            try:
+                os.posix_fallocate(fd, 0, expected_size)
+                allocated = expected_size
+                if on_allocated:
+                    on_allocated(allocated)
+            except OSError:
+                pass  # filesystem without fallocate (e.g. some NAS mounts), write anyway
+        filled = 0
+        while True:
+            n = src.readinto(view[filled:])
+            if n:
+                filled += n
+            if filled == len(view) or (not n and filled):
+                _write_all(fd, view[:filled])
+                if digest is not None:
+                    digest.update(view[:filled])
+                written += filled
+                since_sync += filled
+                filled = 0
+                if on_allocated and written > allocated:
+                    on_allocated(written - allocated)
+                    allocated = written
+                if on_progress:
+                    on_progress(written)
+                if opts["fsync"] == "interval" and since_sync >= opts["fsync_interval"]:
+                    os.fdatasync(fd)
+                    since_sync = 0
+            if not n:
+                break
+        os.ftruncate(fd, written)   # drop whatever fallocate reserved past the real end
+        if opts["fsync"] != "none":
+            os.fsync(fd)
+    finally:
+        view.release()
+        buf.close()
+        os.close(fd)
+    return written
+
+
+def verify_tiff(path: Path, size: int):
+    """The received file must be a complete TIFF: header parses and every strip is present."""
+    with open(path, "rb") as f:
+        head = f.read(HEADER_PEEK)
+    try:
+        info = tiffstrips.parse_header(head)
+    except tiffstrips.TiffFormatError as e:
+        raise ReceiveError(f"received file is not a TIFF: {e}")
+    if info is None:
+        raise ReceiveError(f"received file is truncated ({size} B, header incomplete)")
+    end = max(o + c for o, c in zip(info["strip_offsets"], info["strip_counts"]))
+    if end > size:
+        raise ReceiveError(f"received file is truncated ({size} B, expected {end} B)")
+
+
+def commit(part: Path, final: Path, opts: dict):
+    os.replace(part, final)
+    if opts["fsync"] != "none":
+        dir_fd = os.open(final.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def fetch(ssh_cat_cmd, local_path, expected_size: int = 0, opts: dict = None, on_progress=None,
+          timeout: float = None, on_allocated=None, digest=None) -> int:
+    """
+    Run `ssh ... cat REMOTE` and receive its output into local_path. Raises
+    CalledProcessError if ssh fails, ReceiveError if the file is incomplete
+    or the transfer outlived `timeout` seconds (ssh is killed then);
+    local_path is only replaced by a verified file. on_allocated and
+    digest: see write_stream.
+    """
+    opts = opts or settings()
+    final = Path(local_path)
+    part = final.with_name(f".{final.name}.part")
+    # own process group, so a deadline also takes down ssh's helpers (-J proxy) holding the pipe
+    proc = subprocess.Popen(ssh_cat_cmd, stdout=subprocess.PIPE, bufsize=0, start_new_session=True)
+
+    def kill_group():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    try:
+        with watchdog.Deadline(timeout, kill_group) as deadline:
+            size = write_stream(proc.stdout, part, expected_size, opts, on_progress, on_allocated, digest)
+            returncode = proc.wait()
+        if deadline.expired:
+            raise ReceiveTimeout(f"transfer did not finish within {timeout:.0f}s ({size} B received), ssh killed")
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, ssh_cat_cmd)
+        verify_tiff(part, size)
+        commit(part, final, opts)
+        return size
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        if part.exists():
+            part.unlink()
+
+
+# -------- Benchmark --------
+class PatternSource:
+    """readinto() source that yields `total` bytes from a repeating block, like a fast pipe."""
+
+    def __init__(self, total: int, chunk: int = 64 * 1024):
+        self.remaining = total
+        self.block = os.urandom(chunk)
+
+    def readinto(self, view):
+        n = min(len(view), len(self.block), self.remaining)
+        view[:n] = self.block[:n]
+        self.remaining -= n
+        return n
+
+
+def plain_write(src, dst: Path, expected_size: int, opts: dict) -> int:
+    """Baseline: default-buffered writes of each pipe-sized read, no preallocation (what scp does)."""
+    buf = bytearray(64 * 1024)
+    written = 0
+    with open(dst, "wb") as f:
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            f.write(buf[:n])
+            written += n
+        if opts["fsync"] != "none":
+            f.flush()
+            os.fsync(f.fileno())
+    return written
+
+
+def bench_run(writer, directory: Path, streams: int, size: int, opts: dict) -> float:
+    """Aggregate MB/s of `streams` concurrent files of `size` bytes."""
+    paths = [directory / f".bench_{i}.tmp" for i in range(streams)]
+    threads = [threading.Thread(target=writer, args=(PatternSource(size), p, size, opts)) for p in paths]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    for p in paths:
+        p.unlink(missing_ok=True)
+    return streams * size / elapsed / 1e6
+
+
+def bench(argv):
+    opts = {"--dir": None, "--size": "430", "--streams": "1,2,4,8"}
+    for flag in opts:
+        if flag in argv:
+            i = argv.index(flag)
+            opts[flag] = argv[i + 1]
+            del argv[i:i + 2]
+    directory = Path(opts["--dir"]) if opts["--dir"] else storage.staging_root()
+    directory.mkdir(parents=True, exist_ok=True)
+    size = int(float(opts["--size"]) * 1e6)
+    base = settings()
+
+    print(f"Write benchmark in {directory}, {size / 1e6:.0f} MB per stream")
+    print(f"{'streams':>7}" + "".join(f"  {name:>10}" for name in ("plain",) + FSYNC_POLICIES))
+    for streams in (int(v) for v in opts["--streams"].split(",")):
+        plain = bench_run(plain_write, directory, streams, size, dict(base, fsync="close"))
+        rates = [bench_run(write_stream, directory, streams, size, dict(base, fsync=p)) for p in FSYNC_POLICIES]
+        print(f"{streams:>7}" + "".join(f"  {r:>5.0f} MB/s" for r in [plain] + rates))
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] != "bench":
+        print("Usage: python3 receive.py bench [--dir DIR] [--size MB] [--streams 1,2,4,8]")
+        sys.exit(1)
+    bench(args[1:])
+
+
+if __name__ == "__main__":
+    main()
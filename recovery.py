@@ -0,0 +1,238 @@
+# Bringing one wedged scanner back without restarting the host PC, which was
+# the old fix (Journal, cleaner_new.sh) and took every scanner offline for
+# minutes. The consoles run this in the background after a job fails in a way
+# that points at the scanner or its VM (scan_failed, which includes "No
+# scanner found", discovery_timeout and scan_timeout); the scanner's next job
+# waits for it.
+#
+# Steps, stopping as soon as the agent answers:
+#   stop      kill leftover scan.py/scanimage on the VM (watchdog.kill_remote)
+#   reattach  virsh detach-device the VM's V39 hostdev and attach it again,
+#             looked up by its pinned usb_port/usb_serial (usbmap.py), so a
+#             scanner that re-enumerated under a new device number is found
+#   verify    scan.py arm on the VM: discovery, usbreset, readiness check
+#   power     (only with a "power" driver, see power.py) switch the scanner's
+#             hub port off and on, then reattach and verify again
+#   restart   (only with "restart_vm") shut that one VM down, start it again,
+#             wait for ssh, then verify again
+# Every step's result and time goes into the catalog's recoveries table.
+#
+# Settings, in the "recovery" section of topology.json:
+#   "recovery": {"auto": true, "restart_vm": true, "cooldown": 300}
+# auto = consoles recover by themselves; cooldown = seconds before the same
+# scanner is recovered automatically again.
+#
+# Usage:
+#   python3 recovery.py COLOR [--no-restart]   # recover one scanner now
+#   python3 recovery.py history [COLOR]        # step times and success rates so far
+
+import statistics
+import subprocess
+import sys
+import time
+
+import catalog
+import power
+import topology
+import usbmap
+import watchdog
+
+TRIGGERS = ("scan_failed", "discovery_timeout", "scan_timeout")   # job outcomes that start a recovery
+SETTLE = 2              # seconds between detach and attach
+SHUTDOWN_TIMEOUT = 90   # seconds for a clean VM shutdown before virsh destroy
+BOOT_TIMEOUT = 180      # seconds for a started VM to answer ssh
+SSH_POLL = 5
+
+
+def triggers(topo: dict, outcome: str) -> bool:
+    """Should this job outcome start an automatic recovery?"""
+    return topo["recovery"]["auto"] and outcome in TRIGGERS
+
+
+# -------- Steps --------
+def reattach(topo: dict, scanner: dict) -> str:
+    """Detach and re-attach the scanner's V39 hostdev on its VM."""
+    current = usbmap.vm_hostdevs(topo, scanner)
+    devices = usbmap.host_devices(topo, scanner["host"])
+    target = usbmap.find_device(devices, scanner)
+    if target is None and len(current) == 1:
+        # not pinned: the hostdev it has now, if that device is still there
+        target = next((d for d in devices if (d["bus"], d["device"]) == current[0][:2]), None)
+    if target is None:
+        raise usbmap.MapError("its V39 is not on the host's USB (unplugged, off, or not pinned: see usbmap.py)")
+
+    flags = ["--config"] + (["--live"] if usbmap.is_running(topo, scanner) else [])
+    for _, _, doc in current:
+        try:
+            usbmap.change_hostdev(topo, scanner, "detach-device", doc, flags)
+        except usbmap.MapError:
+            # already gone from the VM (power-cycled or unplugged), attach it anyway
+            usbmap.change_hostdev(topo, scanner, "detach-device", doc, ["--config"])
+    time.sleep(SETTLE)
+    usbmap.change_hostdev(topo, scanner, "attach-device", usbmap.hostdev_xml(target["bus"], target["device"]), flags)
+    return f"{target['bus']:03d}:{target['device']:03d} port {target['port'] or '?'}"
+
+
+def verify(topo: dict, scanner: dict):
+    """(ok, last line of output) from scan.py arm on the VM."""
+    cmd = topology.ssh_cmd(
+        topo, scanner,
+        f"SCAN_BACKEND={scanner['scan_backend']} SCAN_DISCOVERY_TIMEOUT={watchdog.DISCOVERY_TIMEOUT} python3 ~/scan.py arm",
+    )
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=watchdog.DISCOVERY_TIMEOUT + watchdog.BACKSTOP)
+    except subprocess.TimeoutExpired:
+        return False, "timed out"
+    last = ((result.stdout + result.stderr).strip().splitlines() or [f"exit {result.returncode}"])[-1]
+    return result.returncode == 0 and "Armed" in result.stdout, last
+
+
+def reachable(topo: dict, scanner: dict) -> bool:
+    """Does the VM answer ssh?"""
+    try:
+        return subprocess.run(topology.ssh_cmd(topo, scanner, "true"), capture_output=True, timeout=20).returncode == 0
+    except subprocess.TimeoutExpired:
+        return False
+
+
+def wait_ssh(topo: dict, scanner: dict, timeout: float = BOOT_TIMEOUT) -> bool:
+    """Poll the VM until ssh answers or `timeout` passes."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if reachable(topo, scanner):
+            return True
+        time.sleep(SSH_POLL)
+    return False
+
+
+def stop(topo: dict, scanner: dict):
+    """Kill whatever is left of the failed scan; (False, why) if the VM does not answer."""
+    if not reachable(topo, scanner):
+        return False, "VM does not answer ssh"
+    watchdog.kill_remote(topology.ssh_cmd(topo, scanner))
+    return True, "leftover scan.py/scanimage killed"
+
+
+def shut_down(topo: dict, scanner: dict):
+    """Shut the scanner's VM down and wait until it is off (virsh destroy if it will not go)."""
+    vm = scanner["vm"]
+    if usbmap.is_running(topo, scanner):
+        usbmap.virsh(topo, scanner, "shutdown", vm, check=False)
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        while usbmap.is_running(topo, scanner) and time.time() < deadline:
+            time.sleep(SSH_POLL)
+        if usbmap.is_running(topo, scanner):
+            usbmap.virsh(topo, scanner, "destroy", vm)
+
+
+def restart_vm(topo: dict, scanner: dict) -> str:
+    """Shut only this scanner's VM down, start it and wait for ssh."""
+    vm = scanner["vm"]
+    shut_down(topo, scanner)
+    usbmap.virsh(topo, scanner, "start", vm)
+    if not wait_ssh(topo, scanner):
+        raise usbmap.MapError(f"{vm} did not answer ssh within {BOOT_TIMEOUT}s of starting")
+    return "restarted"
+
+
+# -------- Sequence --------
+def recover(topo: dict, scanner: dict, restart: bool = None, trigger: str = "manual", log=print):
+    """
+    Run the recovery steps for one scanner and record them in the catalog.
+    Returns (ok, steps) with one {"step", "ok", "seconds", "detail"} per step
+    that ran.
+    """
+    started_at = time.time()
+    ok, steps = _sequence(topo, scanner, topo["recovery"]["restart_vm"] if restart is None else restart, log)
+    try:
+        catalog.record_recovery(scanner["color"], started_at, trigger, steps)
+    except Exception as e:
+        log(f"[Scanner {scanner['color']}] Warning: could not record the recovery in the catalog: {e}")
+    return ok, steps
+
+
+def _sequence(topo, scanner, restart, log):
+    color = scanner["color"]
+    steps = []
+
+    def step(name, action):
+        start = time.time()
+        try:
+            result = action()
+            ok, detail = result if isinstance(result, tuple) else (True, result)
+        except (usbmap.MapError, subprocess.SubprocessError, OSError) as e:
+            ok, detail = False, str(e)
+        steps.append({"step": name, "ok": ok, "seconds": time.time() - start, "detail": detail})
+        log(f"[Scanner {color}] Recovery {name}: {'ok' if ok else 'FAILED'} ({time.time() - start:.0f}s) {detail}")
+        return ok
+
+    if step("stop", lambda: stop(topo, scanner)):
+        if step("reattach", lambda: reattach(topo, scanner)) and step("verify", lambda: verify(topo, scanner)):
+            return True, steps
+        if (power.enabled(topo, scanner) and step("power", lambda: power.cycle(topo, scanner))
+                and step("reattach", lambda: reattach(topo, scanner)) and step("verify", lambda: verify(topo, scanner))):
+            return True, steps
+    if restart and step("restart", lambda: restart_vm(topo, scanner)):
+        # a fresh boot takes the hostdev as configured, re-attach only if it still has no scanner
+        if step("verify", lambda: verify(topo, scanner)):
+            return True, steps
+        if step("reattach", lambda: reattach(topo, scanner)) and step("verify", lambda: verify(topo, scanner)):
+            return True, steps
+    return False, steps
+
+
+def history(color: str = None):
+    """Per scanner and step: how often it ran, how often it worked and its median time."""
+    conn = catalog.connect()
+    try:
+        rows = conn.execute(
+            "SELECT scanner_color, started_at, step, ok, seconds FROM recoveries ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    rows = [r for r in rows if color is None or r["scanner_color"].upper() == color.upper()]
+    if not rows:
+        print("No recoveries recorded.")
+        return
+    print(f"{'Scanner':<10} {'step':<9} {'runs':>5} {'ok':>5} {'median s':>9}")
+    groups = {}
+    for r in rows:
+        groups.setdefault((r["scanner_color"], r["step"]), []).append(r)
+    for (c, name), group in sorted(groups.items()):
+        print(f"{c:<10} {name:<9} {len(group):>5} {sum(r['ok'] for r in group):>5} "
+              f"{statistics.median(r['seconds'] for r in group):>9.1f}")
+    recoveries = {(r["scanner_color"], r["started_at"]) for r in rows}
+    print(f"{len(recoveries)} recoveries in total.")
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == "history":
+        history(args[1] if len(args) > 1 else None)
+        return
+    restart = None
+    if "--no-restart" in args:
+        args.remove("--no-restart")
+        restart = False
+    if len(args) != 1:
+        print("Usage: python3 recovery.py COLOR [--no-restart] | history [COLOR]")
+        sys.exit(1)
+
+    try:
+        topo = topology.load()
+    except topology.TopologyError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    scanner = next((s for s in topo["scanners"] if s["color"].upper() == args[0].upper()), None)
+    if scanner is None:
+        print(f"Error: no scanner {args[0]} in {topology.TOPOLOGY_PATH}")
+        sys.exit(1)
+
+    ok, steps = recover(topo, scanner, restart)
+    print(f"[Scanner {scanner['color']}] {'Recovered' if ok else 'NOT recovered, power-cycle the scanner'} "
+          f"in {sum(s['seconds'] for s in steps):.0f}s.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# In-process SANE backend for the VM agent (scan.py with SCAN_BACKEND=sane).
+# Talks to libsane directly through ctypes instead of spawning scanimage, reads
+# the scan into one reusable buffer and hands each chunk to a sink as it
+# arrives, with bytes/s progress and cancellation (SIGTERM/SIGINT or cancel()).
+# scan.py prints the progress (format_progress) on stdout, where the console
+# reads it back with parse_progress.
+#
+# Copy this file and tiffstrips.py next to ~/scan.py on each VM.
+#
+# Try it without hardware against SANE's "test" backend:
+#   python3 sanebackend.py --list
+#   python3 sanebackend.py test:0 out.tiff [--resolution 75] [--mode Color]
+
+import ctypes
+import ctypes.util
+import sys
+import threading
+import time
+
+import tiffstrips
+
+# -------- libsane ABI --------
+SANE_STATUS_GOOD = 0
+SANE_STATUS_CANCELLED = 2
+SANE_STATUS_EOF = 5
+STATUS_NAMES = {
+    0: "GOOD", 1: "UNSUPPORTED", 2: "CANCELLED", 3: "DEVICE_BUSY", 4: "INVAL",
+    5: "EOF", 6: "JAMMED", 7: "NO_DOCS", 8: "COVER_OPEN", 9: "IO_ERROR",
+    10: "NO_MEM", 11: "ACCESS_DENIED",
+}
+
+SANE_TYPE_BOOL, SANE_TYPE_INT, SANE_TYPE_FIXED, SANE_TYPE_STRING = 0, 1, 2, 3
+SANE_ACTION_SET_VALUE = 1
+SANE_FRAME_GRAY, SANE_FRAME_RGB = 0, 1
+SANE_FIXED_SCALE = 1 << 16
+
+READ_BUFFER = 1 << 20       # default size of the one reusable read buffer
+PROGRESS_INTERVAL = 1.0     # seconds between progress callbacks
+
+
+class SANE_Device(ctypes.Structure):
+    _fields_ = [
+        ("name", ctypes.c_char_p),
+        ("vendor", ctypes.c_char_p),
+        ("model", ctypes.c_char_p),
+        ("type", ctypes.c_char_p),
+    ]
+
+
+class SANE_Parameters(ctypes.Structure):
+    _fields_ = [
+        ("format", ctypes.c_int),
+        ("last_frame", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("pixels_per_line", ctypes.c_int),
+        ("lines", ctypes.c_int),
+        ("depth", ctypes.c_int),
+    ]
+
+
+class SANE_Option_Descriptor(ctypes.Structure):
+    _fields_ = [
+        ("name", ctypes.c_char_p),
+        ("title", ctypes.c_char_p),
+        ("desc", ctypes.c_char_p),
+        ("type", ctypes.c_int),
+        ("unit", ctypes.c_int),
+        ("size", ctypes.c_int),
+        ("cap", ctypes.c_int),
+        ("constraint_type", ctypes.c_int),
+        ("constraint", ctypes.c_void_p),
+    ]
+
+
+class SaneError(RuntimeError):
+    def __init__(self, what, status):
+        super().__init__(f"{what} failed: SANE_STATUS_{STATUS_NAMES.get(status, status)}")
+        self.status = status
+
+
+_lib = None
+_lib_lock = threading.Lock()
+
+
+def lib():
+    """Load and sane_init() libsane once per process."""
+    global _lib
+    with _lib_lock:
+        if _lib is not None:
+            return _lib
+        path = ctypes.util.find_library("sane") or "libsane.so.1"
+        sane = ctypes.CDLL(path)
+
+        sane.sane_init.argtypes = [ctypes.POINTER(ctypes.c_int), ctypes.c_void_p]
+        sane.sane_get_devices.argtypes = [ctypes.POINTER(ctypes.POINTER(ctypes.POINTER(SANE_Device))), ctypes.c_int]
+        sane.sane_open.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_void_p)]
+        sane.sane_close.argtypes = [ctypes.c_void_p]
+        sane.sane_close.restype = None
+        sane.sane_get_option_descriptor.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        sane.sane_get_option_descriptor.restype = ctypes.POINTER(SANE_Option_Descriptor)
+        sane.sane_control_option.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_int)]
+        sane.sane_get_parameters.argtypes = [ctypes.c_void_p, ctypes.POINTER(SANE_Parameters)]
+        sane.sane_start.argtypes = [ctypes.c_void_p]
+        sane.sane_read.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+        sane.sane_cancel.argtypes = [ctypes.c_void_p]
+        sane.sane_cancel.restype = None
+        sane.sane_exit.restype = None
+
+        version = ctypes.c_int()
+        status = sane.sane_init(ctypes.byref(version), None)
+        if status != SANE_STATUS_GOOD:
+            raise SaneError("sane_init", status)
+        _lib = sane
+        return _lib
+
+
+def list_devices(local_only=False):
+    """[(name, vendor, model, type)] of every device SANE can see."""
+    sane = lib()
+    devices = ctypes.POINTER(ctypes.POINTER(SANE_Device))()
+    status = sane.sane_get_devices(ctypes.byref(devices), int(local_only))
+    if status != SANE_STATUS_GOOD:
+        raise SaneError("sane_get_devices", status)
+    found = []
+    i = 0
+    while devices[i]:
+        d = devices[i].contents
+        found.append(tuple((v or b"").decode(errors="replace") for v in (d.name, d.vendor, d.model, d.type)))
+        i += 1
+    return found
+
+
+class SaneScanner:
+    """
+    One open SANE device. set_option() by SANE option name, then scan(sink)
+    streams the frame: sink(memoryview) is called for every chunk read (the
+    view is only valid during the call, the buffer is reused).
+    """
+
+    def __init__(self, device_name: str, buffer_size: int = READ_BUFFER):
+        self.device_name = device_name
+        self.buffer_size = buffer_size
+        self.handle = ctypes.c_void_p()
+        self.cancelled = threading.Event()
+        self.progress = {"bytes": 0, "total": 0, "lines": 0, "rate": 0.0, "elapsed": 0.0}
+        self._buf = (ctypes.c_ubyte * buffer_size)()
+        status = lib().sane_open(device_name.encode(), ctypes.byref(self.handle))
+        if status != SANE_STATUS_GOOD:
+            raise SaneError(f"sane_open({device_name})", status)
+        self._options = self._read_options()
+
+    def _read_options(self):
+        options = {}
+        i = 1  # option 0 is the option count
+        while True:
+            desc = lib().sane_get_option_descriptor(self.handle, i)
+            if not desc:
+                break
+            d = desc.contents
+            if d.name:
+                options[d.name.decode()] = (i, d.type, d.size)
+            i += 1
+        return options
+
+    def has_option(self, name: str) -> bool:
+        return name in self._options
+
+    def set_option(self, name: str, value):
+        if name not in self._options:
+            raise KeyError(f"{self.device_name} has no option '{name}'")
+        index, opt_type, size = self._options[name]
+        if opt_type == SANE_TYPE_STRING:
+            raw = str(value).encode()
+            val = ctypes.create_string_buffer(raw, max(size, len(raw) + 1))
+        elif opt_type == SANE_TYPE_FIXED:
+            val = ctypes.c_int(int(round(float(value) * SANE_FIXED_SCALE)))
+        elif opt_type in (SANE_TYPE_INT, SANE_TYPE_BOOL):
+            val = ctypes.c_int(int(value))
+        else:
+            raise ValueError(f"option '{name}' cannot be set (type {opt_type})")
+        info = ctypes.c_int()
+        status = lib().sane_control_option(self.handle, index, SANE_ACTION_SET_VALUE, ctypes.byref(val), ctypes.byref(info))
+        if status != SANE_STATUS_GOOD:
+            raise SaneError(f"setting {name}={value}", status)
+
+    def set_region(self, left, top, width, height):
+        """Scan area in mm from the top-left corner (SANE tl-x/tl-y/br-x/br-y)."""
+        self.set_option("tl-x", left)
+        self.set_option("tl-y", top)
+        self.set_option("br-x", left + width)
+        self.set_option("br-y", top + height)
+
+    def parameters(self) -> SANE_Parameters:
+        params = SANE_Parameters()
+        status = lib().sane_get_parameters(self.handle, ctypes.byref(params))
+        if status != SANE_STATUS_GOOD:
+            raise SaneError("sane_get_parameters", status)
+        return params
+
+    def cancel(self):
+        """Safe from another thread or a signal handler; scan() then raises SaneError(CANCELLED)."""
+        self.cancelled.set()
+        if self.handle:
+            lib().sane_cancel(self.handle)
+
+    def scan(self, sink, on_start=None, on_progress=None):
+        """
+        Start the scan and stream it to sink(). on_start(params) is called once
+        the frame size is known (before any data); on_progress(progress) every
+        PROGRESS_INTERVAL seconds and at the end. Returns the final progress.
+        """
+        sane = lib()
+        status = sane.sane_start(self.handle)
+        if status != SANE_STATUS_GOOD:
+            raise SaneError("sane_start", status)
+
+        params = self.parameters()
+        if params.format not in (SANE_FRAME_GRAY, SANE_FRAME_RGB) or not params.last_frame:
+            sane.sane_cancel(self.handle)
+            raise SaneError("three-pass scanning is not supported", 1)
+        if on_start:
+            on_start(params)
+
+        total = params.bytes_per_line * params.lines if params.lines > 0 else 0
+        self.progress.update(bytes=0, total=total, lines=0, rate=0.0, elapsed=0.0)
+        length = ctypes.c_int()
+        view = memoryview(self._buf)
+        start = last_report = time.monotonic()
+        try:
+            while True:
+                if self.cancelled.is_set():
+                    raise SaneError("scan", SANE_STATUS_CANCELLED)
+                status = sane.sane_read(self.handle, self._buf, self.buffer_size, ctypes.byref(length))
+                if status == SANE_STATUS_EOF:
+                    break
+                if status != SANE_STATUS_GOOD:
+                    raise SaneError("sane_read", status)
+                if length.value:
+                    sink(view[:length.value])
+                    self.progress["bytes"] += length.value
+
+                now = time.monotonic()
+                if on_progress and now - last_report >= PROGRESS_INTERVAL:
+                    self._update_progress(params, start, now)
+                    on_progress(self.progress)
+                    last_report = now
+        finally:
+            sane.sane_cancel(self.handle)  # ends the frame (required even after EOF)
+
+        self._update_progress(params, start, time.monotonic())
+        if on_progress:
+            on_progress(self.progress)
+        return self.progress
+
+    def _update_progress(self, params, start, now):
+        elapsed = now - start
+        self.progress["elapsed"] = elapsed
+        self.progress["lines"] = self.progress["bytes"] // max(1, params.bytes_per_line)
+        self.progress["rate"] = self.progress["bytes"] / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        if self.handle:
+            lib().sane_close(self.handle)
+            self.handle = ctypes.c_void_p()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def scan_to_tiff(scanner: SaneScanner, out, on_progress=None):
+    """Stream a scan into an open binary file as a TIFF, scanimage-style."""
+    def write_header(params):
+        if params.lines <= 0:
+            raise SaneError("scan with unknown length (TIFF needs the line count)", 1)
+        samples = 3 if params.format == SANE_FRAME_RGB else 1
+        out.write(tiffstrips.build_header(params.pixels_per_line, params.lines, params.depth, samples))
+
+    return scanner.scan(out.write, on_start=write_header, on_progress=on_progress)
+
+
+def format_progress(p) -> str:
+    pct = f" {100 * p['bytes'] / p['total']:5.1f}%" if p["total"] else ""
+    return f"PROGRESS {p['bytes']} {p['total']} {p['rate'] / 1e6:.2f}MB/s{pct}"
+
+
+def parse_progress(line: str):
+    """(bytes, total) from a format_progress() line, None for any other line."""
+    words = line.split()
+    if len(words) >= 3 and words[0] == "PROGRESS" and words[1].isdigit() and words[2].isdigit():
+        return int(words[1]), int(words[2])
+    return None
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["--list"]:
+        for name, vendor, model, kind in list_devices():
+            print(f"{name}\t{vendor} {model} ({kind})")
+        return
+
+    opts = {}
+    for flag in ("--resolution", "--mode", "--source"):
+        if flag in args:
+            i = args.index(flag)
+            opts[flag[2:]] = args[i + 1]
+            del args[i:i + 2]
+    if len(args) != 2:
+        print("Usage: python3 sanebackend.py --list | DEVICE OUT.tiff [--resolution N] [--mode M] [--source S]")
+        sys.exit(2)
+
+    device, out_path = args
+    with SaneScanner(device) as scanner, open(out_path, "wb") as out:
+        for name, value in opts.items():
+            scanner.set_option(name, value)
+        p = scan_to_tiff(scanner, out, on_progress=lambda p: print(format_progress(p), file=sys.stderr))
+    print(f"{out_path}: {p['bytes']} B in {p['elapsed']:.1f}s ({p['rate'] / 1e6:.2f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,25 @@ import sys
 import socket
 from datetime import datetime
 import time
+import json
+import fcntl
 
-subprocess.run(["pkill", "-f", "scanimage"])
+# Deadlines (seconds) from the controller, see watchdog.py: everything before
+# the scan (discovery, usbreset) and the scan itself
+discovery_timeout = float(os.environ.get("SCAN_DISCOVERY_TIMEOUT", "60"))
+scan_timeout = float(os.environ.get("SCAN_TIMEOUT", "0")) or None
 
-time.sleep(1)
+# Exit codes the console tells apart: the scan itself ran out of time, or
+# everything before it did (scanimage -L hung, a pre-arm never let go)
+SCAN_TIMEOUT_EXIT = 124
+DISCOVERY_TIMEOUT_EXIT = 125
+
+ARM_FILE = os.path.expanduser("~/.scan_armed.json")
+ARM_LOCK = os.path.expanduser("~/.scan_arm.lock")
+ARM_TTL = 300   # seconds an arm stays good for
 
 def find_scanner_dev_path(vendor="04b8", product="013d"):
-    lsusb_output = subprocess.run(["lsusb"], capture_output=True, text=True).stdout.strip().splitlines()
+    lsusb_output = subprocess.run(["lsusb"], capture_output=True, text=True, timeout=discovery_timeout).stdout.strip().splitlines()
     for line in lsusb_output:
         if f"{vendor}:{product}" in line:
             parts = line.split()
@@ -27,53 +39,219 @@ scanner_id = socket.gethostname()
 # Output filename from environment or default
 output_file = os.environ.get("OUTPUT_FILE", "scan.tiff")
 
-# Step 1: Discover connected scanner
-result = subprocess.run(["scanimage", "-L"], capture_output=True, text=True)
-lines = result.stdout.strip().splitlines()
+# Scan profile from environment (set by the controller), defaults are the old fixed settings
+resolution = os.environ.get("SCAN_RESOLUTION", "1200")
+mode = os.environ.get("SCAN_MODE", "Color")
+source = os.environ.get("SCAN_SOURCE", "Flatbed")
 
-scanner_name = None
-for line in lines:
-    if "Perfection V39" in line and ":usb:" in line and line.startswith("device `"):
-        scanner_name = line.split("`")[1].split("'")[0]  # Correctly extract the device string
-        break
+# Optional scan region in mm (SANE -l/-t/-x/-y), full bed if unset
+geometry = []
+for flag, var in (("-l", "SCAN_LEFT"), ("-t", "SCAN_TOP"), ("-x", "SCAN_WIDTH"), ("-y", "SCAN_HEIGHT")):
+    if os.environ.get(var):
+        geometry += [flag, os.environ[var]]
 
-if not scanner_name:
-    print(f"[{scanner_id}] No scanner found.")
-    print("scanimage -L output:\n", result.stdout)
-    sys.exit(1)
+# scanimage --buffer-size in KB (per-scanner value from tune.py), backend default if unset
+buffer_kb = os.environ.get("SCAN_BUFFER_SIZE")
 
-#print(f"[{scanner_id}] Found scanner: {scanner_name}")
-#print(f"[{scanner_id}] Saving scan to {output_file}")
+# "scanimage" (default) runs the scanimage CLI; "sane" scans in-process through
+# libsane (sanebackend.py, copied next to this script)
+backend = os.environ.get("SCAN_BACKEND", "scanimage")
 
-dev_path = find_scanner_dev_path()
-if dev_path:
-    subprocess.run(["sudo", "usbreset", dev_path])
-    time.sleep(1)
+def discover_scanner():
+    """Device name of the V39 on this VM (exits if there is none)."""
+    if backend == "sane":
+        try:
+            devices = sanebackend.list_devices()
+        except (OSError, sanebackend.SaneError) as e:
+            print(f"[{scanner_id}] Could not use libsane: {e}")
+            sys.exit(1)
+        scanner_name = next((name for name, vendor, model, kind in devices if "Perfection V39" in model and ":usb:" in name), None)
+        listing = "\n".join(f"{name} {vendor} {model}" for name, vendor, model, kind in devices)
+    else:
+        try:
+            result = subprocess.run(["scanimage", "-L"], capture_output=True, text=True, timeout=discovery_timeout)
+        except subprocess.TimeoutExpired:
+            print(f"[{scanner_id}] scanimage -L hung for {discovery_timeout:.0f}s, giving up.")
+            sys.exit(DISCOVERY_TIMEOUT_EXIT)
+        listing = result.stdout
+        lines = result.stdout.strip().splitlines()
+
+        scanner_name = None
+        for line in lines:
+            if "Perfection V39" in line and ":usb:" in line and line.startswith("device `"):
+                scanner_name = line.split("`")[1].split("'")[0]  # Correctly extract the device string
+                break
+
+    if not scanner_name:
+        print(f"[{scanner_id}] No scanner found.")
+        print(f"{backend} device list:\n", listing)
+        sys.exit(1)
+    return scanner_name
+
+def reset_scanner():
+    """usbreset the V39 so a scanner left in a bad state by the last job starts clean."""
+    dev_path = find_scanner_dev_path()
+    if dev_path:
+        try:
+            subprocess.run(["sudo", "usbreset", dev_path], timeout=discovery_timeout)
+        except subprocess.TimeoutExpired:
+            print(f"[{scanner_id}] Warning: usbreset hung for {discovery_timeout:.0f}s (continuing anyway)")
+        time.sleep(1)
+    else:
+        print(f"[{scanner_id}] Warning: couldn't find dev_path for usbreset (continuing anyway)")
+    return dev_path
+
+def take_armed():
+    """The last `scan.py arm` result if it is fresh and its USB device is still there (used once)."""
+    try:
+        with open(ARM_FILE) as f:
+            armed = json.load(f)
+        os.remove(ARM_FILE)
+    except (OSError, ValueError):
+        return None
+    if time.time() - armed.get("armed_at", 0) > ARM_TTL or armed.get("backend") != backend:
+        return None
+    if armed.get("dev_path") and not os.path.exists(armed["dev_path"]):
+        return None
+    return armed
+
+def check_ready():
+    """Open the scanner and read its options: it answers and the backend has initialized it."""
+    if backend == "sane":
+        with sanebackend.SaneScanner(scanner_name):
+            pass
+    else:
+        subprocess.run(["scanimage", "-d", scanner_name, "-A"], capture_output=True, timeout=discovery_timeout, check=True)
+
+if backend == "sane":
+    import sanebackend
+
+# Step 0: `scan.py arm` (pre-arm, see batchconsole.Prearm) does the pkill,
+# discovery, usbreset and a readiness check while the operator is still
+# loading the sample; the next scan within ARM_TTL starts scanimage straight
+# away. ARM_LOCK keeps an arm from running under a scan.
+arming = sys.argv[1:2] == ["arm"]
+lock_fh = open(ARM_LOCK, "w")
+if arming:
+    try:
+        fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"[{scanner_id}] Busy, not arming.")
+        sys.exit(0)
 else:
-    print(f"[{scanner_id}] Warning: couldn't find dev_path for usbreset (continuing anyway)")
+    lock_deadline = time.monotonic() + discovery_timeout
+    while True:
+        try:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            if time.monotonic() > lock_deadline:
+                print(f"[{scanner_id}] Pre-arm still running after {discovery_timeout:.0f}s, giving up.")
+                sys.exit(DISCOVERY_TIMEOUT_EXIT)
+            time.sleep(0.2)
+
+# Step 1: Discover connected scanner (already done if it was armed)
+armed = None if arming else take_armed()
+if armed:
+    scanner_name = armed["scanner_name"]
+else:
+    subprocess.run(["pkill", "-f", "scanimage"], timeout=discovery_timeout)
+    time.sleep(1)
+    scanner_name = discover_scanner()
+    dev_path = reset_scanner()
+
+if arming:
+    try:
+        check_ready()
+    except Exception as e:
+        print(f"[{scanner_id}] Scanner not ready: {e}")
+        sys.exit(1)
+    with open(ARM_FILE, "w") as f:
+        json.dump({"scanner_name": scanner_name, "dev_path": dev_path, "backend": backend, "armed_at": time.time()}, f)
+    print(f"[{scanner_id}] Armed {scanner_name}")
+    sys.exit(0)
+
+def scan_in_process():
+    """Same scan as the scanimage call below, through libsane; SIGTERM or SCAN_TIMEOUT cancels it."""
+    import signal
+    import threading
+
+    buffer_size = int(buffer_kb) * 1024 if buffer_kb else sanebackend.READ_BUFFER
+    stopped = []   # why the scan was cancelled, if it ran out of time or was killed
+    with sanebackend.SaneScanner(scanner_name, buffer_size) as scanner:
+        def stop(why):
+            stopped.append(why)
+            scanner.cancel()
+
+        # A Python signal handler only runs once sane_read returns, which a hung
+        # scanner never does: keep SIGTERM (watchdog.kill_remote) blocked and
+        # take it on a thread of its own that cancels the scan right away
+        def wait_sigterm():
+            signal.sigwait({signal.SIGTERM})
+            stop("was killed by the console")
+
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        threading.Thread(target=wait_sigterm, daemon=True).start()
+        if scan_timeout:
+            timer = threading.Timer(scan_timeout, stop, [f"did not finish within {scan_timeout:.0f}s"])
+            timer.daemon = True
+            timer.start()
+        scanner.set_option("resolution", int(resolution))
+        scanner.set_option("mode", mode)
+        if scanner.has_option("source"):
+            scanner.set_option("source", source)
+        if geometry:
+            region = {var: float(os.environ.get(var) or 0) for var in ("SCAN_LEFT", "SCAN_TOP", "SCAN_WIDTH", "SCAN_HEIGHT")}
+            scanner.set_region(region["SCAN_LEFT"], region["SCAN_TOP"], region["SCAN_WIDTH"], region["SCAN_HEIGHT"])
+        try:
+            with open(output_file, "wb") as f:
+                sanebackend.scan_to_tiff(
+                    scanner, f,
+                    on_progress=lambda p: print(sanebackend.format_progress(p), flush=True),   # read by the console
+                )
+        except sanebackend.SaneError:
+            if stopped:
+                print(f"[{scanner_id}] Scan {stopped[0]}, libsane scan cancelled.")
+                sys.exit(SCAN_TIMEOUT_EXIT)
+            raise
+
 
 # Step 2: Run the scan
 try:
-    time.sleep(1)
-    with open(output_file, "wb") as f:
-        result = subprocess.run([
-            "scanimage",
-            "-d", scanner_name,
-            "--format=tiff",
-            "--resolution", "1200",
-            "--mode", "Color",
-            "--source", "Flatbed"
-        ], stdout=f, check=True)
-
-
-    if result.returncode != 0:
-        print(f"[{scanner_id}] Scan failed with code {result.returncode}")
-        sys.exit(result.returncode)
+    if not armed:
+        time.sleep(1)
+    scan_start = time.monotonic()
+    if backend == "sane":
+        scan_in_process()
+    else:
+        with open(output_file, "wb") as f:
+            result = subprocess.run([
+                "scanimage",
+                "-d", scanner_name,
+                "--format=tiff",
+                "--resolution", resolution,
+                "--mode", mode,
+                "--source", source
+            ] + geometry + ([f"--buffer-size={buffer_kb}"] if buffer_kb else []), stdout=f, check=True, timeout=scan_timeout)
+
+
+        if result.returncode != 0:
+            print(f"[{scanner_id}] Scan failed with code {result.returncode}")
+            sys.exit(result.returncode)
         
+except subprocess.TimeoutExpired:
+    # subprocess.run has already killed scanimage
+    print(f"[{scanner_id}] Scan did not finish within {scan_timeout:.0f}s, scanimage killed.")
+    sys.exit(SCAN_TIMEOUT_EXIT)
+
 except subprocess.CalledProcessError as e:
     print(f"[{scanner_id}] Scan failed: {e}")
     sys.exit(e.returncode)
 
 except Exception as e:
     print(f"[{scanner_id}] Exception during scan: {e}")
-    sys.exit(1)
\ No newline at end of file
+    sys.exit(1)
+
+# Timing for tune.py (the controller discards normal output)
+if os.environ.get("SCAN_STATS"):
+    print(f"SCAN_STATS bytes={os.path.getsize(output_file)} seconds={time.monotonic() - scan_start:.2f}")
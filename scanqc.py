@@ -0,0 +1,249 @@
+# Quick quality check for landed scans: catches the "no backlight" failure
+# (all-black image of the right size), blown-out/saturated scans and empty
+# platens. Samples strips through mmap so a 430 MB TIFF is checked in well
+# under a second. StreamingQC / monitor_remote_scan apply the same checks to
+# the first strips of a scan that is still being written on the VM, so a dark
+# scan can be aborted minutes before it would finish.
+#
+# Usage:
+#   python3 scanqc.py SCAN.tiff [...]
+
+import subprocess
+import sys
+import threading
+
+import numpy as np
+
+import tiffstrips
+import watchdog
+
+SAMPLE_STRIPS = 48    # evenly spaced bands of rows to read
+ROWS_PER_SAMPLE = 4   # rows read per band
+COL_STEP = 4          # read every Nth pixel within a row
+
+# Thresholds on 0-255 luminance
+DARK_MEAN = 25          # mean below this ...
+DARK_P99 = 60           # ... and almost nothing bright => lamp never came on
+SATURATED_FRACTION = 0.9  # this share of pixels at >= 250 => blown out
+EMPTY_STD = 3.0         # near-uniform image => nothing on the platen
+EMPTY_MEAN = 180
+
+# Streaming QC: decide from the top STREAM_FRACTION of the image
+STREAM_FRACTION = 0.05
+STREAM_MAX_HEADER = 64 * 1024  # no valid header within this many bytes => garbage
+STREAM_CHUNK = 1 << 20
+
+
+def luminance(pixels):
+    """(n, w, samples) uint8 -> (n, w) float32 luminance (Rec. 601 weights)."""
+    if pixels.shape[2] >= 3:
+        rgb = pixels[:, :, :3].astype(np.float32)
+        return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return pixels[:, :, 0].astype(np.float32)
+
+
+def analyze(pixels, photometric=2):
+    """
+    Compute luminance statistics + a 256-bin histogram over sampled pixels and
+    classify the scan. Returns a dict with "status" in
+    {"ok", "dark", "saturated", "empty"} and the numbers that led to it.
+    """
+    lum = luminance(pixels)
+    if photometric == 0:  # WhiteIsZero grayscale
+        lum = 255.0 - lum
+
+    flat = lum.ravel()
+    hist = np.bincount(flat.astype(np.uint8), minlength=256)
+    p1, p50, p99 = np.percentile(flat, [1, 50, 99])
+    stats = {
+        "mean": float(flat.mean()),
+        "std": float(flat.std()),
+        "p1": float(p1),
+        "p50": float(p50),
+        "p99": float(p99),
+        "saturated": float(hist[250:].sum() / flat.size),
+        "hist": hist,
+        "pixels": int(flat.size),
+    }
+
+    if stats["mean"] < DARK_MEAN and stats["p99"] < DARK_P99:
+        stats["status"] = "dark"
+    elif stats["saturated"] >= SATURATED_FRACTION:
+        stats["status"] = "saturated"
+    elif stats["std"] < EMPTY_STD and stats["mean"] > EMPTY_MEAN:
+        stats["status"] = "empty"
+    else:
+        stats["status"] = "ok"
+    return stats
+
+
+def sample_row_indices(height):
+    """Rows to read: SAMPLE_STRIPS evenly spaced bands of ROWS_PER_SAMPLE rows."""
+    bands = min(SAMPLE_STRIPS, max(1, height // ROWS_PER_SAMPLE))
+    starts = np.linspace(0, height - ROWS_PER_SAMPLE, bands).astype(int) if height > ROWS_PER_SAMPLE else [0]
+    rows = sorted({min(height - 1, s + k) for s in starts for k in range(ROWS_PER_SAMPLE)})
+    return rows
+
+
+def check_scan(path):
+    """QC a finished TIFF on disk. Returns the analyze() dict."""
+    f, mm, info = tiffstrips.open_mmap(path)
+    try:
+        pixels = tiffstrips.sample_rows(mm, info, sample_row_indices(info["height"]), col_step=COL_STEP)
+    finally:
+        mm.close()
+        f.close()
+    return analyze(pixels, info["photometric"])
+
+
+class StreamingQC:
+    """
+    Incremental QC over a TIFF that is still arriving. feed() it chunks in file
+    order; once the header is parsed it keeps only the rows it samples and
+    decides after the first STREAM_FRACTION of the image. `verdict` becomes
+    "ok", "dark" or "garbage" ("saturated"/"empty" are left to the full check,
+    the top of the platen alone is not enough to call those).
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.base = 0         # file offset of buf[0]
+        self.info = None
+        self.rows = []
+        self.next_row = 0
+        self.verdict = None
+        self.reason = ""
+        self.stats = None
+
+    def _start(self):
+        height = self.info["height"]
+        self.target_rows = min(height, max(ROWS_PER_SAMPLE, int(height * STREAM_FRACTION)))
+        self.row_step = max(1, self.target_rows // (SAMPLE_STRIPS * ROWS_PER_SAMPLE))
+
+    def feed(self, chunk):
+        """Consume more bytes; returns the verdict once decided, else None."""
+        if self.verdict is not None:
+            return self.verdict
+        self.buf += chunk
+
+        if self.info is None:
+            try:
+                self.info = tiffstrips.parse_header(self.buf)
+            except tiffstrips.TiffFormatError as e:
+                return self._decide("garbage", str(e))
+            if self.info is None:
+                if len(self.buf) > STREAM_MAX_HEADER:
+                    return self._decide("garbage", "no TIFF header in stream")
+                return None
+            if self.info["bits"] not in (8, 16):
+                return self._decide("ok", "unsupported bit depth, skipping stream QC")
+            self._start()
+
+        end_of_buf = self.base + len(self.buf)
+        while self.next_row < self.target_rows:
+            offset = tiffstrips.row_offset(self.info, self.next_row)
+            if offset + self.info["row_bytes"] > end_of_buf:
+                break
+            # copy() so no view into buf survives and it can be trimmed below
+            self.rows.append(tiffstrips.decode_row(self.buf, self.info, offset - self.base, COL_STEP).copy())
+            self.next_row += self.row_step
+
+        if self.next_row >= self.target_rows:
+            self.stats = analyze(np.stack(self.rows), self.info["photometric"])
+            if self.stats["status"] == "dark":
+                return self._decide("dark", describe(self.stats))
+            return self._decide("ok", "")
+
+        # Drop bytes we will never look at again
+        keep_from = tiffstrips.row_offset(self.info, self.next_row)
+        if keep_from > self.base:
+            del self.buf[:keep_from - self.base]
+            self.base = keep_from
+        return None
+
+    def _decide(self, verdict, reason):
+        self.verdict = verdict
+        self.reason = reason
+        self.buf = bytearray()
+        return verdict
+
+
+def monitor_remote_scan(ssh_base, remote_path, scan_proc):
+    """
+    Follow `remote_path` on the scanner's VM (`ssh_base` is the
+    ["ssh", ..., "user@ip"] prefix) while `scan_proc`, the ssh running
+    scan.py, is alive and feed it to StreamingQC. If the stream is clearly dark
+    or garbage, kill the remote scan so the scanner is free for a retry.
+    Returns the StreamingQC (verdict None if the scan ended before a decision).
+    """
+    qc = StreamingQC()
+    tail = subprocess.Popen(
+        # The remote tail is killed once scan.py is gone so it never lingers on the VM;
+        # [s]can.py keeps pgrep/pkill from matching this shell's own command line.
+        ssh_base + [
+            f"tail -c +1 -F '{remote_path}' 2>/dev/null & t=$!; sleep 3; "
+            f"while pgrep -f '[s]can.py' >/dev/null; do sleep 1; done; sleep 1; kill $t"
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    # tail -F never ends on its own: stop it when the scan does
+    def stop_tail_when_scan_exits():
+        scan_proc.wait()
+        tail.kill()
+
+    threading.Thread(target=stop_tail_when_scan_exits, daemon=True).start()
+
+    try:
+        while qc.verdict is None:
+            chunk = tail.stdout.read1(STREAM_CHUNK)
+            if not chunk:
+                break
+            qc.feed(chunk)
+    finally:
+        tail.kill()
+        tail.wait()
+
+    if qc.verdict in ("dark", "garbage"):
+        abort_remote_scan(ssh_base, remote_path, scan_proc)
+    return qc
+
+
+def abort_remote_scan(ssh_base, remote_path, scan_proc):
+    """Kill scan.py/scanimage on the VM and drop the partial file."""
+    watchdog.kill_remote(ssh_base, scan_proc, remote_path)
+
+
+def describe(stats):
+    """One-line operator message for a QC result."""
+    messages = {
+        "ok": "looks OK",
+        "dark": "DARK scan (backlight/lamp did not come on?) - rescan before removing the sample",
+        "saturated": "SATURATED scan (washed out) - check the lid/lamp and rescan",
+        "empty": "EMPTY platen (no sample detected) - check the sample is on the scanner",
+    }
+    return f"{messages[stats['status']]} (mean {stats['mean']:.0f}, std {stats['std']:.1f})"
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 scanqc.py SCAN.tiff [...]")
+        sys.exit(1)
+
+    bad = 0
+    for path in sys.argv[1:]:
+        try:
+            stats = check_scan(path)
+        except Exception as e:
+            print(f"{path}: could not check ({e})")
+            bad += 1
+            continue
+        if stats["status"] != "ok":
+            bad += 1
+        print(f"{path}: {describe(stats)}")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
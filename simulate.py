@@ -0,0 +1,353 @@
+# Offline discrete-event simulator for comparing scheduling policies before
+# trying them on the floor. Scan and transfer times are resampled from the
+# catalog's recorded jobs (per scanner, for one profile; scanners without
+# history borrow from the whole fleet), operator load time (swap the sample,
+# scan its QR) is drawn from a normal distribution since it is not recorded.
+#
+# Policies (add more to POLICIES):
+#   batch   batchconsole.py: each console loads all its scanners, then runs a
+#           staggered batch under the global batch lock, waits for every job,
+#           runs cleaner.sh and only then takes the next batch
+#   chunk4  colors_parallelscan.py: load every scanner, run them in chunks of
+#           --chunk sequentially, cleaner.sh at the end
+#   free    tui.py: the operator reloads whichever scanner finishes first, starts
+#           are only staggered, no batches, lock or cleaner between jobs
+#
+# Usage:
+#   python3 simulate.py [--scanners N] [--consoles N] [--hours H] [--runs R]
+#                       [--policies batch,chunk4,free] [--stagger S] [--cleaner S]
+#                       [--load MEAN,SD] [--chunk N] [--no-lock] [--profile NAME]
+
+import heapq
+import random
+import statistics
+import sys
+from collections import defaultdict
+
+import catalog
+import profiles
+
+DEFAULT_SCAN = (240.0, 10.0)      # seconds (mean, sd) when the catalog has no history
+DEFAULT_TRANSFER = (20.0, 3.0)
+DEFAULT_LOAD = (45.0, 15.0)       # operator: remove the last sample, place the next, scan its QR
+MIN_LOAD = 10.0
+
+
+# -------- Engine --------
+class Event:
+    """Something processes can wait for (yield event); fired once with succeed()."""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.fired = False
+        self.waiters = []
+
+    def succeed(self):
+        self.fired = True
+        for proc in self.waiters:
+            self.sim.resume(proc, 0)
+        self.waiters = []
+
+
+class Resource:
+    """FIFO mutex (the operator, the batch lock)."""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.holder = False
+        self.queue = []
+        self.busy_since = None
+        self.busy_time = 0.0
+
+    def request(self):
+        ev = Event(self.sim)
+        if not self.holder:
+            self.holder = True
+            self.busy_since = self.sim.now
+            ev.fired = True
+        else:
+            self.queue.append(ev)
+        return ev
+
+    def release(self):
+        self.busy_time += self.sim.now - self.busy_since
+        if self.queue:
+            self.busy_since = self.sim.now
+            self.queue.pop(0).succeed()
+        else:
+            self.holder = False
+
+
+class Sim:
+    """Processes are generators yielding a delay in seconds or an Event to wait for."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.heap = []
+        self.seq = 0
+
+    def process(self, gen):
+        self.resume(gen, 0)
+
+    def resume(self, gen, delay):
+        self.seq += 1
+        heapq.heappush(self.heap, (self.now + delay, self.seq, gen))
+
+    def all_of(self, events):
+        done = Event(self)
+        pending = [e for e in events if not e.fired]
+        if not pending:
+            done.fired = True
+            return done
+
+        def watcher():
+            for e in pending:
+                if not e.fired:
+                    yield e
+            done.succeed()
+        self.process(watcher())
+        return done
+
+    def run(self, until):
+        while self.heap and self.heap[0][0] <= until:
+            self.now, _, gen = heapq.heappop(self.heap)
+            try:
+                step = next(gen)
+            except StopIteration:
+                continue
+            if isinstance(step, Event):
+                if step.fired:
+                    self.resume(gen, 0)
+                else:
+                    step.waiters.append(gen)
+            else:
+                self.resume(gen, step)
+        self.now = until
+
+
+# -------- Timings --------
+class Timings:
+    """Per-scanner scan/transfer samples from the catalog plus the operator load distribution."""
+
+    def __init__(self, profile_name, load=DEFAULT_LOAD):
+        self.load = load
+        self.scan = defaultdict(list)
+        self.transfer = defaultdict(list)
+        conn = catalog.connect()
+        try:
+            rows = conn.execute(
+                "SELECT scanner_color, scan_seconds, transfer_seconds FROM scans "
+                "WHERE outcome = 'ok' AND profile = ? AND scan_seconds IS NOT NULL",
+                (profile_name,),
+            ).fetchall()
+        finally:
+            conn.close()
+        for row in rows:
+            self.scan[row["scanner_color"]].append(row["scan_seconds"])
+            if row["transfer_seconds"]:
+                self.transfer[row["scanner_color"]].append(row["transfer_seconds"])
+        self.pooled_scan = [v for vals in self.scan.values() for v in vals]
+        self.pooled_transfer = [v for vals in self.transfer.values() for v in vals]
+        self.colors = sorted(self.scan)
+
+    def describe(self):
+        if not self.pooled_scan:
+            return f"no recorded jobs, using scan {DEFAULT_SCAN[0]:.0f}±{DEFAULT_SCAN[1]:.0f}s, transfer {DEFAULT_TRANSFER[0]:.0f}±{DEFAULT_TRANSFER[1]:.0f}s"
+        return (f"{len(self.pooled_scan)} recorded jobs on {len(self.colors)} scanner(s), "
+                f"median scan {statistics.median(self.pooled_scan):.0f}s, "
+                f"transfer {statistics.median(self.pooled_transfer or [0]):.0f}s")
+
+    @staticmethod
+    def _draw(rng, own, pooled, default):
+        values = own or pooled
+        if values:
+            return rng.choice(values)
+        return max(1.0, rng.gauss(*default))
+
+    def scan_time(self, rng, i):
+        own = self.scan.get(self.colors[i % len(self.colors)]) if self.colors else None
+        return self._draw(rng, own, self.pooled_scan, DEFAULT_SCAN)
+
+    def transfer_time(self, rng, i):
+        own = self.transfer.get(self.colors[i % len(self.colors)]) if self.colors else None
+        return self._draw(rng, own, self.pooled_transfer, DEFAULT_TRANSFER)
+
+    def load_time(self, rng):
+        return max(MIN_LOAD, rng.gauss(*self.load))
+
+
+# -------- Shared model --------
+class Floor:
+    """Scanners, the operator and the bookkeeping every policy shares."""
+
+    def __init__(self, sim, timings, rng, params):
+        self.sim = sim
+        self.timings = timings
+        self.rng = rng
+        self.params = params
+        self.operator = Resource(sim)
+        self.lock = Resource(sim)
+        self.completed = 0
+        self.scan_busy = defaultdict(float)   # scanner -> seconds actually scanning
+        self.last_start = -1e9
+
+    def load(self):
+        """Operator swaps one sample (waits for the operator to be free)."""
+        yield self.operator.request()
+        yield self.timings.load_time(self.rng)
+        self.operator.release()
+
+    def stagger(self):
+        """Delay until STAGGER after the previous scanner start, fleet wide."""
+        start = max(self.sim.now, self.last_start + self.params["stagger"])
+        self.last_start = start
+        if start > self.sim.now:
+            yield start - self.sim.now
+
+    def job(self, i, done):
+        scan = self.timings.scan_time(self.rng, i)
+        yield scan
+        self.scan_busy[i] += scan
+        yield self.timings.transfer_time(self.rng, i)
+        self.completed += 1
+        done.succeed()
+
+    def start_job(self, i):
+        done = Event(self.sim)
+        self.sim.process(self.job(i, done))
+        return done
+
+
+# -------- Policies --------
+def policy_batch(floor, n):
+    """Per-console batches: load all, staggered start, wait for all, cleaner, under the global lock."""
+    consoles = max(1, min(floor.params["consoles"], n))
+    groups = [list(range(c, n, consoles)) for c in range(consoles)]
+
+    def console(scanners):
+        while True:
+            for _ in scanners:
+                yield from floor.load()
+            if floor.params["lock"]:
+                yield floor.lock.request()
+            jobs = []
+            for i in scanners:
+                jobs.append(floor.start_job(i))
+                yield floor.params["stagger"]
+            yield floor.sim.all_of(jobs)
+            yield floor.params["cleaner"]
+            if floor.params["lock"]:
+                floor.lock.release()
+
+    for g in groups:
+        floor.sim.process(console(g))
+
+
+def policy_chunk4(floor, n):
+    """Load every scanner, run them chunk by chunk, cleaner at the end."""
+    size = floor.params["chunk"]
+
+    def runner():
+        while True:
+            for _ in range(n):
+                yield from floor.load()
+            for c in range(0, n, size):
+                jobs = []
+                for i in range(c, min(n, c + size)):
+                    jobs.append(floor.start_job(i))
+                    yield floor.params["stagger"]
+                yield floor.sim.all_of(jobs)
+            yield floor.params["cleaner"]
+
+    floor.sim.process(runner())
+
+
+def policy_free(floor, n):
+    """Each scanner is reloaded as soon as it finishes; the operator serves them first come first served."""
+    def scanner(i):
+        while True:
+            yield from floor.load()
+            yield from floor.stagger()
+            yield floor.start_job(i)
+
+    for i in range(n):
+        floor.sim.process(scanner(i))
+
+
+POLICIES = {
+    "batch": policy_batch,
+    "chunk4": policy_chunk4,
+    "free": policy_free,
+}
+
+
+def simulate(policy, n, hours, timings, params, seed):
+    sim = Sim()
+    floor = Floor(sim, timings, random.Random(seed), params)
+    POLICIES[policy](floor, n)
+    horizon = hours * 3600
+    sim.run(horizon)
+    return {
+        "samples_per_hour": floor.completed / hours,
+        "scanner_util": sum(floor.scan_busy.values()) / (n * horizon),
+        "operator_util": (floor.operator.busy_time + (sim.now - floor.operator.busy_since if floor.operator.holder else 0)) / horizon,
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    opts = {
+        "--scanners": "8", "--consoles": "2", "--hours": "8", "--runs": "20",
+        "--policies": ",".join(POLICIES), "--stagger": "6", "--cleaner": "20",
+        "--load": f"{DEFAULT_LOAD[0]:.0f},{DEFAULT_LOAD[1]:.0f}", "--chunk": "4", "--profile": None,
+    }
+    for flag in list(opts):
+        if flag in args:
+            i = args.index(flag)
+            opts[flag] = args[i + 1]
+            del args[i:i + 2]
+    lock = "--no-lock" not in args
+    if not lock:
+        args.remove("--no-lock")
+
+    try:
+        if args:
+            raise ValueError(f"unexpected arguments {' '.join(args)}")
+        policies = opts["--policies"].split(",")
+        unknown = [p for p in policies if p not in POLICIES]
+        if unknown:
+            raise ValueError(f"unknown policy {', '.join(unknown)} (known: {', '.join(POLICIES)})")
+        profile = profiles.get(profiles.load(), opts["--profile"])
+        load = tuple(float(v) for v in opts["--load"].split(","))
+        if len(load) != 2:
+            raise ValueError("--load takes MEAN,SD in seconds")
+        n, runs, hours = int(opts["--scanners"]), int(opts["--runs"]), float(opts["--hours"])
+        params = {
+            "stagger": float(opts["--stagger"]),
+            "cleaner": float(opts["--cleaner"]),
+            "consoles": int(opts["--consoles"]),
+            "chunk": int(opts["--chunk"]),
+            "lock": lock,
+        }
+    except (ValueError, profiles.ProfileError) as e:
+        print(f"Error: {e}")
+        print("Usage: python3 simulate.py [--scanners N] [--consoles N] [--hours H] [--runs R] [--policies batch,chunk4,free]\n"
+              "                           [--stagger S] [--cleaner S] [--load MEAN,SD] [--chunk N] [--no-lock] [--profile NAME]")
+        sys.exit(1)
+
+    timings = Timings(profile["name"], load)
+    print(f"Profile {profile['name']}: {timings.describe()}")
+    print(f"{n} scanners, {hours:g} h shift, {runs} runs, stagger {params['stagger']:g}s, cleaner {params['cleaner']:g}s, "
+          f"operator load {load[0]:g}±{load[1]:g}s, batch lock {'on' if lock else 'off'}")
+    print(f"{'policy':<8} {'samples/h':>14} {'scanner util':>13} {'operator util':>14}")
+    for policy in policies:
+        results = [simulate(policy, n, hours, timings, params, seed) for seed in range(runs)]
+        rate = [r["samples_per_hour"] for r in results]
+        spread = statistics.stdev(rate) if len(rate) > 1 else 0.0
+        util = statistics.mean(r["scanner_util"] for r in results)
+        operator = statistics.mean(r["operator_util"] for r in results)
+        print(f"{policy:<8} {statistics.mean(rate):8.1f} ±{spread:4.1f} {util:>12.0%} {operator:>13.0%}")
+
+
+if __name__ == "__main__":
+    main()
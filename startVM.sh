@@ -1,24 +1,22 @@
 #!/bin/bash
 error_flag=0
 
-# List of VM names to start
-VM_NAMES=(
-  scanner-1-BLUE
-  scanner-2-ORANGE
-  scanner-3-GRAY
-  scanner-4-GREEN
-  scanner-5-WHITE
-  scanner-6-BLACK
-  scanner-7-YELLOW
-  scanner-8-CRIMSON
-)
+HERE="$(dirname "$(readlink -f "$0")")"
+
+# VM names to start and the libvirt URI of the host each one lives on, from topology.json
+VM_NAMES=()
+declare -A VM_URI
+while IFS=$'\t' read -r vm uri; do
+  VM_NAMES+=("$vm")
+  VM_URI[$vm]="$uri"
+done < <(python3 "$HERE/topology.py" vms)
 
 echo "Starting all VMs, please hold..."
 echo ""
 
 for vm in "${VM_NAMES[@]}"; do
   echo "Starting $vm..."
-  virsh start "$vm" >/dev/null 2>&1
+  virsh -c "${VM_URI[$vm]}" start "$vm" >/dev/null 2>&1
 
   if [[ $? -eq 0 ]]; then
     echo "   $vm started."
@@ -0,0 +1,341 @@
+# Tiered scan storage. Scans land on a fast staging volume and a background
+# mover migrates verified files to the archive (a NAS mount, or any local
+# directory standing in for one), so ingest never waits on the archive disk.
+#
+# Both tiers use the same <date>/<Color>/<QR>.tiff layout. Settings come from
+# storage.json next to this script (override with SEEDSCAN_STORAGE):
+#   {
+#     "staging": "/mnt/fast/SeedScans",   # where consoles write (default ~/SeedScans)
+#     "archive": "/mnt/nas/SeedScans",    # where the mover puts them (unset = no mover)
+#     "bandwidth_mb_s": 80,               # copy rate limit, 0 = unlimited
+#     "min_age_s": 600,                   # leave fresh scans for previews/QC first
+#     "retries": 5,                       # attempts per file before it is skipped
+#     "min_free_gb": 5,                   # staging space never handed out to scans
+#     "write_buffer_mb": 4,               # receive.py: write size for incoming scans
+#     "fsync": "close",                   # receive.py: close | interval | none
+#     "fsync_interval_mb": 64             # receive.py: fdatasync period for "interval"
+#   }
+#
+# Before a scanner starts, the console reserves the job's expected size
+# (profiles.expected_size) against free space on the staging filesystem
+# (SpaceReservations, shared by all consoles through the catalog), so a full
+# disk stops new scans instead of failing the copy of scans that are already
+# done.
+#
+# The catalog is the mover's queue: every good scan whose path is still under
+# the staging root is copied (rate-limited, hashed on the way), checked against
+# the sha256 recorded at ingest (or records it, for scans that have none),
+# renamed into place, re-pointed in the catalog and only then removed from
+# staging.
+#
+# Usage:
+#   python3 storage.py mover [--once]    # run the archive mover (launch.sh starts it)
+#   python3 storage.py status            # what is waiting to be archived
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sys
+import time
+from pathlib import Path
+
+import catalog
+
+STORAGE_PATH = Path(os.environ.get("SEEDSCAN_STORAGE", Path(__file__).resolve().with_name("storage.json")))
+MOVER_LOCK = "/tmp/seedscan_mover.lock"
+
+DEFAULTS = {
+    "staging": str(Path.home() / "SeedScans"),
+    "archive": None,
+    "bandwidth_mb_s": 0,
+    "min_age_s": 600,
+    "retries": 5,
+    "min_free_gb": 5,
+}
+COPY_CHUNK = 8 * 1024 * 1024
+POLL_INTERVAL = 30          # seconds between catalog sweeps
+RETRY_BASE_DELAY = 30       # seconds, doubled after every failed attempt
+
+
+class StorageError(ValueError):
+    pass
+
+
+def load(path: Path = None) -> dict:
+    path = Path(path or STORAGE_PATH)
+    config = dict(DEFAULTS)
+    if path.exists():
+        try:
+            with open(path) as f:
+                config.update(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            raise StorageError(f"could not read storage settings {path}: {e}")
+    config["staging"] = Path(config["staging"]).expanduser()
+    config["archive"] = Path(config["archive"]).expanduser() if config["archive"] else None
+    if config["archive"] and config["archive"].resolve() == config["staging"].resolve():
+        raise StorageError(f"{path}: staging and archive are the same directory")
+    return config
+
+
+def staging_root(config: dict = None) -> Path:
+    return (config or load())["staging"]
+
+
+def day_dir(date_str: str, config: dict = None) -> Path:
+    """Staging folder scans for this date are written to."""
+    return staging_root(config) / date_str
+
+
+# -------- Space admission --------
+OWNER_HOST = socket.gethostname()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SpaceReservations:
+    """
+    Bytes promised to running jobs on the staging filesystem. A job is only
+    admitted if free space minus everything already reserved minus the
+    min_free_gb floor still covers it. Reservations live in the catalog's
+    reservations table, so every console on this PC (launch.sh --panes)
+    counts the others' jobs too; those of a console that is gone are ignored.
+    A reservation shrinks as receive.py allocates the file, which already
+    shows in the free space.
+    """
+
+    def __init__(self, root: Path, min_free_bytes: int):
+        self.root = Path(root)
+        self.min_free_bytes = min_free_bytes
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.root).free
+
+    def _reserved(self, conn) -> int:
+        """Bytes reserved on this PC's staging root; drops what crashed consoles left behind."""
+        rows = conn.execute(
+            "SELECT owner_pid, nbytes FROM reservations WHERE owner_host = ? AND root = ?",
+            (OWNER_HOST, str(self.root)),
+        ).fetchall()
+        dead = {r["owner_pid"] for r in rows if not _alive(r["owner_pid"])}
+        if dead:
+            conn.executemany("DELETE FROM reservations WHERE owner_host = ? AND owner_pid = ?",
+                             [(OWNER_HOST, pid) for pid in dead])
+        return sum(r["nbytes"] for r in rows if r["owner_pid"] not in dead)
+
+    def available(self) -> int:
+        conn = catalog.connect()
+        try:
+            with conn:
+                return self.free_bytes() - self._reserved(conn) - self.min_free_bytes
+        finally:
+            conn.close()
+
+    def reserve(self, key, nbytes: int) -> bool:
+        conn = catalog.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")   # no other console between the check and the insert
+            ok = self.free_bytes() - self._reserved(conn) - self.min_free_bytes >= nbytes
+            if ok:
+                conn.execute(
+                    "INSERT OR REPLACE INTO reservations (owner_host, owner_pid, job, root, nbytes, reserved_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (OWNER_HOST, os.getpid(), str(key), str(self.root), nbytes, time.time()),
+                )
+            conn.commit()
+            return ok
+        finally:
+            conn.close()
+
+    def allocated(self, key, nbytes: int):
+        """nbytes of the job's file now take up disk space (receive.py), so they are no longer promised."""
+        conn = catalog.connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE reservations SET nbytes = MAX(nbytes - ?, 0) WHERE owner_host = ? AND owner_pid = ? AND job = ?",
+                    (nbytes, OWNER_HOST, os.getpid(), str(key)),
+                )
+        finally:
+            conn.close()
+
+    def release(self, key):
+        conn = catalog.connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM reservations WHERE owner_host = ? AND owner_pid = ? AND job = ?",
+                    (OWNER_HOST, os.getpid(), str(key)),
+                )
+        finally:
+            conn.close()
+
+
+# -------- Mover --------
+def copy_limited(src: Path, dst: Path, bandwidth_mb_s: float) -> str:
+    """Copy src to dst at most bandwidth_mb_s (0 = unlimited), fsync it, return the sha256."""
+    h = hashlib.sha256()
+    limit = bandwidth_mb_s * 1e6
+    start = time.monotonic()
+    copied = 0
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            chunk = fin.read(COPY_CHUNK)
+            if not chunk:
+                break
+            fout.write(chunk)
+            h.update(chunk)
+            copied += len(chunk)
+            if limit:
+                ahead = copied / limit - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+        fout.flush()
+        os.fsync(fout.fileno())
+    return h.hexdigest()
+
+
+def archive_file(staged: Path, sha256: str, config: dict):
+    """Move one verified scan from staging to the archive; returns (new path, its sha256)."""
+    rel = staged.relative_to(config["staging"])
+    final = config["archive"] / rel
+    final.parent.mkdir(parents=True, exist_ok=True)
+    tmp = final.with_name(f".{final.name}.part")
+    try:
+        # the bytes written are the bytes hashed, and the copy is fsynced; reading
+        # it back would mostly hit the page cache and double the archive I/O
+        copied_hash = copy_limited(staged, tmp, config["bandwidth_mb_s"])
+        if sha256 and copied_hash != sha256:
+            raise StorageError(f"{staged} no longer matches the sha256 recorded at ingest")
+        os.replace(tmp, final)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return final, copied_hash
+
+
+def move_previews(staged: Path, final: Path):
+    """Best effort: previews (preview.py) follow their scan to the archive."""
+    for p in (staged.parent / "previews").glob(f"{staged.stem}.*"):
+        try:
+            (final.parent / "previews").mkdir(exist_ok=True)
+            shutil.move(str(p), final.parent / "previews" / p.name)
+        except OSError as e:
+            print(f"[Mover] Could not move preview {p.name}: {e}")
+
+
+def pending(config: dict, conn):
+    """[(staged_path, sha256)] of good scans still on the staging volume, oldest first."""
+    root = str(config["staging"]).rstrip("/") + "/"
+    cutoff = time.time() - config["min_age_s"]
+    rows = conn.execute(
+        "SELECT path, sha256, MAX(finished_at) AS finished_at FROM scans "
+        f"WHERE outcome IN ({', '.join('?' * len(catalog.DONE_OUTCOMES))}) AND path LIKE ? "
+        "GROUP BY path HAVING finished_at < ? ORDER BY finished_at",
+        (*catalog.DONE_OUTCOMES, root + "%", cutoff),
+    ).fetchall()
+    # LIKE treats "_" in the root as a wildcard, so re-check the prefix
+    return [
+        (Path(r["path"]), r["sha256"]) for r in rows
+        if r["path"].startswith(root) and os.path.exists(r["path"])
+    ]
+
+
+class Mover:
+    """Archive mover loop with per-file retry and exponential backoff."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.failures = {}   # staged path -> (attempts, next_try_at)
+
+    def sweep(self):
+        moved = 0
+        conn = catalog.connect()
+        try:
+            for staged, sha256 in pending(self.config, conn):
+                attempts, next_try = self.failures.get(staged, (0, 0))
+                if attempts >= self.config["retries"] or time.time() < next_try:
+                    continue
+                try:
+                    final, copied_hash = archive_file(staged, sha256, self.config)
+                except (OSError, StorageError) as e:
+                    attempts += 1
+                    delay = RETRY_BASE_DELAY * 2 ** (attempts - 1)
+                    self.failures[staged] = (attempts, time.time() + delay)
+                    giving_up = " giving up" if attempts >= self.config["retries"] else f" retry in {delay}s"
+                    print(f"[Mover] {staged.name}: {e} (attempt {attempts},{giving_up})")
+                    continue
+                with conn:
+                    conn.execute(
+                        "UPDATE scans SET path = ?, archived_at = ?, sha256 = COALESCE(sha256, ?) WHERE path = ?",
+                        (str(final), time.time(), copied_hash, str(staged)),
+                    )
+                staged.unlink()
+                self.failures.pop(staged, None)
+                move_previews(staged, final)
+                moved += 1
+                print(f"[Mover] {staged.name} -> {final.parent}")
+        finally:
+            conn.close()
+        return moved
+
+    def run(self, once: bool = False):
+        while True:
+            self.sweep()
+            if once:
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ("mover", "status"):
+        print("Usage: python3 storage.py mover [--once] | status")
+        sys.exit(1)
+
+    try:
+        config = load()
+    except StorageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args[0] == "status":
+        conn = catalog.connect()
+        try:
+            todo = pending(dict(config, min_age_s=0), conn)
+        finally:
+            conn.close()
+        size = sum(p.stat().st_size for p, _ in todo)
+        print(f"staging {config['staging']}  archive {config['archive'] or '(none)'}")
+        print(f"{len(todo)} scans ({size / 1e9:.1f} GB) waiting to be archived")
+        return
+
+    if config["archive"] is None:
+        print(f"No archive configured in {STORAGE_PATH}, nothing to move.")
+        return
+    lock_fh = open(MOVER_LOCK, "w")
+    try:
+        fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("Another archive mover is already running.")
+        sys.exit(1)
+    limit = f"{config['bandwidth_mb_s']} MB/s" if config["bandwidth_mb_s"] else "unlimited"
+    print(f"[Mover] {config['staging']} -> {config['archive']} ({limit})")
+    try:
+        Mover(config).run(once="--once" in args)
+    except KeyboardInterrupt:
+        print("\n[Mover] Stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+import catalog
+
+
+@pytest.fixture(autouse=True)
+def tmp_catalog(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalog, "CATALOG_PATH", tmp_path / "catalog.sqlite3")
+
+
+def scan(qr, outcome="ok", qc_status=None):
+    catalog.record_scan({"qr": qr, "scanner_color": "Blue", "scan_date": "2026-10-19", "outcome": outcome,
+                         "qc_status": qc_status, "finished_at": time.time()})
+
+
+# -------- Duplicate detection --------
+def test_good_scan_blocks_a_rescan():
+    scan("{A}{1}")
+    scan("{B}{2}", qc_status="ok")
+    index = catalog.ScannedIndex().refresh()
+    assert "already scanned" in index.check("{A}{1}")
+    assert "already scanned" in index.check("{B}{2}")
+
+
+def test_qc_failed_scan_does_not_block_its_rescan():
+    index = catalog.ScannedIndex().refresh()
+    for qr, status in (("{A}{1}", "dark"), ("{B}{2}", "saturated"), ("{C}{3}", "empty")):
+        scan(qr, qc_status=status)
+    scan("{D}{4}", outcome="scan_failed")
+    index.refresh()
+    assert all(index.check(qr) is None for qr in ("{A}{1}", "{B}{2}", "{C}{3}", "{D}{4}"))
+
+    scan("{A}{1}", qc_status="ok")   # the rescan
+    assert "already scanned" in index.refresh().check("{A}{1}")
+
+
+def test_in_flight_claims():
+    catalog.claim([("Blue", "{A}{1}")])
+    assert "being scanned" in catalog.ScannedIndex().refresh().check("{A}{1}")
+    catalog.release(["{A}{1}"])
+    assert catalog.ScannedIndex().refresh().check("{A}{1}") is None
@@ -0,0 +1,125 @@
+from pathlib import Path
+
+import pytest
+
+import catalog
+import power
+import recovery
+import usbmap
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "usb"
+
+BLUE = {"num": 1, "color": "Blue", "vm": "scanner-1-BLUE", "host": "scan-host-1",
+        "usb_port": "1-2.3", "usb_serial": None, "scan_backend": "scanimage"}
+
+
+def make_topo(driver="uhubctl", command=None, **scanner):
+    return {
+        "hosts": {"scan-host-1": {"address": "localhost", "libvirt_uri": "qemu:///system"}},
+        "scanners": [{**BLUE, **scanner}],
+        "power": {"driver": driver, "command": command, "off_seconds": 0, "settle": 5},
+        "recovery": {"auto": True, "restart_vm": False, "cooldown": 300},
+    }
+
+
+# -------- Drivers --------
+def test_uhubctl_argv():
+    d = power.Uhubctl(make_topo(), "scan-host-1", ["sudo", "uhubctl"])
+    assert d.argv("1-2", 3, "off") == ["sudo", "uhubctl", "-l", "1-2", "-p", "3", "-a", "off"]
+    assert power.Uhubctl(make_topo(), "scan-host-1").command == ["uhubctl"]
+
+
+def test_command_argv_substitutes_hub_port_action():
+    d = power.Command(make_topo(), "scan-host-1", ["relay", "--hub={hub}", "{port}", "set-{action}"])
+    assert d.argv("1-2", 3, "on") == ["relay", "--hub=1-2", "3", "set-on"]
+
+
+def test_command_driver_needs_a_command():
+    with pytest.raises(power.PowerError):
+        power.Command(make_topo(), "scan-host-1", None)
+
+
+def test_driver_is_abstract():
+    with pytest.raises(TypeError):
+        power.Driver(make_topo(), "scan-host-1", ["x"])
+
+
+def test_unknown_driver():
+    topo = make_topo(driver="bogus")
+    with pytest.raises(power.PowerError):
+        power.driver(topo, topo["scanners"][0])
+
+
+# -------- Ports --------
+def test_hub_port():
+    assert power.hub_port("1-2.3") == ("1-2", 3)
+    assert power.hub_port("1-4") == ("1", 4)
+    assert power.hub_port("2-1.4.2") == ("2-1.4", 2)
+    for bad in ("weird", "1-", "1-2.x"):
+        with pytest.raises(power.PowerError):
+            power.hub_port(bad)
+
+
+def test_power_port_opt_out_and_override():
+    topo = make_topo()
+    assert power.enabled(topo, topo["scanners"][0])
+    assert power.port_of({**BLUE, "power_port": "3-1.2"}) == ("3-1", 2)
+    opted_out = {**BLUE, "power_port": False}
+    assert power.port_of(opted_out) is None
+    assert not power.enabled(topo, opted_out)
+    assert not power.enabled(make_topo(driver=None), BLUE)
+    assert not power.enabled(topo, {**BLUE, "usb_port": None})
+
+
+# -------- Recovery sequence with a fake hub --------
+class FakeFleet:
+    """usbmap.run stand-in: a VM whose V39 drops off USB until its hub port is power-cycled."""
+
+    def __init__(self):
+        self.calls = []
+        self.powered = False
+
+    def run(self, argv, check=True):
+        self.calls.append(argv)
+        if argv[0] == "uhubctl" and argv[-1] == "on":
+            self.powered = True
+        if argv[0] == "virsh" and argv[3] == "dumpxml":
+            return (FIXTURES / "dumpxml_blue.xml").read_text()
+        if argv[0] == "virsh" and argv[3] == "domstate":
+            return "running\n"
+        return ""
+
+    def host_devices(self, topo, host):
+        return [{"bus": 1, "device": 12, "port": "1-2.3", "serial": None}] if self.powered else []
+
+
+def test_recovery_power_cycles_when_reattach_fails(monkeypatch, tmp_path):
+    fleet = FakeFleet()
+    monkeypatch.setattr(usbmap, "run", fleet.run)
+    monkeypatch.setattr(usbmap, "host_devices", fleet.host_devices)
+    monkeypatch.setattr(recovery, "stop", lambda topo, s: (True, "leftover scan.py/scanimage killed"))
+    monkeypatch.setattr(recovery, "verify", lambda topo, s: (fleet.powered, "Armed" if fleet.powered else "No scanner found."))
+    monkeypatch.setattr(recovery, "SETTLE", 0)
+    monkeypatch.setattr(catalog, "CATALOG_PATH", tmp_path / "catalog.sqlite3")
+
+    topo = make_topo()
+    ok, steps = recovery.recover(topo, topo["scanners"][0], trigger="scan_failed", log=lambda msg: None)
+
+    assert ok
+    assert [(st["step"], st["ok"]) for st in steps] == [
+        ("stop", True), ("reattach", False), ("power", True), ("reattach", True), ("verify", True),
+    ]
+    assert ["uhubctl", "-l", "1-2", "-p", "3", "-a", "off"] in fleet.calls
+    attach = [c for c in fleet.calls if c[:4] == ["virsh", "-c", "qemu:///system", "attach-device"]]
+    assert len(attach) == 1 and "--live" in attach[0]
+
+    conn = catalog.connect()
+    try:
+        rows = conn.execute("SELECT scanner_color, trigger, step, ok FROM recoveries ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    assert [tuple(r) for r in rows] == [
+        ("Blue", "scan_failed", "stop", 1), ("Blue", "scan_failed", "reattach", 0),
+        ("Blue", "scan_failed", "power", 1), ("Blue", "scan_failed", "reattach", 1),
+        ("Blue", "scan_failed", "verify", 1),
+    ]
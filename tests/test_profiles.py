@@ -0,0 +1,21 @@
+import os
+
+import profiles
+
+
+def test_manifest_is_read_again_only_when_it_changes(monkeypatch, tmp_path):
+    path = tmp_path / "manifest.csv"
+    manifest = profiles.Manifest(path)
+    assert manifest.get() == {}
+
+    path.write_text("qr,profile\nQR1,gray600\n")
+    assert manifest.get() == {"QR1": "gray600"}
+    reads = []
+    monkeypatch.setattr(profiles, "load_manifest", lambda p: reads.append(p) or {"QR1": "color1200"})
+    assert manifest.get() == {"QR1": "gray600"} and reads == []
+
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert manifest.get() == {"QR1": "color1200"} and reads == [path]
+    path.unlink()
+    assert manifest.get() == {}
@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+import receive
+
+OPTS = {"buffer_bytes": 64 * 1024, "fsync": "none", "fsync_interval": 0}
+
+
+def test_write_stream_reports_the_preallocation(tmp_path):
+    allocated = []
+    size = receive.write_stream(receive.PatternSource(300 * 1024), tmp_path / "a.part", 300 * 1024, OPTS,
+                                on_allocated=allocated.append)
+    assert size == 300 * 1024
+    assert allocated == [300 * 1024]
+    assert os.path.getsize(tmp_path / "a.part") == size
+
+
+def test_write_stream_without_fallocate_reports_each_write(monkeypatch, tmp_path):
+    def no_fallocate(fd, offset, length):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(os, "posix_fallocate", no_fallocate)
+    allocated = []
+    receive.write_stream(receive.PatternSource(200 * 1024), tmp_path / "a.part", 200 * 1024, OPTS,
+                         on_allocated=allocated.append)
+    assert sum(allocated) == 200 * 1024 and len(allocated) == 4
+
+
+def test_write_stream_past_the_expected_size(tmp_path):
+    allocated = []
+    receive.write_stream(receive.PatternSource(200 * 1024), tmp_path / "a.part", 100 * 1024, OPTS,
+                         on_allocated=allocated.append)
+    assert allocated[0] == 100 * 1024 and sum(allocated) == 200 * 1024
+
+
+def test_write_stream_hashes_what_it_writes(tmp_path):
+    digest = hashlib.sha256()
+    receive.write_stream(receive.PatternSource(300 * 1024 + 5), tmp_path / "a.part", 300 * 1024, OPTS, digest=digest)
+    assert digest.hexdigest() == hashlib.sha256((tmp_path / "a.part").read_bytes()).hexdigest()
@@ -0,0 +1,53 @@
+import pytest
+
+import sanebackend
+import tiffstrips
+
+
+def test_progress_round_trip():
+    line = sanebackend.format_progress({"bytes": 1234, "total": 5000, "rate": 2.5e6})
+    assert sanebackend.parse_progress(line + "\n") == (1234, 5000)
+    assert sanebackend.parse_progress("[vm] Scan failed: x") is None
+    assert sanebackend.parse_progress("SCAN_STATS bytes=1 seconds=2") is None
+
+
+# -------- Against SANE's "test" backend (skipped without libsane) --------
+@pytest.fixture
+def test_device():
+    try:
+        sanebackend.lib()
+        scanner = sanebackend.SaneScanner("test:0", 64 * 1024)
+    except (OSError, sanebackend.SaneError) as e:
+        pytest.skip(f"no libsane test backend: {e}")
+    with scanner:
+        yield scanner
+
+
+@pytest.mark.parametrize("mode, samples", [("Color", 3), ("Gray", 1)])
+def test_scan_to_tiff_on_the_test_device(test_device, tmp_path, mode, samples):
+    test_device.set_option("resolution", 75)
+    test_device.set_option("mode", mode)
+    assert test_device.has_option("tl-x")
+    test_device.set_region(0, 0, 50, 30)
+    reports = []
+    path = tmp_path / "test.tiff"
+    with open(path, "wb") as out:
+        progress = sanebackend.scan_to_tiff(test_device, out, on_progress=lambda p: reports.append(dict(p)))
+
+    f, mm, info = tiffstrips.open_mmap(path)
+    try:
+        assert info["samples"] == samples and info["bits"] == 8
+        assert tiffstrips.image_bytes(info) == progress["bytes"] == progress["total"]
+        assert len(mm) == tiffstrips.row_offset(info, 0) + progress["bytes"]
+    finally:
+        mm.close()
+        f.close()
+    assert reports[-1]["bytes"] == progress["bytes"]
+
+
+def test_cancel_on_the_test_device(test_device, tmp_path):
+    test_device.set_option("resolution", 75)
+    test_device.cancel()
+    with open(tmp_path / "test.tiff", "wb") as out, pytest.raises(sanebackend.SaneError) as e:
+        sanebackend.scan_to_tiff(test_device, out)
+    assert e.value.status == sanebackend.SANE_STATUS_CANCELLED
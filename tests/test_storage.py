@@ -0,0 +1,114 @@
+import hashlib
+import os
+import socket
+import subprocess
+import time
+
+import pytest
+
+import catalog
+import storage
+
+GB = 10 ** 9
+
+
+@pytest.fixture
+def space(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalog, "CATALOG_PATH", tmp_path / "catalog.sqlite3")
+    monkeypatch.setattr(storage.SpaceReservations, "free_bytes", lambda self: 10 * GB)
+    return storage.SpaceReservations(tmp_path, 1 * GB)
+
+
+def other_console(pid, job, root, nbytes):
+    """A reservation written by another console process on this PC."""
+    conn = catalog.connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO reservations (owner_host, owner_pid, job, root, nbytes, reserved_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (socket.gethostname(), pid, job, str(root), nbytes, time.time()),
+            )
+    finally:
+        conn.close()
+
+
+# -------- Space admission --------
+def test_reserve_and_release(space):
+    assert space.available() == 9 * GB
+    assert space.reserve(1, 5 * GB)
+    assert space.available() == 4 * GB
+    assert not space.reserve(2, 5 * GB)
+    space.release(1)
+    assert space.reserve(2, 5 * GB)
+
+
+def test_other_consoles_reservations_count(space, tmp_path):
+    sleeper = subprocess.Popen(["sleep", "30"])
+    try:
+        other_console(sleeper.pid, "1", tmp_path, 6 * GB)
+        other_console(sleeper.pid, "2", tmp_path / "elsewhere", 6 * GB)   # another staging root
+        assert space.available() == 3 * GB
+        assert not space.reserve(1, 4 * GB)
+        space.release(1)   # our own key 1, not theirs
+        assert space.available() == 3 * GB
+    finally:
+        sleeper.kill()
+        sleeper.wait()
+
+
+def test_crashed_console_is_ignored(space, tmp_path):
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    other_console(dead.pid, "1", tmp_path, 6 * GB)
+    assert space.reserve(1, 8 * GB)
+    conn = catalog.connect()
+    try:
+        assert [r["owner_pid"] for r in conn.execute("SELECT owner_pid FROM reservations")] == [os.getpid()]
+    finally:
+        conn.close()
+
+
+def test_allocated_shrinks_the_reservation(space):
+    assert space.reserve(1, 5 * GB)
+    space.allocated(1, 2 * GB)
+    assert space.available() == 6 * GB
+    space.allocated(1, 4 * GB)
+    assert space.available() == 9 * GB
+
+
+# -------- Mover --------
+def test_mover_records_a_missing_sha256(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalog, "CATALOG_PATH", tmp_path / "catalog.sqlite3")
+    config = {"staging": tmp_path / "staging", "archive": tmp_path / "archive", "bandwidth_mb_s": 0,
+              "min_age_s": 0, "retries": 1}
+    staged = config["staging"] / "2026-10-19" / "Blue" / "QR1.tiff"
+    staged.parent.mkdir(parents=True)
+    staged.write_bytes(b"II*\0" + bytes(1000))
+    catalog.record_scan({"qr": "QR1", "path": str(staged), "outcome": "ok", "finished_at": time.time() - 1})
+
+    assert storage.Mover(config).sweep() == 1
+    final = config["archive"] / "2026-10-19" / "Blue" / "QR1.tiff"
+    conn = catalog.connect()
+    try:
+        row = conn.execute("SELECT path, sha256 FROM scans").fetchone()
+    finally:
+        conn.close()
+    assert row["path"] == str(final) and not staged.exists()
+    assert row["sha256"] == catalog.file_sha256(final)
+
+
+def test_mover_reads_each_scan_once_and_checks_the_recorded_sha256(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalog, "CATALOG_PATH", tmp_path / "catalog.sqlite3")
+    monkeypatch.setattr(catalog, "file_sha256", lambda path: pytest.fail("archive copy read back"))
+    config = {"staging": tmp_path / "staging", "archive": tmp_path / "archive", "bandwidth_mb_s": 0,
+              "min_age_s": 0, "retries": 1}
+    staged = config["staging"] / "2026-10-19" / "Blue" / "QR1.tiff"
+    staged.parent.mkdir(parents=True)
+    staged.write_bytes(b"II*\0" + bytes(1000))
+    with pytest.raises(storage.StorageError, match="no longer matches"):
+        storage.archive_file(staged, "0" * 64, config)
+    assert not (config["archive"] / "2026-10-19" / "Blue" / ".QR1.tiff.part").exists()
+
+    good = hashlib.sha256(staged.read_bytes()).hexdigest()
+    final, copied = storage.archive_file(staged, good, config)
+    assert copied == good and final.read_bytes() == staged.read_bytes()
@@ -0,0 +1,98 @@
+import struct
+
+import pytest
+
+import sanebackend
+import tiffstrips
+
+
+def ifd_entries(header):
+    """{tag: (type, count)} straight from the first IFD."""
+    bo = "<" if header[:2] == b"II" else ">"
+    (ifd,) = struct.unpack(bo + "I", header[4:8])
+    (n,) = struct.unpack(bo + "H", header[ifd:ifd + 2])
+    entries = {}
+    for i in range(n):
+        tag, ftype, count = struct.unpack(bo + "HHI", header[ifd + 2 + i * 12:ifd + 10 + i * 12])
+        entries[tag] = (ftype, count)
+    return entries
+
+
+# -------- build_header --------
+@pytest.mark.parametrize("byteorder", ["<", ">"])
+@pytest.mark.parametrize("bits, samples, photometric", [(8, 3, 2), (16, 3, 2), (8, 1, 1), (16, 1, 1), (1, 1, 0)])
+def test_build_header_round_trip(byteorder, bits, samples, photometric):
+    header = tiffstrips.build_header(101, 7, bits, samples, byteorder)
+    info = tiffstrips.parse_header(header)
+    assert (info["width"], info["height"], info["bits"], info["samples"]) == (101, 7, bits, samples)
+    assert info["photometric"] == photometric
+    assert info["strip_offsets"] == [len(header)]   # pixel data follows right after
+    assert info["strip_counts"] == [7 * info["row_bytes"]]
+    assert info["row_bytes"] == (101 * samples * bits + 7) // 8
+
+
+def test_bits_per_sample_has_one_value_per_sample():
+    header = tiffstrips.build_header(10, 2, 8, 3)
+    assert ifd_entries(header)[tiffstrips.TAG_BITS] == (3, 3)
+    assert ifd_entries(tiffstrips.build_header(10, 2, 8, 1))[tiffstrips.TAG_BITS] == (3, 1)
+
+
+def test_build_header_opens_in_pil(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "rgb.tiff"
+    pixels = bytes(range(256)) * (5 * 4 * 3 // 256 + 1)
+    path.write_bytes(tiffstrips.build_header(5, 4, 8, 3) + pixels[:5 * 4 * 3])
+    with Image.open(path) as im:
+        assert im.mode == "RGB" and im.size == (5, 4)
+        assert im.getpixel((1, 0)) == (3, 4, 5)
+
+
+# -------- scan_to_tiff --------
+class FakeScanner:
+    """SaneScanner stand-in that yields one frame in a few chunks."""
+
+    def __init__(self, width, lines, depth, fmt):
+        samples = 3 if fmt == sanebackend.SANE_FRAME_RGB else 1
+        self.params = sanebackend.SANE_Parameters(
+            format=fmt, last_frame=1, bytes_per_line=width * samples * depth // 8,
+            pixels_per_line=width, lines=lines, depth=depth,
+        )
+        self.data = bytes(i % 251 for i in range(self.params.bytes_per_line * lines))
+
+    def scan(self, sink, on_start=None, on_progress=None):
+        on_start(self.params)
+        view = memoryview(self.data)
+        for i in range(0, len(self.data), 1000):
+            sink(view[i:i + 1000])
+        progress = {"bytes": len(self.data), "total": len(self.data)}
+        if on_progress:
+            on_progress(progress)
+        return progress
+
+
+@pytest.mark.parametrize("fmt, depth", [(sanebackend.SANE_FRAME_RGB, 8), (sanebackend.SANE_FRAME_RGB, 16),
+                                        (sanebackend.SANE_FRAME_GRAY, 8)])
+def test_scan_to_tiff(tmp_path, fmt, depth):
+    scanner = FakeScanner(60, 40, depth, fmt)
+    path = tmp_path / "scan.tiff"
+    with open(path, "wb") as out:
+        progress = sanebackend.scan_to_tiff(scanner, out)
+    assert progress["bytes"] == len(scanner.data)
+
+    f, mm, info = tiffstrips.open_mmap(path)
+    try:
+        assert (info["width"], info["height"], info["bits"]) == (60, 40, depth)
+        assert info["samples"] == (3 if fmt == sanebackend.SANE_FRAME_RGB else 1)
+        assert tiffstrips.image_bytes(info) == len(scanner.data)
+        start = tiffstrips.row_offset(info, 0)
+        assert mm[start:] == scanner.data
+    finally:
+        mm.close()
+        f.close()
+
+
+def test_scan_to_tiff_needs_the_line_count(tmp_path):
+    scanner = FakeScanner(60, 40, 8, sanebackend.SANE_FRAME_GRAY)
+    scanner.params.lines = -1
+    with open(tmp_path / "scan.tiff", "wb") as out, pytest.raises(sanebackend.SaneError):
+        sanebackend.scan_to_tiff(scanner, out)
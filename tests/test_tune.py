@@ -0,0 +1,70 @@
+import subprocess
+
+import pytest
+
+import topology
+import tune
+import watchdog
+
+TUNING = {
+    "Blue": {"buffer_size": 256, "backend": "scanimage"},
+    "Orange": {"buffer_size": 512, "backend": "sane"},
+    "Gray": {"buffer_size": 128},   # tuned before the backend was recorded
+    "Green": {"buffer_size": None, "backend": "scanimage"},
+}
+
+
+def test_scan_env_only_for_the_backend_it_was_tuned_with():
+    assert tune.scan_env("Blue", "scanimage", TUNING) == "SCAN_BUFFER_SIZE=256"
+    assert tune.scan_env("Blue", "sane", TUNING) == ""
+    assert tune.scan_env("Orange", "sane", TUNING) == "SCAN_BUFFER_SIZE=512"
+    assert tune.scan_env("Orange", "scanimage", TUNING) == ""
+    assert tune.scan_env("Gray", "sane", TUNING) == "SCAN_BUFFER_SIZE=128"
+    assert tune.scan_env("Green", "scanimage", TUNING) == ""
+    assert tune.scan_env("Purple", "scanimage", TUNING) == ""
+
+
+# -------- run_trial against a local stand-in for the VM --------
+SCANNER = {"color": "Blue", "scan_backend": "scanimage"}
+PROFILE = {"name": "test", "resolution": 75, "mode": "Gray"}
+
+
+@pytest.fixture
+def vm(monkeypatch, tmp_path):
+    """`python3 ~/scan.py` runs tmp_path/scan.py through a local shell instead of ssh."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(topology, "ssh_cmd", lambda topo, scanner, cmd=None: ["sh", "-c"] + ([cmd] if cmd else []))
+    monkeypatch.setattr(tune.profiles, "scan_env", lambda profile, region: "")
+    killed = []
+
+    def kill_remote(ssh_base, proc=None, remote_path=None):
+        killed.append(remote_path)
+        subprocess.run(["pkill", "-f", str(tmp_path / "scan.py")])   # what the pkill on the VM does
+        watchdog.stop(proc, grace=1)
+
+    monkeypatch.setattr(watchdog, "kill_remote", kill_remote)
+    return tmp_path, killed
+
+
+def test_run_trial_reads_scan_stats(vm):
+    home, _ = vm
+    (home / "scan.py").write_text('print("PROGRESS 5 10 1.00MB/s")\nprint("SCAN_STATS bytes=1000000 seconds=2.00")\n')
+    trial = tune.run_trial({}, SCANNER, PROFILE, None, 128)
+    assert trial == {"bytes": 1000000, "seconds": 2.0, "rate": 500000.0}
+
+
+def test_run_trial_reports_a_failed_scan(vm):
+    home, _ = vm
+    (home / "scan.py").write_text('import sys\nprint("PROGRESS 5 10 1.00MB/s")\nprint("[vm] No scanner found.")\nsys.exit(1)\n')
+    with pytest.raises(RuntimeError, match="exit 1.*No scanner found"):
+        tune.run_trial({}, SCANNER, PROFILE, None, None)
+
+
+def test_run_trial_hung_scan_is_killed(vm, monkeypatch):
+    home, killed = vm
+    (home / "scan.py").write_text("import time\ntime.sleep(60)\n")
+    monkeypatch.setattr(watchdog, "deadlines", lambda profile, region: {"discovery": 0.5, "scan": 0.5})
+    monkeypatch.setattr(watchdog, "BACKSTOP", 0)
+    with pytest.raises(RuntimeError, match="remote scan killed"):
+        tune.run_trial({}, SCANNER, PROFILE, None, None)
+    assert killed == ["/output/tune.tiff"]
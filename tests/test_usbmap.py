@@ -0,0 +1,129 @@
+import shlex
+from pathlib import Path
+
+import pytest
+
+import usbmap
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "usb"
+
+
+def fixture(name):
+    return (FIXTURES / name).read_text()
+
+
+def make_topo(*pins):
+    """One scanner per (color, vm, usb_port, usb_serial), all on this PC."""
+    return {
+        "hosts": {"scan-host-1": {"address": "localhost", "libvirt_uri": "qemu:///system"}},
+        "scanners": [
+            {"num": i, "color": color, "vm": vm, "host": "scan-host-1", "usb_port": port, "usb_serial": serial}
+            for i, (color, vm, port, serial) in enumerate(pins, start=1)
+        ],
+    }
+
+
+def fake_run(argv, check=True):
+    """Recorded output for the commands usbmap runs."""
+    if argv[0] == "lsusb":
+        if argv[1:] == ["-t"]:
+            return fixture("lsusb_t.txt")
+        if argv[1:2] == ["-v"]:
+            return fixture(f"lsusb_v_{int(argv[3].split(':')[1]):03d}.txt")
+        return fixture("lsusb.txt")
+    if argv[0] == "virsh" and argv[3] == "dumpxml":
+        return fixture(f"dumpxml_{argv[5].split('-')[-1].lower()}.xml")
+    raise AssertionError(f"unexpected command {argv}")
+
+
+@pytest.fixture(autouse=True)
+def recorded(monkeypatch):
+    monkeypatch.setattr(usbmap, "run", fake_run)
+
+
+# -------- Parsers --------
+def test_parse_lsusb_keeps_only_v39s():
+    assert usbmap.parse_lsusb(fixture("lsusb.txt")) == [(1, 11), (1, 9), (1, 5)]
+
+
+def test_parse_lsusb_tree_port_paths():
+    ports = usbmap.parse_lsusb_tree(fixture("lsusb_t.txt"))
+    assert ports[(1, 5)] == "1-2.1"
+    assert ports[(1, 11)] == "1-2.3"
+    assert ports[(1, 9)] == "1-4"
+    assert ports[(1, 3)] == "1-2"
+
+
+def test_parse_lsusb_tree_old_format():
+    assert usbmap.parse_lsusb_tree(fixture("lsusb_t_old.txt"))[(1, 5)] == "1-2.1"
+
+
+def test_parse_serial():
+    assert usbmap.parse_serial(fixture("lsusb_v_005.txt")) == "A1B2C3"
+    assert usbmap.parse_serial(fixture("lsusb_v_noserial.txt")) is None
+
+
+def test_vm_hostdevs_only_v39_usb():
+    topo = make_topo(("Blue", "scanner-1-BLUE", None, None), ("Green", "scanner-4-GREEN", None, None))
+    hostdevs = usbmap.vm_hostdevs(topo, topo["scanners"][0])
+    assert [(bus, dev) for bus, dev, _ in hostdevs] == [(1, 7)]
+    assert "address bus=\"1\" device=\"7\"" in hostdevs[0][2]
+    assert usbmap.vm_hostdevs(topo, topo["scanners"][1]) == []
+
+
+def test_host_devices():
+    devices = usbmap.host_devices(make_topo(), "scan-host-1")
+    assert {(d["device"], d["port"], d["serial"]) for d in devices} == {
+        (5, "1-2.1", "A1B2C3"), (9, "1-4", "SHARED01"), (11, "1-2.3", "SHARED01"),
+    }
+
+
+# -------- Matching --------
+def test_find_device_shared_serial_falls_back_to_port():
+    devices = usbmap.host_devices(make_topo(), "scan-host-1")
+    by_both = {"usb_serial": "SHARED01", "usb_port": "1-4"}
+    assert usbmap.find_device(devices, by_both)["device"] == 9
+    assert usbmap.find_device(devices, {"usb_serial": "SHARED01", "usb_port": None}) is None
+    assert usbmap.find_device(devices, {"usb_serial": "A1B2C3", "usb_port": "1-4"})["device"] == 5
+
+
+# -------- Plan --------
+def steps_by_color(topo):
+    return {st["scanner"]["color"]: st for st in usbmap.plan(topo)}
+
+
+def test_plan_reenumerated_device():
+    # Blue's VM still points at 001:007; its scanner came back as 001:011 on the same port
+    steps = steps_by_color(make_topo(("Blue", "scanner-1-BLUE", "1-2.3", None)))
+    assert steps["Blue"]["change"]
+    assert (steps["Blue"]["target"]["bus"], steps["Blue"]["target"]["device"]) == (1, 11)
+
+
+def test_plan_swapped_scanners():
+    # Orange's VM has 005 but is pinned to port 1-4 (009); Gray has 009 but is pinned to 1-2.1 (005)
+    steps = steps_by_color(make_topo(
+        ("Orange", "scanner-2-ORANGE", "1-4", None),
+        ("Gray", "scanner-3-GRAY", "1-2.1", None),
+    ))
+    assert steps["Orange"]["change"] and steps["Orange"]["target"]["device"] == 9
+    assert steps["Gray"]["change"] and steps["Gray"]["target"]["device"] == 5
+
+
+def test_plan_ok_unpinned_and_missing():
+    steps = steps_by_color(make_topo(
+        ("Orange", "scanner-2-ORANGE", None, "A1B2C3"),
+        ("Gray", "scanner-3-GRAY", None, None),
+        ("Green", "scanner-4-GREEN", "3-1", None),
+    ))
+    assert not steps["Orange"]["change"] and steps["Orange"]["problem"] is None
+    assert "not pinned" in steps["Gray"]["problem"]
+    assert "no V39" in steps["Green"]["problem"] and steps["Green"]["target"] is None
+
+
+# -------- Remote hosts --------
+def test_host_argv_quotes_for_the_remote_shell():
+    topo = {"hosts": {"far": {"address": "10.0.0.2", "user": "scan"}}}
+    argv = usbmap.host_argv(topo, "far", ["lsusb", "-v", "-s", "1:5", "it's"])
+    assert argv[-2] == "scan@10.0.0.2"
+    assert shlex.split(argv[-1]) == ["lsusb", "-v", "-s", "1:5", "it's"]
+    assert usbmap.host_argv(make_topo(), "scan-host-1", ["lsusb"]) == ["lsusb"]
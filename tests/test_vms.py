@@ -0,0 +1,59 @@
+import pytest
+
+import recovery
+import usbmap
+import vms
+
+BLUE = {"num": 1, "color": "Blue", "vm": "scanner-1-BLUE", "host": "scan-host-1"}
+
+
+class FakeVm:
+    def __init__(self):
+        self.running = False
+        self.boots = 0
+
+    def boot(self, topo, scanner, trigger="job"):
+        self.boots += 1
+        self.running = True
+        return True
+
+
+@pytest.fixture
+def vm(monkeypatch):
+    fake = FakeVm()
+    monkeypatch.setattr(vms, "boot", fake.boot)
+    monkeypatch.setattr(usbmap, "is_running", lambda topo, scanner: fake.running)
+    monkeypatch.setattr(recovery, "reachable", lambda topo, scanner: fake.running)
+    return fake
+
+
+def make_keeper(lazy=True):
+    topo = {"scanners": [BLUE], "vms": {"lazy": lazy, "idle_shutdown": 0}}
+    return vms.VmKeeper(topo, log=lambda msg: None)
+
+
+def test_ensure_boots_once(vm):
+    keeper = make_keeper()
+    assert keeper.ensure(BLUE) and keeper.ensure(BLUE)
+    assert vm.boots == 1
+
+
+def test_ensure_boots_again_after_the_vm_went_down(vm):
+    keeper = make_keeper()
+    assert keeper.ensure(BLUE)
+    vm.running = False   # shut down behind the keeper's back (closeVM.sh, a crash)
+    assert keeper.ensure(BLUE)
+    assert vm.boots == 2
+
+
+def test_forget(vm):
+    keeper = make_keeper()
+    keeper.ensure(BLUE)
+    keeper.forget(BLUE)
+    assert keeper.ready == set()
+    assert keeper.ensure(BLUE) and vm.boots == 1   # still up: found, not booted
+
+
+def test_not_lazy_does_nothing(vm):
+    assert make_keeper(lazy=False).ensure(BLUE)
+    assert vm.boots == 0
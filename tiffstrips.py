@@ -0,0 +1,204 @@
+# Minimal reader for the uncompressed, strip-based TIFFs that scanimage writes.
+# Only parses the first IFD and never loads the pixel data; callers get row
+# offsets into a memory map so a 430 MB scan can be sampled a strip at a time.
+
+import mmap
+import struct
+
+# TIFF tag ids we care about
+TAG_WIDTH = 256
+TAG_LENGTH = 257
+TAG_BITS = 258
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_COUNTS = 279
+
+# TIFF field type -> (struct code, size in bytes)
+FIELD_TYPES = {
+    1: ("B", 1),  # BYTE
+    3: ("H", 2),  # SHORT
+    4: ("I", 4),  # LONG
+}
+
+
+class TiffFormatError(ValueError):
+    pass
+
+
+def parse_header(buf):
+    """
+    Parse the TIFF header + first IFD from the start of `buf` (bytes or mmap).
+    Returns a dict describing the image layout, or None if `buf` is too short
+    to hold the full IFD yet (useful while the file is still streaming in).
+    Raises TiffFormatError for anything that is not a plain uncompressed TIFF.
+    """
+    if len(buf) < 8:
+        return None
+
+    order = bytes(buf[:2])
+    if order == b"II":
+        bo = "<"
+    elif order == b"MM":
+        bo = ">"
+    else:
+        raise TiffFormatError("not a TIFF (bad byte order mark)")
+
+    magic, ifd_offset = struct.unpack(bo + "HI", buf[2:8])
+    if magic != 42:
+        raise TiffFormatError("not a TIFF (bad magic)")
+
+    if len(buf) < ifd_offset + 2:
+        return None
+    (n_entries,) = struct.unpack(bo + "H", buf[ifd_offset:ifd_offset + 2])
+    ifd_end = ifd_offset + 2 + n_entries * 12
+    if len(buf) < ifd_end:
+        return None
+
+    tags = {}
+    for i in range(n_entries):
+        entry = ifd_offset + 2 + i * 12
+        tag, ftype, count = struct.unpack(bo + "HHI", buf[entry:entry + 8])
+        if ftype not in FIELD_TYPES:
+            continue
+        code, size = FIELD_TYPES[ftype]
+        if count * size <= 4:
+            data_at = entry + 8
+        else:
+            (data_at,) = struct.unpack(bo + "I", buf[entry + 8:entry + 12])
+        if len(buf) < data_at + count * size:
+            return None
+        tags[tag] = list(struct.unpack(bo + code * count, buf[data_at:data_at + count * size]))
+
+    for required in (TAG_WIDTH, TAG_LENGTH, TAG_STRIP_OFFSETS):
+        if required not in tags:
+            raise TiffFormatError(f"missing required TIFF tag {required}")
+    if tags.get(TAG_COMPRESSION, [1])[0] != 1:
+        raise TiffFormatError("compressed TIFFs are not supported")
+
+    width = tags[TAG_WIDTH][0]
+    height = tags[TAG_LENGTH][0]
+    bits = tags.get(TAG_BITS, [1])[0]
+    samples = tags.get(TAG_SAMPLES, [1])[0]
+    rows_per_strip = tags.get(TAG_ROWS_PER_STRIP, [height])[0] or height
+    row_bytes = (width * samples * bits + 7) // 8
+
+    return {
+        "byteorder": bo,
+        "width": width,
+        "height": height,
+        "bits": bits,
+        "samples": samples,
+        "photometric": tags.get(TAG_PHOTOMETRIC, [1])[0],
+        "rows_per_strip": min(rows_per_strip, height),
+        "row_bytes": row_bytes,
+        "strip_offsets": tags[TAG_STRIP_OFFSETS],
+        "strip_counts": tags.get(TAG_STRIP_COUNTS, [height * row_bytes]),
+        "header_bytes": ifd_end,
+    }
+
+
+def build_header(width, height, bits, samples, byteorder="<"):
+    """
+    Header + IFD for a single-strip uncompressed TIFF whose pixel data follows
+    immediately, the same layout scanimage writes. Lets a writer stream rows
+    straight after it without knowing anything but the frame size.
+    """
+    photometric = 2 if samples >= 3 else (0 if bits == 1 else 1)  # RGB / WhiteIsZero lineart / BlackIsZero
+    row_bytes = (width * samples * bits + 7) // 8
+    entries = [
+        (TAG_WIDTH, 4, [width]),
+        (TAG_LENGTH, 4, [height]),
+        (TAG_BITS, 3, [bits] * samples),   # one per sample, same depth for all
+        (TAG_COMPRESSION, 3, [1]),
+        (TAG_PHOTOMETRIC, 3, [photometric]),
+        (TAG_STRIP_OFFSETS, 4, [0]),       # patched below
+        (TAG_SAMPLES, 3, [samples]),
+        (TAG_ROWS_PER_STRIP, 4, [height]),
+        (TAG_STRIP_COUNTS, 4, [row_bytes * height]),
+    ]
+    # values that don't fit in their 4-byte entry go between the IFD and the pixel data
+    ifd_end = 8 + 2 + len(entries) * 12 + 4
+    data_offset = ifd_end + sum(
+        len(values) * FIELD_TYPES[ftype][1] for _, ftype, values in entries
+        if len(values) * FIELD_TYPES[ftype][1] > 4
+    )
+
+    out = (b"II" if byteorder == "<" else b"MM") + struct.pack(byteorder + "HI", 42, 8)
+    out += struct.pack(byteorder + "H", len(entries))
+    extra = b""
+    for tag, ftype, values in entries:
+        if tag == TAG_STRIP_OFFSETS:
+            values = [data_offset]
+        packed = struct.pack(byteorder + FIELD_TYPES[ftype][0] * len(values), *values)
+        if len(packed) > 4:
+            out += struct.pack(byteorder + "HHII", tag, ftype, len(values), ifd_end + len(extra))
+            extra += packed
+        else:
+            out += struct.pack(byteorder + "HHI", tag, ftype, len(values)) + packed.ljust(4, b"\0")
+    out += struct.pack(byteorder + "I", 0)  # no next IFD
+    return out + extra
+
+
+def row_offset(info, row):
+    """Byte offset of image row `row` within the file."""
+    strip, within = divmod(row, info["rows_per_strip"])
+    return info["strip_offsets"][strip] + within * info["row_bytes"]
+
+
+def image_bytes(info):
+    """Total bytes of pixel data described by the header."""
+    return info["height"] * info["row_bytes"]
+
+
+def open_mmap(path):
+    """Map a finished TIFF read-only. Returns (file, mmap, info); caller closes both."""
+    f = open(path, "rb")
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+    try:
+        info = parse_header(mm)
+        if info is None:
+            raise TiffFormatError("truncated TIFF header")
+        last = row_offset(info, info["height"] - 1) + info["row_bytes"]
+        if last > len(mm):
+            raise TiffFormatError(f"truncated TIFF ({len(mm)} B, expected {last} B)")
+    except Exception:
+        mm.close()
+        f.close()
+        raise
+    return f, mm, info
+
+
+def decode_row(buf, info, offset, col_step=1):
+    """
+    Decode the row starting at byte `offset` of `buf` into a NumPy array of
+    shape (width // col_step, samples), scaled to uint8.
+    """
+    import numpy as np
+
+    if info["bits"] not in (8, 16):
+        raise TiffFormatError(f"{info['bits']}-bit samples are not supported")
+    dtype = np.dtype(info["byteorder"] + ("u1" if info["bits"] == 8 else "u2"))
+    line = np.frombuffer(buf, dtype=dtype, count=info["width"] * info["samples"], offset=offset)
+    line = line.reshape(info["width"], info["samples"])[::col_step]
+    return line if info["bits"] == 8 else (line >> 8).astype(np.uint8)
+
+
+def sample_rows(buf, info, rows, col_step=1):
+    """
+    Gather the given image rows from `buf` (usually an mmap) as a NumPy array of
+    shape (len(rows), width // col_step, samples), scaled to uint8. Only the
+    requested rows are touched, so memory use stays proportional to the sample.
+    """
+    import numpy as np
+
+    out = np.empty((len(rows), len(range(0, info["width"], col_step)), info["samples"]), dtype=np.uint8)
+    for i, row in enumerate(rows):
+        out[i] = decode_row(buf, info, row_offset(info, row), col_step)
+    return out
@@ -0,0 +1,232 @@
+# Fleet topology: the single description of which scanners exist, their color,
+# VM, IP, host PC and USB controller. Every controller and shell script loads
+# this instead of keeping its own copy of the tables.
+#
+# The file is topology.json next to this script (override with SEEDSCAN_TOPOLOGY).
+# Hosts other than "localhost" are reached by jumping through them with ssh
+# (ssh -J), and their VMs are managed with that host's libvirt_uri, so one
+# controller can drive scanners spread over several PCs.
+#
+# USB contention only matters between scanners on the same host controller or
+# hub, so scanner starts are staggered and limited per USB bus rather than
+# fleet wide. A scanner's bus is host/controller[/hub]: from sysfs when its
+# "usb_port" (e.g. "1-2.3", see /sys/bus/usb/devices) is set and the host is
+# this PC, else from its "usb_controller". The optional "usb" section sets the
+# limits:
+#   "usb": {"stagger": 6, "max_scanning": 0,                 # defaults, 0 = no limit
+#           "buses": {"scan-host-1/0000:00:14.0": {"max_scanning": 4}}}
+# "usb_port" and "usb_serial" also pin each scanner to its VM (usbmap.py), and
+# "usb_port" (or "power_port") is the hub port power.py switches.
+#
+# Shell usage (one record per line, tab separated):
+#   python3 topology.py ips [--console N]       # ip, ssh jump host ("" if local)
+#   python3 topology.py vms [--console N]       # vm name, libvirt uri
+#   python3 topology.py consoles                # console numbers
+#   python3 topology.py check                   # validate and summarise
+#   python3 topology.py usb                     # usb bus, stagger, limit, scanners
+
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+TOPOLOGY_PATH = Path(os.environ.get("SEEDSCAN_TOPOLOGY", Path(__file__).resolve().with_name("topology.json")))
+LOCAL_ADDRESSES = ("localhost", "127.0.0.1", "")
+
+REQUIRED_SCANNER_KEYS = ("num", "color", "vm", "ip", "host")
+USB_DEFAULTS = {"stagger": 6, "max_scanning": 0}
+RECOVERY_DEFAULTS = {"auto": True, "restart_vm": True, "cooldown": 300}   # see recovery.py
+POWER_DEFAULTS = {"driver": None, "command": None, "off_seconds": 5, "settle": 30}   # see power.py
+VM_DEFAULTS = {"lazy": False, "idle_shutdown": 1800}   # see vms.py
+SYSFS_USB = Path("/sys/bus/usb/devices")
+# Give up on an unreachable VM after 10 s, and on a dead link after ~60 s of
+# unanswered keepalives, instead of letting ssh hang forever (see watchdog.py)
+SSH_OPTIONS = ["-o", "ConnectTimeout=10", "-o", "ServerAliveInterval=15", "-o", "ServerAliveCountMax=4"]
+
+
+class TopologyError(ValueError):
+    pass
+
+
+def load(path: Path = None) -> dict:
+    """Read and validate the topology file."""
+    path = Path(path or TOPOLOGY_PATH)
+    try:
+        with open(path) as f:
+            topo = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise TopologyError(f"could not read topology {path}: {e}")
+
+    topo.setdefault("ssh_user", "seedscanner")
+    topo.setdefault("hosts", {})
+    topo.setdefault("consoles", {})
+    topo["usb"] = {**USB_DEFAULTS, "buses": {}, **topo.get("usb", {})}
+    topo["recovery"] = {**RECOVERY_DEFAULTS, **topo.get("recovery", {})}
+    topo["power"] = {**POWER_DEFAULTS, **topo.get("power", {})}
+    topo["vms"] = {**VM_DEFAULTS, **topo.get("vms", {})}
+    scanners = topo.get("scanners") or []
+    if not scanners:
+        raise TopologyError(f"{path}: no scanners defined")
+
+    seen = {"num": set(), "color": set(), "vm": set(), "ip": set()}
+    for s in scanners:
+        missing = [k for k in REQUIRED_SCANNER_KEYS if k not in s]
+        if missing:
+            raise TopologyError(f"{path}: scanner {s} is missing {', '.join(missing)}")
+        if s["host"] not in topo["hosts"]:
+            raise TopologyError(f"{path}: scanner {s['color']} refers to unknown host '{s['host']}'")
+        for key in seen:
+            value = s[key].upper() if key == "color" else s[key]
+            if value in seen[key]:
+                raise TopologyError(f"{path}: duplicate scanner {key} '{s[key]}'")
+            seen[key].add(value)
+        s.setdefault("console", 1)
+        s.setdefault("usb_controller", None)
+        s.setdefault("scan_backend", "scanimage")
+        s.setdefault("usb_port", None)
+        s.setdefault("usb_serial", None)
+
+    topo["scanners"] = sorted(scanners, key=lambda s: s["num"])
+    return topo
+
+
+# -------- Lookups --------
+def scanners(topo: dict, console: int = None, host: str = None):
+    return [
+        s for s in topo["scanners"]
+        if (console is None or s["console"] == console) and (host is None or s["host"] == host)
+    ]
+
+
+def by_num(topo: dict, console: int = None) -> dict:
+    return {s["num"]: s for s in scanners(topo, console)}
+
+
+def vm_ips(topo: dict, console: int = None) -> dict:
+    """{scanner_num: ip}, the old VM_IPS table."""
+    return {s["num"]: s["ip"] for s in scanners(topo, console)}
+
+
+def vm_colors(topo: dict, console: int = None) -> dict:
+    """{scanner_num: color}, the old VM_Colors table."""
+    return {s["num"]: s["color"] for s in scanners(topo, console)}
+
+
+def color_to_num(topo: dict, console: int = None) -> dict:
+    """{"Blue": 1, ...}, the old COLOR_TO_SCANNER_NUM table."""
+    return {s["color"]: s["num"] for s in scanners(topo, console)}
+
+
+def consoles(topo: dict):
+    return sorted({s["console"] for s in topo["scanners"]})
+
+
+def console_options(topo: dict, console: int) -> dict:
+    return topo["consoles"].get(str(console), {})
+
+
+# -------- Reaching a scanner --------
+def jump_host(topo: dict, scanner: dict) -> str:
+    """user@address to ssh -J through, or "" when the VM is on this PC."""
+    host = topo["hosts"][scanner["host"]]
+    address = host.get("address", "")
+    if address in LOCAL_ADDRESSES:
+        return ""
+    return f"{host['user']}@{address}" if host.get("user") else address
+
+
+def ssh_dest(topo: dict, scanner: dict) -> str:
+    return f"{topo['ssh_user']}@{scanner['ip']}"
+
+
+def ssh_cmd(topo: dict, scanner: dict, *remote):
+    """["ssh", SSH_OPTIONS, ("-J", jump), user@ip, *remote]"""
+    jump = jump_host(topo, scanner)
+    return ["ssh"] + SSH_OPTIONS + (["-J", jump] if jump else []) + [ssh_dest(topo, scanner)] + list(remote)
+
+
+def scp_from_cmd(topo: dict, scanner: dict, remote_path: str, local_path):
+    """scp a file off the scanner's VM (through its host if needed)."""
+    jump = jump_host(topo, scanner)
+    return ["scp", "-q"] + SSH_OPTIONS + (["-J", jump] if jump else []) + [f"{ssh_dest(topo, scanner)}:{remote_path}", str(local_path)]
+
+
+def libvirt_uri(topo: dict, scanner: dict) -> str:
+    return topo["hosts"][scanner["host"]].get("libvirt_uri", "qemu:///system")
+
+
+# -------- USB buses --------
+def usb_sysfs(port: str):
+    """(controller PCI address, parent hub port or None) for a local USB port like "1-2.3"."""
+    path = SYSFS_USB / port
+    if not path.exists():
+        return None, None
+    pci = re.findall(r"[0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-7]", str(path.resolve()))
+    hub = port.rsplit(".", 1)[0] if "." in port else None
+    return (pci[-1] if pci else None), hub
+
+
+def usb_bus(topo: dict, scanner: dict) -> str:
+    """The bus a scanner competes on for bandwidth: host/controller[/hub]."""
+    controller, hub = scanner.get("usb_controller"), None
+    if scanner.get("usb_port") and not jump_host(topo, scanner):
+        found, hub = usb_sysfs(scanner["usb_port"])
+        controller = found or controller
+    bus = f"{scanner['host']}/{controller or 'unknown-controller'}"
+    return f"{bus}/{hub}" if hub else bus
+
+
+def usb_limits(topo: dict, bus: str) -> dict:
+    """{"stagger": s, "max_scanning": n} for a bus; a hub bus inherits its controller's entry."""
+    buses = topo["usb"]["buses"]
+    controller = "/".join(bus.split("/")[:2])
+    return {
+        key: buses.get(bus, {}).get(key, buses.get(controller, {}).get(key, topo["usb"][key]))
+        for key in USB_DEFAULTS
+    }
+
+
+# -------- CLI for the shell scripts --------
+def main():
+    args = sys.argv[1:]
+    console = None
+    if "--console" in args:
+        i = args.index("--console")
+        console = int(args[i + 1])
+        del args[i:i + 2]
+
+    if len(args) != 1 or args[0] not in ("ips", "vms", "consoles", "check", "usb"):
+        print("Usage: python3 topology.py ips|vms|consoles|check|usb [--console N]", file=sys.stderr)
+        sys.exit(2)
+
+    try:
+        topo = load()
+    except TopologyError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args[0] == "ips":
+        for s in scanners(topo, console):
+            print(f"{s['ip']}\t{jump_host(topo, s)}")
+    elif args[0] == "vms":
+        for s in scanners(topo, console):
+            print(f"{s['vm']}\t{libvirt_uri(topo, s)}")
+    elif args[0] == "consoles":
+        for c in consoles(topo):
+            print(c)
+    elif args[0] == "usb":
+        buses = {}
+        for s in scanners(topo, console):
+            buses.setdefault(usb_bus(topo, s), []).append(s["color"])
+        for bus, colors in sorted(buses.items()):
+            lim = usb_limits(topo, bus)
+            print(f"{bus}\t{lim['stagger']}\t{lim['max_scanning'] or '-'}\t{','.join(colors)}")
+    else:
+        print(f"{TOPOLOGY_PATH}: {len(topo['scanners'])} scanners on {len(topo['hosts'])} host(s)")
+        for s in topo["scanners"]:
+            print(f"  {s['num']:>3} {s['color']:<10} {s['vm']:<20} {s['ip']:<16} usb={usb_bus(topo, s)} console={s['console']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# Live console for the whole fleet in one process, replacing the per-console
+# tmux panes of batchconsole.py. Every scanner gets a status row (phase, QR,
+# bytes, MB/s, ETA, health) and a single prompt feeds whichever scanner is
+# free. The header names the scanner to load next, the one that has been idle
+# longest (i.e. finished first); a QR typed without a color goes there.
+#
+# At the prompt:
+#   '{QR}'                   the "load next" scanner
+#   COLOR '{QR}'             that scanner, if idle (COLOR:profile '{QR}' picks a profile)
+#   !<entry>                 scan even though the QR was scanned before
+#   quit                     leave (once every scanner is idle)
+#   Ctrl-C                   leave now: asks first, then kills the running
+#                            scans and records them as interrupted (rescan)
+#
+# The batch lock is taken when a job starts on an idle fleet and released
+# once every scanner is idle again, so batchconsole.py can run in between.
+#
+# An entry starts as soon as its closing quote is read, so a barcode gun can
+# scan pair after pair without Enter in between.
+#
+# Usage:
+#   python3 tui.py [--profile NAME]
+
+import collections
+import curses
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import batchconsole as bc
+import profiles
+import topology
+import watchdog
+
+SIZE_POLL = 5          # seconds between remote file size checks while scanning
+SPACE_POLL = 5         # seconds between staging free space checks for the header
+STALL_SECONDS = 90     # no new bytes for this long while scanning/transferring = stalled
+REFRESH = 0.25         # screen refresh / input poll interval
+LOG_LINES = 500
+
+PAIR_ENTRY = re.compile(r"\s*!?\s*(?:[A-Za-z]+(?::[\w-]+)?)?\s*'[^']+'\s*")   # one complete entry
+ACTIVE_PHASES = ("starting", "waiting", "space", "booting", "recovering", "usb", "scanning", "transferring", "qc")
+MODEL_PHASES = {"scanning": "scan", "transferring": "transfer"}   # row phase -> durations.py phase
+
+
+# -------- Log capture (print() from run_scan lands here instead of the terminal) --------
+class LogWriter:
+    def __init__(self, log_path):
+        self.lines = collections.deque(maxlen=LOG_LINES)
+        self.partial = ""
+        self.lock = threading.Lock()
+        self.file = open(log_path, "a")
+
+    def write(self, text):
+        with self.lock:
+            self.partial += text
+            *done, self.partial = self.partial.split("\n")
+            stamp = datetime.now().strftime("%H:%M:%S")
+            for line in done:
+                if line.strip():
+                    self.lines.append(f"{stamp} {line}")
+                    self.file.write(f"{datetime.now():%Y-%m-%d} {stamp} {line}\n")
+            self.file.flush()
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def tail(self, n):
+        with self.lock:
+            return list(self.lines)[-n:] if n > 0 else []
+
+
+# -------- Per-scanner state --------
+class ScannerRow:
+    def __init__(self, num, color):
+        self.num = num
+        self.color = color
+        self.phase = "idle"
+        self.qr = None
+        self.profile = None
+        self.job_id = 0
+        self.phase_started = time.time()
+        self.idle_since = time.time()
+        self.last_progress = time.time()
+        self.bytes = 0
+        self.total = 0
+        self.outcome = None      # last finished job's outcome
+        self.qc_status = None
+        self.remote_path = None
+        self.job = None          # run_scan's job dict, once it is journaled
+
+    def update(self, phase, **info):
+        now = time.time()
+        if phase != self.phase:
+            self.phase = phase
+            self.phase_started = self.last_progress = now
+            self.bytes = 0
+        if "total" in info:
+            self.total = info["total"]
+        if "remote_path" in info:
+            self.remote_path = info["remote_path"]
+        if "job" in info:
+            self.job = info["job"]
+        if info.get("bytes", self.bytes) != self.bytes:
+            self.bytes = info["bytes"]
+            self.last_progress = now
+        if phase in ("done", "failed"):
+            self.outcome = info.get("outcome")
+            self.qc_status = info.get("qc_status")
+
+    def rate(self):
+        elapsed = time.time() - self.phase_started
+        return self.bytes / elapsed if elapsed > 0 and self.bytes else 0.0
+
+    def eta(self):
+        """Seconds left in the current phase: from the byte rate, else from the scanner's history."""
+        if self.phase not in MODEL_PHASES:
+            return None
+        rate = self.rate()
+        if rate and self.total:
+            return max(0.0, (self.total - self.bytes) / rate)
+        return bc.DURATIONS.eta(self.color, self.profile, MODEL_PHASES[self.phase], time.time() - self.phase_started)
+
+    def health(self):
+        if self.phase in MODEL_PHASES and time.time() - self.last_progress > STALL_SECONDS:
+            return "STALLED", "bad"
+        if self.phase in MODEL_PHASES and bc.DURATIONS.is_slow(
+            self.color, self.profile, MODEL_PHASES[self.phase], time.time() - self.phase_started
+        ):
+            return f"SLOW {MODEL_PHASES[self.phase]}", "warn"
+        if self.phase == "space":
+            return "waiting for disk", "warn"
+        if self.phase == "waiting":
+            return "other console's batch", "warn"
+        if self.outcome and self.outcome != "ok":
+            return self.outcome, "bad"
+        if self.qc_status and self.qc_status != "ok":
+            return f"QC {self.qc_status}", "warn"
+        return ("ok", "good") if self.outcome == "ok" else ("", "good")
+
+
+def fmt_duration(seconds):
+    if seconds is None:
+        return ""
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+# -------- Dispatcher --------
+class Fleet:
+    def __init__(self, default_profile=None):
+        self.rows = {num: ScannerRow(num, s["color"]) for num, s in bc.SCANNERS.items()}
+        self.by_color = {r.color: r for r in self.rows.values()}
+        self.default_profile = default_profile
+        self.lock = threading.Lock()
+        self.batch_lock = threading.Lock()
+        self.batch_jobs = 0      # jobs holding the batch lock
+        self.lock_fh = None
+        self.free_gb = None      # staging space left for new jobs, None = unknown
+
+    def busy(self):
+        return any(r.phase in ACTIVE_PHASES for r in self.rows.values())
+
+    def idle_rows(self):
+        """Idle scanners, longest idle first."""
+        return sorted((r for r in self.rows.values() if r.phase not in ACTIVE_PHASES), key=lambda r: r.idle_since)
+
+    def next_free(self):
+        idle = self.idle_rows()
+        return idle[0] if idle else None
+
+    # ---- input ----
+    def submit(self, line):
+        """Parse one prompt line and start its jobs; problems are printed to the log."""
+        force = line.startswith("!")
+        raw = line.lstrip("!").strip()
+        try:
+            qr_codes, colors, typed_profiles = bc.parse_scanned_input(raw, list(self.by_color), True)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if not qr_codes:
+            print("Error: No valid QR codes found.")
+            return
+        colors = colors or [None] * len(qr_codes)
+
+        manifest = profiles.load_manifest()
+        try:
+            bc.SCANNED.refresh()
+        except Exception as e:
+            print(f"Warning: could not check the scan catalog for repeats: {e}")
+
+        with self.lock:
+            pending = {r.qr for r in self.rows.values() if r.phase in ACTIVE_PHASES}
+            for color, qr, typed in zip(colors, qr_codes, typed_profiles):
+                if not bc.validate_qr_string(qr):
+                    print(f"Error: {qr} has bad format (unclosed braces). Please rescan carefully.")
+                    continue
+                if qr in pending:
+                    print(f"Error: {qr} is already being scanned.")
+                    continue
+                reason = bc.SCANNED.check(qr)
+                if reason and not force:
+                    print(f"Warning: {qr} {reason}. Enter it again starting with ! to rescan anyway.")
+                    continue
+                profile_name = typed or manifest.get(qr) or self.default_profile
+                try:
+                    profiles.get(bc.PROFILES, profile_name)
+                except profiles.ProfileError as e:
+                    print(f"Error: {e}")
+                    continue
+                row = self.by_color[color] if color else self.next_free()
+                if row is None:
+                    print(f"Error: no scanner is free for {qr}; wait for one to finish.")
+                    continue
+                if row.phase in ACTIVE_PHASES:
+                    print(f"Error: {row.color} is still busy ({row.phase}).")
+                    continue
+                pending.add(qr)
+                self.start(row, qr, profile_name)
+
+    def start(self, row, qr, profile_name):
+        """Mark the row busy now (so the next entry picks another scanner) and run the job."""
+        row.job_id += 1
+        row.qr, row.profile = qr, profiles.get(bc.PROFILES, profile_name)["name"]
+        row.outcome = row.qc_status = row.remote_path = row.job = None
+        row.update("starting")
+        print(f"[Scanner {row.color}] {qr}" + (f" ({profile_name})" if profile_name else ""))
+        threading.Thread(target=self.run_job, args=(row, row.job_id, qr, profile_name), daemon=True).start()
+
+    def run_job(self, row, job_id, qr, profile_name):
+        def progress(phase, **info):
+            row.update(phase, **info)
+            if phase == "scanning" and "ssh_base" in info and bc.SCANNERS[row.num]["scan_backend"] != "sane":
+                # scanimage reports nothing: watch the file grow (the sane backend's PROGRESS lines come via run_scan)
+                threading.Thread(
+                    target=self.poll_remote_size, args=(row, job_id, info["ssh_base"], info["remote_path"]), daemon=True
+                ).start()
+
+        bc.claim_jobs([(row.num, qr, profile_name)])
+        self.join_batch(row)
+        local_path = None
+        try:
+            local_path = bc.run_scan(row.num, qr, profile_name, progress=progress)
+        except Exception as e:
+            print(f"[Scanner {row.color}] Error during scan for {qr}: {e}")
+            row.update("failed", outcome="error")
+        finally:
+            bc.SPACE.release(row.num)
+            bc.release_jobs([(row.num, qr, profile_name)])
+            if row.remote_path:
+                # Per-job cleanup instead of cleaner.sh after a batch (other VMs may be mid-scan)
+                watchdog.cleanup(topology.ssh_cmd(bc.TOPO, bc.SCANNERS[row.num], f"rm -f '{row.remote_path}'"))
+            if row.phase in ACTIVE_PHASES:
+                row.update("failed", outcome=row.outcome or "error")
+            row.idle_since = time.time()
+            self.leave_batch()
+        bc.ALERTS.clear()   # already in the log
+        bc.report_drift({row.color})
+        if local_path:
+            bc.start_previews([local_path])
+
+    def watch_space(self):
+        """Keep free_gb current off the screen loop: available() reads the catalog, which may be busy."""
+        while True:
+            try:
+                self.free_gb = max(bc.SPACE.available(), 0) / 1e9
+            except (OSError, sqlite3.Error):
+                self.free_gb = None
+            time.sleep(SPACE_POLL)
+
+    # ---- batch lock ----
+    def join_batch(self, row):
+        """The first job on an idle fleet takes the batch lock (after batchconsole.py's batch, if one runs)."""
+        with self.batch_lock:
+            if self.batch_jobs == 0:
+                row.update("waiting")
+                self.lock_fh = bc.acquire_batch_lock()
+            self.batch_jobs += 1
+
+    def leave_batch(self):
+        """The last running job releases the batch lock."""
+        with self.batch_lock:
+            self.batch_jobs -= 1
+            if self.batch_jobs == 0:
+                bc.release_batch_lock(self.lock_fh)
+                self.lock_fh = None
+
+    # ---- Ctrl-C ----
+    def interrupt(self):
+        """Stop every running job at once; each is recorded as interrupted and needs a rescan."""
+        threads = [threading.Thread(target=self.interrupt_job, args=(r,))
+                   for r in self.rows.values() if r.phase in ACTIVE_PHASES]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def interrupt_job(self, row):
+        print(f"[Scanner {row.color}] Interrupted, stopping {row.qr}.")
+        if row.job is not None:
+            bc.record_job(row.job, "interrupted")   # first, so the job's own thread can't record a failure
+        if row.remote_path:
+            watchdog.kill_remote(topology.ssh_cmd(bc.TOPO, bc.SCANNERS[row.num]), remote_path=row.remote_path)
+        bc.SPACE.release(row.num)
+        bc.release_jobs([(row.num, row.qr, row.profile)])
+        row.update("failed", outcome="interrupted")
+
+    def poll_remote_size(self, row, job_id, ssh_base, remote_path):
+        """Bytes written so far on the VM, for the scanning phase's MB/s and ETA."""
+        while row.job_id == job_id and row.phase == "scanning":
+            try:
+                result = subprocess.run(
+                    ssh_base + [f"stat -c %s '{remote_path}' 2>/dev/null"],
+                    capture_output=True, text=True, timeout=15,
+                )
+                size = result.stdout.strip()
+                if size.isdigit() and row.job_id == job_id and row.phase == "scanning":
+                    row.update("scanning", bytes=int(size))
+            except subprocess.TimeoutExpired:
+                pass
+            time.sleep(SIZE_POLL)
+
+
+# -------- Screen --------
+COLUMNS = f"{'#':>3}  {'Scanner':<9} {'Phase':<13} {'Time':>6}  {'QR':<34} {'MB':>13} {'MB/s':>6} {'ETA':>6}  Health"
+
+
+def draw(stdscr, fleet, log, prompt, colors):
+    stdscr.erase()
+    height, width = stdscr.getmaxyx()
+
+    def put(y, x, text, attr=0):
+        if 0 <= y < height and x < width:
+            stdscr.addnstr(y, x, text, max(0, width - x - 1), attr)
+
+    free = f"{fleet.free_gb:.0f}" if fleet.free_gb is not None else "?"
+    active = sum(1 for r in fleet.rows.values() if r.phase in ACTIVE_PHASES)
+    nxt = fleet.next_free()
+    put(0, 0, f"SeedScan  {active}/{len(fleet.rows)} scanning  "
+              f"staging {free} GB free  {datetime.now():%H:%M:%S}", curses.A_BOLD)
+    put(0, width // 2, f"Load next sample on: {nxt.color.upper()}" if nxt else "All scanners busy",
+        colors.get("good" if nxt else "warn", 0))
+    put(1, 0, COLUMNS, curses.A_UNDERLINE)
+
+    y = 2
+    for row in sorted(fleet.rows.values(), key=lambda r: r.num):
+        health, level = row.health()
+        busy = row.phase in ACTIVE_PHASES
+        qr = (row.qr or "")[:34] if busy or row.outcome else ""
+        mb = f"{row.bytes / 1e6:.0f}/{row.total / 1e6:.0f}" if busy and row.total else ""
+        rate = f"{row.rate() / 1e6:.1f}" if busy and row.rate() else ""
+        elapsed = fmt_duration(time.time() - row.phase_started) if busy else ""
+        line = f"{row.num:>3}  {row.color:<9} {row.phase:<13} {elapsed:>6}  {qr:<34} {mb:>13} {rate:>6} {fmt_duration(row.eta()):>6}  "
+        put(y, 0, line, curses.A_BOLD if busy else 0)
+        put(y, len(line), health, colors.get(level, 0))
+        y += 1
+
+    y += 1
+    log_rows = height - y - 2
+    for line in log.tail(log_rows):
+        put(y, 0, line)
+        y += 1
+
+    put(height - 1, 0, "> " + prompt)
+    stdscr.move(height - 1, min(width - 1, 2 + len(prompt)))
+    stdscr.refresh()
+
+
+def confirm(stdscr, question):
+    """Ask on the prompt line; True for y (or a second Ctrl-C)."""
+    height, width = stdscr.getmaxyx()
+    stdscr.move(height - 1, 0)
+    stdscr.clrtoeol()
+    stdscr.addnstr(height - 1, 0, question, max(0, width - 1), curses.A_BOLD)
+    stdscr.timeout(-1)
+    try:
+        key = stdscr.getch()
+    except KeyboardInterrupt:
+        key = ord("y")
+    finally:
+        stdscr.timeout(int(REFRESH * 1000))
+    return key in (ord("y"), ord("Y"))
+
+
+def run(stdscr, fleet, log):
+    curses.curs_set(1)
+    stdscr.timeout(int(REFRESH * 1000))
+    colors = {}
+    if curses.has_colors():
+        curses.use_default_colors()
+        for i, (level, fg) in enumerate((("good", curses.COLOR_GREEN), ("warn", curses.COLOR_YELLOW), ("bad", curses.COLOR_RED)), start=1):
+            curses.init_pair(i, fg, -1)
+            colors[level] = curses.color_pair(i) | curses.A_BOLD
+
+    prompt = ""
+    while True:
+        try:
+            # Drain typed keys (a barcode scanner types a whole QR at once) before redrawing
+            while True:
+                key = stdscr.getch()
+                if key == -1:
+                    break
+                if key in (10, 13, curses.KEY_ENTER):
+                    line, prompt = prompt.strip(), ""
+                    if line.lower() in ("quit", "exit"):
+                        if not fleet.busy():
+                            return
+                        print("Scanners are still busy; wait for them to finish before quitting.")
+                    elif line:
+                        fleet.submit(line)
+                    break
+                if key in (curses.KEY_BACKSPACE, 127, 8):
+                    prompt = prompt[:-1]
+                elif 32 <= key < 127:
+                    prompt += chr(key)
+                    if chr(key) in " '":
+                        # A color has been typed: warm that scanner up while its QR comes in
+                        m = re.match(r"\s*!?\s*([A-Za-z]+)", prompt)
+                        row = next((r for c, r in fleet.by_color.items() if m and c.upper() == m.group(1).upper()), None)
+                        if row is not None and row.phase not in ACTIVE_PHASES:
+                            bc.PREARM.arm(row.num)
+                    if key == ord("'") and PAIR_ENTRY.fullmatch(prompt):
+                        # Closing quote of a complete entry: start it without waiting for Enter
+                        line, prompt = prompt.strip(), ""
+                        fleet.submit(line)
+            draw(stdscr, fleet, log, prompt, colors)
+        except KeyboardInterrupt:
+            if not fleet.busy():
+                return
+            if confirm(stdscr, "Scans are running. Stop them and quit (they will need a rescan)? [y/N] "):
+                print("Interrupted: stopping the running scans...")
+                draw(stdscr, fleet, log, "", colors)
+                fleet.interrupt()
+                return
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    default_profile = None
+    if "--profile" in argv:
+        i = argv.index("--profile")
+        default_profile = argv[i + 1] if i + 1 < len(argv) else ""
+        try:
+            profiles.get(bc.PROFILES, default_profile)
+        except profiles.ProfileError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    fleet = Fleet(default_profile)
+    threading.Thread(target=fleet.watch_space, daemon=True).start()
+    log = LogWriter(bc.DEST_DIR / "console.log")
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = log
+    try:
+        # Jobs interrupted by a crash of the last session (shown in the log pane)
+        print("Checking the job journal for interrupted scans...", file=stdout, flush=True)
+        bc.resume_interrupted()
+        curses.wrapper(run, fleet, log)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        if fleet.lock_fh is not None:
+            bc.release_batch_lock(fleet.lock_fh)
+        log.file.close()
+    if fleet.busy():
+        print("Left with scans still running; their files stay on the VMs until cleaner.sh runs.")
+    print(f"Session log: {bc.DEST_DIR / 'console.log'}")
+
+
+if __name__ == "__main__":
+    main()
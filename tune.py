@@ -0,0 +1,210 @@
+# Per-scanner transfer tuning. Sweeps scanimage's --buffer-size (or the read
+# buffer of the in-process SANE backend) on each scanner, times the scans and
+# keeps the fastest setting in tuning.json next to this script (override with
+# SEEDSCAN_TUNING). batchconsole.py passes the stored value to scan.py as
+# SCAN_BUFFER_SIZE; scanners without an entry, or tuned with another
+# scan_backend than the one they use now, keep the backend default.
+#
+# Only the buffer size is swept, on purpose: it is the one transfer setting
+# both backends take (scanimage --buffer-size, sanebackend's read buffer).
+# The V39's other SANE options change the scan itself (resolution, depth,
+# region), which the profiles already fix, so they are not tuned here.
+#
+# Every candidate is scanned --repeats times, in rounds over all candidates so
+# lamp warm-up and drift don't favour whichever size runs last. By default the
+# sweep scans a full-width strip (TUNE_STRIP_MM tall) with the console's
+# default profile; --full-bed times real full-bed scans instead.
+#
+# Usage:
+#   python3 tune.py [COLOR ...] [--profile NAME] [--repeats N] [--sizes 64,128,...] [--full-bed]
+#   python3 tune.py show
+
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import profiles
+import topology
+import watchdog
+
+TUNING_PATH = Path(os.environ.get("SEEDSCAN_TUNING", Path(__file__).resolve().with_name("tuning.json")))
+
+BUFFER_SIZES_KB = [32, 64, 128, 256, 512, 1024]
+DEFAULT_REPEATS = 2
+TUNE_STRIP_MM = 60.0    # ~100 MB at 1200 dpi Color, long enough for a steady transfer rate
+MIN_GAIN = 0.03         # a buffer size must beat the backend default by 3% to be stored
+
+STATS_RE = re.compile(r"SCAN_STATS bytes=(\d+) seconds=([\d.]+)")
+
+
+# -------- Stored settings --------
+def load(path: Path = None) -> dict:
+    """{scanner_color: {"buffer_size": KB or None, ...}}; empty if never tuned."""
+    path = Path(path or TUNING_PATH)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_scanner(color: str, settings: dict, path: Path = None):
+    path = Path(path or TUNING_PATH)
+    tuning = load(path)
+    tuning[color] = settings
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(tuning, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def scan_env(color: str, backend: str, tuning: dict = None) -> str:
+    """
+    Environment assignment for scan.py with this scanner's tuned buffer size
+    ("" if untuned, or tuned for another backend than `backend`).
+    """
+    tuning = load() if tuning is None else tuning
+    settings = tuning.get(color) or {}
+    if settings.get("backend", backend) != backend:
+        return ""
+    buffer_kb = settings.get("buffer_size")
+    return f"SCAN_BUFFER_SIZE={buffer_kb}" if buffer_kb else ""
+
+
+# -------- Sweep --------
+def run_trial(topo, scanner, profile, region, buffer_kb):
+    """
+    One timed scan on the VM; {"bytes", "seconds", "rate"} from scan.py's
+    SCAN_STATS line. Same deadlines as a job (watchdog.py), so a hung trial
+    is killed instead of stalling the sweep.
+    """
+    remote_path = "/output/tune.tiff"
+    limits = watchdog.deadlines(profile, region)
+    env = " ".join(filter(None, [
+        f"OUTPUT_FILE='{remote_path}'",
+        f"SCAN_BACKEND={scanner['scan_backend']}",
+        profiles.scan_env(profile, region),
+        f"SCAN_BUFFER_SIZE={buffer_kb}" if buffer_kb else "",
+        f"SCAN_DISCOVERY_TIMEOUT={limits['discovery']:.0f} SCAN_TIMEOUT={limits['scan']:.0f}",
+        "SCAN_STATS=1",
+    ]))
+    ssh_base = topology.ssh_cmd(topo, scanner)
+    proc = subprocess.Popen(
+        ssh_base + [f"{env} python3 ~/scan.py; rc=$?; rm -f '{remote_path}'; exit $rc"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    backstop = limits["discovery"] + limits["scan"] + watchdog.BACKSTOP
+    with watchdog.Deadline(backstop, lambda: watchdog.kill_remote(ssh_base, proc, remote_path)) as deadline:
+        stdout, _ = proc.communicate()
+    if deadline.expired:
+        raise RuntimeError(f"no result within {backstop:.0f}s, remote scan killed")
+    match = STATS_RE.search(stdout)
+    if proc.returncode != 0 or not match:
+        said = "\n".join(l for l in stdout.splitlines() if not l.startswith("PROGRESS"))
+        raise RuntimeError(f"scan failed (exit {proc.returncode}): {said.strip()[-200:]}")
+    nbytes, seconds = int(match.group(1)), float(match.group(2))
+    return {"bytes": nbytes, "seconds": seconds, "rate": nbytes / seconds if seconds > 0 else 0.0}
+
+
+def tune_scanner(topo, scanner, profile, region, sizes, repeats):
+    """Sweep buffer sizes on one scanner; returns the settings to store."""
+    color = scanner["color"]
+    candidates = [None] + sizes  # None = backend default, the baseline
+    rates = {kb: [] for kb in candidates}
+
+    for round_num in range(1, repeats + 1):
+        for kb in candidates:
+            label = f"{kb} KB" if kb else "default"
+            try:
+                trial = run_trial(topo, scanner, profile, region, kb)
+            except RuntimeError as e:
+                print(f"[Scanner {color}] round {round_num} {label:>8}: {e}")
+                continue
+            rates[kb].append(trial["rate"])
+            print(f"[Scanner {color}] round {round_num} {label:>8}: {trial['seconds']:6.1f}s  {trial['rate'] / 1e6:6.2f} MB/s")
+
+    medians = {kb: statistics.median(r) for kb, r in rates.items() if r}
+    if not medians:
+        raise RuntimeError("every trial failed")
+    best = max(medians, key=medians.get)
+    baseline = medians.get(None)
+    if best is not None and baseline and medians[best] < baseline * (1 + MIN_GAIN):
+        best = None  # not worth moving off the default
+
+    return {
+        "buffer_size": best,
+        "bytes_per_s": round(medians[best]),
+        "profile": profile["name"],
+        "backend": scanner["scan_backend"],
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "trials": {str(kb or "default"): [round(r) for r in rates[kb]] for kb in candidates},
+    }
+
+
+def show():
+    tuning = load()
+    if not tuning:
+        print(f"No scanners tuned yet ({TUNING_PATH})")
+        return
+    for color, t in sorted(tuning.items()):
+        size = f"{t['buffer_size']} KB" if t.get("buffer_size") else "default"
+        print(f"  {color:<10} {size:>8}  {t.get('bytes_per_s', 0) / 1e6:6.2f} MB/s  "
+              f"({t.get('backend', '?')}, {t.get('profile', '?')}, {t.get('tuned_at', '?')})")
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["show"]:
+        show()
+        return
+
+    opts = {"--profile": None, "--repeats": DEFAULT_REPEATS, "--sizes": None}
+    for flag in opts:
+        if flag in args:
+            i = args.index(flag)
+            opts[flag] = args[i + 1]
+            del args[i:i + 2]
+    full_bed = "--full-bed" in args
+    if full_bed:
+        args.remove("--full-bed")
+
+    try:
+        topo = topology.load()
+        profile = profiles.get(profiles.load(), opts["--profile"])
+        sizes = [int(v) for v in opts["--sizes"].split(",")] if opts["--sizes"] else BUFFER_SIZES_KB
+        repeats = int(opts["--repeats"])
+    except (ValueError, topology.TopologyError, profiles.ProfileError) as e:
+        print(f"Error: {e}")
+        print("Usage: python3 tune.py [COLOR ...] [--profile NAME] [--repeats N] [--sizes 64,128,...] [--full-bed] | show")
+        sys.exit(1)
+
+    by_color = {s["color"].upper(): s for s in topo["scanners"]}
+    unknown = [c for c in args if c.upper() not in by_color]
+    if unknown:
+        print(f"Error: unknown scanner color(s) {', '.join(unknown)}")
+        sys.exit(1)
+    targets = [by_color[c.upper()] for c in args] if args else topo["scanners"]
+    region = None if full_bed else {"left": 0, "top": 0, "width": profiles.PLATEN_WIDTH_MM, "height": TUNE_STRIP_MM}
+
+    # One scanner at a time, so the timings aren't skewed by a shared USB controller
+    for scanner in targets:
+        print(f"[Scanner {scanner['color']}] Tuning buffer size with {profile['name']} ({'full bed' if full_bed else f'{TUNE_STRIP_MM:.0f} mm strip'})...")
+        try:
+            settings = tune_scanner(topo, scanner, profile, region, sizes, repeats)
+        except RuntimeError as e:
+            print(f"[Scanner {scanner['color']}] Tuning failed: {e}")
+            continue
+        save_scanner(scanner["color"], settings)
+        size = f"{settings['buffer_size']} KB" if settings["buffer_size"] else "the backend default"
+        print(f"[Scanner {scanner['color']}] Best: {size} at {settings['bytes_per_s'] / 1e6:.2f} MB/s -> {TUNING_PATH}")
+
+    show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# Scanner <-> VM USB mapping without debug.sh's paper-and-virt-manager
+# procedure. Each scanner in topology.json is pinned to something about its
+# V39 that survives replugging and reboots: "usb_port" (the physical port
+# path, e.g. "1-2.3", same as for USB bus grouping) and/or "usb_serial". The
+# bus/device numbers a libvirt <hostdev> needs change whenever a scanner
+# re-enumerates, so this looks the pinned scanners up in lsusb and rewrites
+# each VM's hostdev with virsh (detach-device/attach-device, --config and,
+# for a running VM, --live).
+#
+#   show      the V39s on every host: port, serial, bus:device, VM using it
+#   learn     pin every scanner to the V39 its VM has now (run while it all works)
+#   identify  test scan each V39 on the host and ask which color lit up (VMs off)
+#   plan      what apply would change
+#   apply     make every VM's hostdev point at its pinned scanner
+#
+# All of it comes from `lsusb`, `lsusb -t`, `lsusb -v` and `virsh` (run over
+# ssh for hosts that are not this PC), so fake versions of those commands on
+# PATH are enough to try it without scanners.
+#
+# Usage:
+#   python3 usbmap.py show | learn | identify | plan | apply [--dry-run]
+
+import json
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+import topology
+
+V39_VENDOR = "04b8"
+V39_PRODUCT = "013d"
+COMMAND_TIMEOUT = 30
+
+
+class MapError(RuntimeError):
+    pass
+
+
+# -------- Commands (locally or on the scanner's host) --------
+def host_argv(topo: dict, host: str, argv):
+    """argv as run on `host`: as is on this PC, through ssh for the others."""
+    h = topo["hosts"][host]
+    address = h.get("address", "")
+    if address in topology.LOCAL_ADDRESSES:
+        return list(argv)
+    dest = f"{h['user']}@{address}" if h.get("user") else address
+    return ["ssh"] + topology.SSH_OPTIONS + [dest, " ".join(shlex.quote(a) for a in argv)]
+
+
+def run(argv, check: bool = True) -> str:
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=COMMAND_TIMEOUT)
+    except FileNotFoundError:
+        raise MapError(f"{argv[0]} not found")
+    except subprocess.TimeoutExpired:
+        raise MapError(f"{' '.join(argv)} timed out")
+    if check and result.returncode != 0:
+        raise MapError(f"{' '.join(argv)} failed: {result.stderr.strip() or result.stdout.strip()}")
+    return result.stdout
+
+
+def virsh(topo: dict, scanner: dict, *args, check: bool = True) -> str:
+    return run(["virsh", "-c", topology.libvirt_uri(topo, scanner)] + list(args), check)
+
+
+# -------- lsusb --------
+def parse_lsusb(text: str):
+    """[(bus, device)] of the V39s in plain `lsusb` output."""
+    found = []
+    for line in text.splitlines():
+        m = re.match(r"Bus (\d+) Device (\d+): ID ([0-9a-f]{4}):([0-9a-f]{4})", line.strip())
+        if m and (m.group(3), m.group(4)) == (V39_VENDOR, V39_PRODUCT):
+            found.append((int(m.group(1)), int(m.group(2))))
+    return found
+
+
+def parse_lsusb_tree(text: str) -> dict:
+    """{(bus, device): port path like "1-2.3"} from `lsusb -t`."""
+    ports = {}
+    bus = None
+    chain = []   # (indent, port) of the hubs above the current line
+    for line in text.splitlines():
+        m = re.match(r"/:\s+Bus (\d+)\.Port \d+: Dev (\d+)", line)
+        if m:
+            bus, chain = int(m.group(1)), []
+            continue
+        m = re.match(r"(\s*)\|__ Port (\d+): Dev (\d+)", line)
+        if not m or bus is None:
+            continue
+        indent, port, dev = len(m.group(1)), int(m.group(2)), int(m.group(3))
+        chain = [c for c in chain if c[0] < indent] + [(indent, port)]
+        # interfaces of one device repeat the line; the first one wins
+        ports.setdefault((bus, dev), f"{bus}-" + ".".join(str(p) for _, p in chain))
+    return ports
+
+
+def parse_serial(text: str):
+    """iSerial from `lsusb -v` of one device, None if it has none."""
+    m = re.search(r"iSerial\s+\d+\s+(\S+)", text)
+    return m.group(1) if m else None
+
+
+def host_devices(topo: dict, host: str):
+    """[{"bus", "device", "port", "serial"}] for every V39 plugged into `host`."""
+    tree = parse_lsusb_tree(run(host_argv(topo, host, ["lsusb", "-t"])))
+    devices = []
+    for bus, dev in parse_lsusb(run(host_argv(topo, host, ["lsusb"]))):
+        verbose = run(host_argv(topo, host, ["lsusb", "-v", "-s", f"{bus}:{dev}"]), check=False)
+        devices.append({"bus": bus, "device": dev, "port": tree.get((bus, dev)), "serial": parse_serial(verbose)})
+    return devices
+
+
+# -------- libvirt hostdevs --------
+def vm_hostdevs(topo: dict, scanner: dict):
+    """[(bus, device, <hostdev> XML)] of the V39s passed through to the scanner's VM."""
+    root = ET.fromstring(virsh(topo, scanner, "dumpxml", "--inactive", scanner["vm"]))
+    found = []
+    for hd in root.iter("hostdev"):
+        if hd.get("type") != "usb":
+            continue
+        vendor, product, address = hd.find("source/vendor"), hd.find("source/product"), hd.find("source/address")
+        if vendor is None or product is None or address is None:
+            continue
+        if (int(vendor.get("id"), 16), int(product.get("id"), 16)) != (int(V39_VENDOR, 16), int(V39_PRODUCT, 16)):
+            continue
+        found.append((int(address.get("bus")), int(address.get("device")), ET.tostring(hd, encoding="unicode")))
+    return found
+
+
+def hostdev_xml(bus: int, device: int) -> str:
+    return (
+        "<hostdev mode='subsystem' type='usb' managed='yes'>\n"
+        f"  <source>\n    <vendor id='0x{V39_VENDOR}'/>\n    <product id='0x{V39_PRODUCT}'/>\n"
+        f"    <address bus='{bus}' device='{device}'/>\n  </source>\n"
+        "</hostdev>\n"
+    )
+
+
+def is_running(topo: dict, scanner: dict) -> bool:
+    return virsh(topo, scanner, "domstate", scanner["vm"], check=False).strip() == "running"
+
+
+def find_device(devices, scanner: dict):
+    """The host V39 a scanner is pinned to (serial first, then port), or None."""
+    for key, field in (("usb_serial", "serial"), ("usb_port", "port")):
+        if scanner.get(key):
+            matches = [d for d in devices if d[field] == scanner[key]]
+            if len(matches) == 1:   # some V39s share a serial, the port decides then
+                return matches[0]
+    return None
+
+
+# -------- Plan / apply --------
+def plan(topo: dict):
+    """
+    One entry per scanner: {"scanner", "current": [(bus, dev, xml)], "target":
+    device dict or None, "change": bool, "problem": str or None}.
+    """
+    devices = {host: host_devices(topo, host) for host in {s["host"] for s in topo["scanners"]}}
+    steps = []
+    for s in topo["scanners"]:
+        step = {"scanner": s, "current": vm_hostdevs(topo, s), "target": None, "change": False, "problem": None}
+        if not s.get("usb_port") and not s.get("usb_serial"):
+            step["problem"] = "not pinned (set usb_port/usb_serial, or run learn/identify)"
+        else:
+            step["target"] = find_device(devices[s["host"]], s)
+            if step["target"] is None:
+                step["problem"] = f"no V39 at port {s.get('usb_port') or '?'} / serial {s.get('usb_serial') or '?'} (unplugged or off?)"
+            else:
+                want = (step["target"]["bus"], step["target"]["device"])
+                step["change"] = [(b, d) for b, d, _ in step["current"]] != [want]
+        steps.append(step)
+    return steps
+
+
+def apply(topo: dict, steps, dry_run: bool = False):
+    """Detach every stale V39 hostdev first (two VMs may be swapping scanners), then attach the new ones."""
+    changes = [st for st in steps if st["change"]]
+    for phase in ("detach-device", "attach-device"):
+        for st in changes:
+            s = st["scanner"]
+            flags = ["--config"] + (["--live"] if is_running(topo, s) else [])
+            docs = [xml for _, _, xml in st["current"]] if phase == "detach-device" else [
+                hostdev_xml(st["target"]["bus"], st["target"]["device"])
+            ]
+            for doc in docs:
+                if dry_run:
+                    print(f"[{s['vm']}] would virsh {phase} {' '.join(flags)}:\n{doc}")
+                    continue
+                change_hostdev(topo, s, phase, doc, flags)
+    return changes
+
+
+def change_hostdev(topo: dict, scanner: dict, action: str, doc: str, flags):
+    """virsh attach-device/detach-device one <hostdev> on the scanner's VM."""
+    with tempfile.NamedTemporaryFile("w", suffix=".xml") as f:
+        f.write(doc)
+        f.flush()
+        virsh(topo, scanner, action, scanner["vm"], f.name, *flags)
+
+
+# -------- Pinning scanners in topology.json --------
+def save_pins(pins: dict):
+    """Write {color: {"usb_port": ..., "usb_serial": ...}} into topology.json, one line per scanner as before."""
+    with open(topology.TOPOLOGY_PATH) as f:
+        raw = json.load(f)
+    for s in raw["scanners"]:
+        for key, value in pins.get(s["color"], {}).items():
+            if value:
+                s[key] = value
+    with open(topology.TOPOLOGY_PATH, "w") as f:
+        f.write("{\n" + ",\n".join(f"  {json.dumps(k)}: {_layout(v)}" for k, v in raw.items()) + "\n}\n")
+
+
+def _layout(value) -> str:
+    """A topology.json section the way it is written by hand: one host/console/scanner per line."""
+    if isinstance(value, list) and value:
+        return "[\n" + ",\n".join(f"    {json.dumps(v)}" for v in value) + "\n  ]"
+    if isinstance(value, dict) and value and all(isinstance(v, dict) for v in value.values()):
+        return "{\n" + ",\n".join(f"    {json.dumps(k)}: {json.dumps(v)}" for k, v in value.items()) + "\n  }"
+    return json.dumps(value)
+
+
+def learn(topo: dict) -> dict:
+    """Pins from the hostdevs the VMs have now."""
+    devices = {host: host_devices(topo, host) for host in {s["host"] for s in topo["scanners"]}}
+    pins = {}
+    for s in topo["scanners"]:
+        current = vm_hostdevs(topo, s)
+        if len(current) != 1:
+            print(f"[{s['vm']}] has {len(current)} V39 hostdevs, skipped")
+            continue
+        bus, dev, _ = current[0]
+        d = next((d for d in devices[s["host"]] if (d["bus"], d["device"]) == (bus, dev)), None)
+        if d is None:
+            print(f"[{s['vm']}] its hostdev {bus:03d}:{dev:03d} is not plugged in, skipped")
+            continue
+        pins[s["color"]] = {"usb_port": d["port"], "usb_serial": d["serial"]}
+        print(f"[{s['vm']}] {s['color']}: port {d['port']}, serial {d['serial'] or '-'}")
+    return pins
+
+
+def identify(topo: dict) -> dict:
+    """Run a quick scan on each V39 from the host and ask the operator which scanner moved."""
+    pins = {}
+    colors = {s["color"].upper(): s for s in topo["scanners"]}
+    for host in sorted({s["host"] for s in topo["scanners"]}):
+        running = [s["vm"] for s in topology.scanners(topo, host=host) if is_running(topo, s)]
+        if running:
+            raise MapError(f"shut the VMs on {host} down first (closeVM.sh), they hold the scanners: {', '.join(running)}")
+        listing = run(host_argv(topo, host, ["scanimage", "-L"]))
+        for d in host_devices(topo, host):
+            name = next((m for m in re.findall(r"device `([^']+)'", listing) if f":{d['bus']:03d}:{d['device']:03d}" in m), None)
+            if name is None:
+                print(f"{host} port {d['port']}: scanimage does not list bus {d['bus']:03d} device {d['device']:03d}, skipped")
+                continue
+            print(f"{host}: test scan on the V39 at port {d['port']}...")
+            run(host_argv(topo, host, ["scanimage", "-d", name, "--resolution", "75", "--format=tiff", "-o", "/dev/null"]), check=False)
+            try:
+                answer = input("Which color scanner just moved (Enter to skip)? ").strip().upper()
+            except EOFError:
+                return pins
+            if answer in colors:
+                pins[colors[answer]["color"]] = {"usb_port": d["port"], "usb_serial": d["serial"]}
+    return pins
+
+
+def show(topo: dict):
+    for host in sorted({s["host"] for s in topo["scanners"]}):
+        owners = {}
+        for s in topology.scanners(topo, host=host):
+            for bus, dev, _ in vm_hostdevs(topo, s):
+                owners[(bus, dev)] = s["vm"]
+        print(f"{host}:")
+        for d in host_devices(topo, host):
+            pinned = next((s["color"] for s in topology.scanners(topo, host=host) if find_device([d], s)), "-")
+            print(f"  port {d['port'] or '?':<10} serial {d['serial'] or '-':<14} {d['bus']:03d}:{d['device']:03d}  "
+                  f"pinned to {pinned:<8} used by {owners.get((d['bus'], d['device']), '-')}")
+
+
+def main():
+    args = sys.argv[1:]
+    dry_run = "--dry-run" in args
+    if dry_run:
+        args.remove("--dry-run")
+    if len(args) != 1 or args[0] not in ("show", "learn", "identify", "plan", "apply"):
+        print("Usage: python3 usbmap.py show | learn | identify | plan | apply [--dry-run]")
+        sys.exit(1)
+
+    try:
+        topo = topology.load()
+        if args[0] == "show":
+            show(topo)
+        elif args[0] in ("learn", "identify"):
+            pins = learn(topo) if args[0] == "learn" else identify(topo)
+            if pins and not dry_run:
+                save_pins(pins)
+                print(f"Pinned {len(pins)} scanner(s) in {topology.TOPOLOGY_PATH}")
+        else:
+            steps = plan(topo)
+            for st in steps:
+                s = st["scanner"]
+                now = ", ".join(f"{b:03d}:{d:03d}" for b, d, _ in st["current"]) or "none"
+                if st["problem"]:
+                    print(f"[{s['vm']}] {s['color']}: {st['problem']} (now {now})")
+                elif st["change"]:
+                    t = st["target"]
+                    print(f"[{s['vm']}] {s['color']}: {now} -> {t['bus']:03d}:{t['device']:03d} (port {t['port']})")
+                else:
+                    print(f"[{s['vm']}] {s['color']}: ok ({now})")
+            if args[0] == "apply":
+                changed = apply(topo, steps, dry_run)
+                print(f"{'Would change' if dry_run else 'Changed'} {len(changed)} VM(s).")
+    except (MapError, topology.TopologyError, ET.ParseError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
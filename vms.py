@@ -0,0 +1,203 @@
+# Lazy scanner VMs (opt-in): instead of launch.sh booting every VM
+# (startVM.sh) each session whether or not its scanner is used, the consoles
+# boot a scanner's VM the first time a job or pre-arm targets its color, keep
+# it up while it is in use and shut it down after it has been idle for a
+# while. Every boot is recorded in the catalog (vm_starts) with the time until
+# ssh answered, so the cost of starting lazily shows up in `python3 vms.py`.
+#
+# Settings, in the "vms" section of topology.json:
+#   "vms": {"lazy": true, "idle_shutdown": 1800}
+# lazy = false (the default): launch.sh boots every VM up front as before and
+# nothing is shut down before closeVM.sh. idle_shutdown = seconds unused
+# before a VM is shut down, 0 = keep it up until the session ends.
+#
+# Usage:
+#   python3 vms.py          # state of every VM and its readiness latency so far
+#   python3 vms.py ips      # ip, ssh jump host of the running VMs (cleaner.sh)
+
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import catalog
+import recovery
+import topology
+import usbmap
+
+IDLE_POLL = 30   # seconds between idle checks
+
+
+def boot(topo: dict, scanner: dict, trigger: str = "job") -> bool:
+    """Start the scanner's VM and wait for ssh; records the readiness latency. True once it answers."""
+    started_at = time.time()
+    try:
+        usbmap.virsh(topo, scanner, "start", scanner["vm"], check=False)   # already running is fine
+        ok = recovery.wait_ssh(topo, scanner)
+    except usbmap.MapError:
+        ok = False
+    seconds = time.time() - started_at
+    try:
+        catalog.record_vm_start(scanner, trigger, started_at, seconds, ok)
+    except Exception as e:
+        print(f"[Scanner {scanner['color']}] Warning: could not record the VM start in the catalog: {e}")
+    return ok
+
+
+class VmKeeper:
+    """
+    Boots scanner VMs on first use and shuts them down once idle. Jobs (and
+    pre-arms, recoveries) hold their VM with in_use() for as long as they
+    need it, and call ensure() before anything remote. Does nothing when
+    the topology's "lazy" is off.
+    """
+
+    def __init__(self, topo, log=print):
+        self.topo = topo
+        self.settings = topo["vms"]
+        self.log = log
+        self.lock = threading.Lock()
+        self.vm_locks = {s["vm"]: threading.Lock() for s in topo["scanners"]}
+        self.ready = set()     # VMs known to answer ssh
+        self.users = {}        # vm -> jobs/arms/recoveries holding it
+        self.last_used = {}    # vm -> when the last one let go
+        self.watcher = None
+
+    def ensure(self, scanner, report=None, trigger="job") -> bool:
+        """Boot the scanner's VM unless it is already up; False if it did not come up."""
+        if not self.settings["lazy"]:
+            return True
+        vm = scanner["vm"]
+        with self.vm_locks[vm]:   # one boot per VM, everyone else waits for it
+            if vm in self.ready:
+                try:
+                    running = usbmap.is_running(self.topo, scanner)
+                except usbmap.MapError:
+                    running = True   # can't tell: let the job find out
+                if running:
+                    return True
+                self.log(f"[Scanner {scanner['color']}] {vm} is no longer running.")
+                self.ready.discard(vm)
+            try:
+                up = usbmap.is_running(self.topo, scanner) and recovery.reachable(self.topo, scanner)
+            except usbmap.MapError:
+                up = False
+            if up:
+                self.ready.add(vm)
+                return True
+            if report:
+                report("booting")
+            self.log(f"[Scanner {scanner['color']}] Starting its VM {vm}...")
+            start = time.time()
+            if not boot(self.topo, scanner, trigger):
+                return False
+            self.log(f"[Scanner {scanner['color']}] {vm} ready in {time.time() - start:.0f}s.")
+            self.ready.add(vm)
+        self._watch()
+        return True
+
+    def forget(self, scanner):
+        """The VM may be down (e.g. a recovery restart failed): check it again on the next ensure()."""
+        self.ready.discard(scanner["vm"])
+
+    @contextmanager
+    def in_use(self, scanner):
+        vm = scanner["vm"]
+        with self.lock:
+            self.users[vm] = self.users.get(vm, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.users[vm] -= 1
+                self.last_used[vm] = time.time()
+
+    def _watch(self):
+        with self.lock:
+            if self.watcher is not None or not self.settings["idle_shutdown"]:
+                return
+            self.watcher = threading.Thread(target=self._idle_loop, daemon=True)
+        self.watcher.start()
+
+    def _idle_loop(self):
+        while True:
+            time.sleep(IDLE_POLL)
+            self.shutdown_idle()
+
+    def shutdown_idle(self):
+        """Shut down every VM this keeper started or found that nobody has used for idle_shutdown seconds."""
+        limit = self.settings["idle_shutdown"]
+        for scanner in self.topo["scanners"]:
+            vm = scanner["vm"]
+            if vm not in self.ready or not self.vm_locks[vm].acquire(blocking=False):
+                continue
+            try:
+                with self.lock:
+                    idle = self.users.get(vm, 0) == 0 and time.time() - self.last_used.get(vm, time.time()) > limit
+                    if idle:
+                        self.ready.discard(vm)
+                if idle:
+                    self.log(f"[Scanner {scanner['color']}] Idle for {limit / 60:.0f} min, shutting down {vm}.")
+                    recovery.shut_down(self.topo, scanner)
+            except usbmap.MapError as e:
+                self.log(f"[Scanner {scanner['color']}] Could not shut down {vm}: {e}")
+            finally:
+                self.vm_locks[vm].release()
+
+
+def latency(conn=None):
+    """{vm: (boots, failures, median seconds to ready, last seconds)} from the catalog."""
+    own = conn is None
+    conn = conn or catalog.connect()
+    try:
+        rows = conn.execute("SELECT vm, ready_seconds, ok FROM vm_starts ORDER BY id").fetchall()
+    finally:
+        if own:
+            conn.close()
+    result = {}
+    for vm in {r["vm"] for r in rows}:
+        mine = [r for r in rows if r["vm"] == vm]
+        good = [r["ready_seconds"] for r in mine if r["ok"]]
+        result[vm] = (len(mine), len(mine) - len(good), statistics.median(good) if good else None, mine[-1]["ready_seconds"])
+    return result
+
+
+def main():
+    args = sys.argv[1:]
+    if args not in ([], ["ips"]):
+        print("Usage: python3 vms.py [ips]")
+        sys.exit(1)
+    try:
+        topo = topology.load()
+    except topology.TopologyError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args == ["ips"]:
+        for s in topo["scanners"]:
+            try:
+                running = usbmap.is_running(topo, s)
+            except usbmap.MapError:
+                running = True   # can't tell: let cleaner.sh try it
+            if running:
+                print(f"{s['ip']}\t{topology.jump_host(topo, s)}")
+        return
+
+    mode = "lazy" if topo["vms"]["lazy"] else "all started by launch.sh"
+    idle = topo["vms"]["idle_shutdown"]
+    print(f"VMs: {mode}, idle shutdown {f'after {idle / 60:.0f} min' if idle else 'off'}")
+    stats = latency()
+    print(f"{'Scanner':<10} {'VM':<20} {'state':<10} {'boots':>5} {'failed':>6} {'median ready':>12} {'last':>6}")
+    for s in topo["scanners"]:
+        try:
+            state = usbmap.virsh(topo, s, "domstate", s["vm"], check=False).strip() or "?"
+        except usbmap.MapError:
+            state = "?"
+        boots, failed, median, last = stats.get(s["vm"], (0, 0, None, None))
+        print(f"{s['color']:<10} {s['vm']:<20} {state:<10} {boots:>5} {failed:>6} "
+              f"{f'{median:.0f}s' if median is not None else '-':>12} {f'{last:.0f}s' if last is not None else '-':>6}")
+
+
+if __name__ == "__main__":
+    main()
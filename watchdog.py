@@ -0,0 +1,153 @@
+# Deadlines for every remote phase of a job, so one wedged scanner (a hung
+# scanimage, a VM that stopped answering, a stalled ssh) is killed and its
+# locks, USB bus slot and disk reservation are released instead of holding
+# the batch lock for the whole fleet.
+#
+# Phases and where their deadline is enforced:
+#   discovery  scan.py on the VM: pkill/lsusb/scanimage -L/usbreset
+#   scan       scan.py kills its own scanimage after SCAN_TIMEOUT; the console
+#              kills the remote process tree BACKSTOP seconds later in case
+#              the VM could not (batchconsole.run_scan)
+#   transfer   receive.fetch kills the ssh cat
+#   cleanup    per-job rm on the VM (tui.py), every ssh in cleaner.sh
+#
+# Scan and transfer deadlines come from the job's profile: HISTORY_MARGIN
+# times the scanner's median from the catalog (durations.py) once it has
+# history, otherwise the profile's expected size at a rate no healthy V39 or
+# link is slower than.
+#
+# Usage:
+#   python3 watchdog.py [--profile NAME] [COLOR...]   # deadlines per scanner
+
+import subprocess
+import sys
+import threading
+
+import durations
+import profiles
+import topology
+
+DISCOVERY_TIMEOUT = 60      # seconds for everything in scan.py before the scan itself
+CLEANUP_TIMEOUT = 60        # seconds per cleanup command
+KILL_TIMEOUT = 20           # seconds for the ssh that kills a wedged scan
+KILL_GRACE = 3              # seconds between SIGTERM and SIGKILL on the VM
+BACKSTOP = 30               # seconds the console gives scan.py to time itself out first
+HISTORY_MARGIN = 3          # deadline = 3x the scanner's median once it has history
+MIN_PHASE = 60              # no scan/transfer deadline shorter than this
+MIN_SCAN_RATE = 0.4e6       # B/s, well below a V39 at 1200 dpi color over USB 2
+MIN_TRANSFER_RATE = 2e6     # B/s, well below the VM -> console link
+
+
+def deadlines(profile: dict, region: dict = None, color: str = None, model=None) -> dict:
+    """Seconds allowed per phase for one job ({"discovery", "scan", "transfer", "cleanup"})."""
+    expected = profiles.expected_size(profile, region)
+
+    def phase(name, rate):
+        med = model.expected(color, profile["name"], name) if model is not None else None
+        if med is not None:
+            return max(MIN_PHASE, HISTORY_MARGIN * med)
+        return max(MIN_PHASE, expected / rate)
+
+    return {
+        "discovery": DISCOVERY_TIMEOUT,
+        "scan": phase("scan", MIN_SCAN_RATE),
+        "transfer": phase("transfer", MIN_TRANSFER_RATE),
+        "cleanup": CLEANUP_TIMEOUT,
+    }
+
+
+class Deadline:
+    """
+    Calls on_expire() from a timer thread if the with-block is still running
+    after `seconds` (None or 0 = no deadline); `expired` tells the block
+    afterwards whether that happened.
+    """
+
+    def __init__(self, seconds, on_expire):
+        self.seconds = seconds
+        self.on_expire = on_expire
+        self.expired = False
+        self.timer = None
+
+    def _fire(self):
+        self.expired = True
+        self.on_expire()
+
+    def __enter__(self):
+        if self.seconds:
+            self.timer = threading.Timer(self.seconds, self._fire)
+            self.timer.daemon = True
+            self.timer.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timer:
+            self.timer.cancel()
+        return False
+
+
+def stop(proc, grace: float = 5):
+    """Terminate a local process, SIGKILL it if it does not exit within `grace`."""
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(grace)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def kill_remote(ssh_base, scan_proc=None, remote_path: str = None) -> bool:
+    """
+    Kill scan.py and its scanimage on the VM (SIGTERM, then SIGKILL), drop the
+    partial file and stop the local ssh running the scan. False if the VM
+    could not be reached within KILL_TIMEOUT.
+    """
+    # [s]can.py keeps pkill from matching this shell's own command line
+    cmd = (f"pkill -f '[s]can.py'; pkill -f '[s]canimage'; sleep {KILL_GRACE}; "
+           f"pkill -9 -f '[s]can.py'; pkill -9 -f '[s]canimage'")
+    if remote_path:
+        cmd += f"; rm -f '{remote_path}'"
+    reached = cleanup(ssh_base + [cmd], KILL_TIMEOUT + KILL_GRACE)
+    if scan_proc is not None:
+        stop(scan_proc)
+    return reached
+
+
+def cleanup(cmd, timeout: float = CLEANUP_TIMEOUT) -> bool:
+    """Best-effort command with a deadline; True if it ran to completion."""
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        return False
+
+
+def main():
+    args = sys.argv[1:]
+    profile_name = None
+    if "--profile" in args:
+        i = args.index("--profile")
+        profile_name = args[i + 1] if i + 1 < len(args) else ""
+        del args[i:i + 2]
+
+    try:
+        profile = profiles.get(profiles.load(), profile_name)
+    except profiles.ProfileError as e:
+        print(f"Error: {e}")
+        print("Usage: python3 watchdog.py [--profile NAME] [COLOR...]")
+        sys.exit(1)
+    model = durations.DurationModel().refresh()
+    scanners = [s for s in topology.load()["scanners"] if not args or s["color"].upper() in {a.upper() for a in args}]
+    print(f"Deadlines for {profile['name']} (seconds):")
+    print(f"{'Scanner':<10} {'discovery':>9} {'scan':>7} {'transfer':>8} {'cleanup':>7}  basis")
+    for s in scanners:
+        region = profiles.resolve_region(profile, s["color"])
+        d = deadlines(profile, region, s["color"], model)
+        basis = "history" if model.expected(s["color"], profile["name"], "scan") is not None else "expected size"
+        print(f"{s['color']:<10} {d['discovery']:>9.0f} {d['scan']:>7.0f} {d['transfer']:>8.0f} {d['cleanup']:>7.0f}  {basis}")
+
+
+if __name__ == "__main__":
+    main()